@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='analysisrequest',
+            index=models.Index(fields=['created_at'], name='analysis_an_created_e979f9_idx'),
+        ),
+    ]
@@ -24,5 +24,10 @@ class AnalysisRequest(models.Model):
     completed_at = models.DateTimeField(blank=True, null=True)
     error_message = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
     def __str__(self):
         return f"{self.type} for Job {self.transcription_job.id} ({self.status})"
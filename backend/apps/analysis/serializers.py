@@ -1,10 +1,11 @@
 from rest_framework import serializers
 from .models import AnalysisRequest
+from apps.transcription.mixins import SparseFieldsSerializerMixin
 
-class AnalysisRequestSerializer(serializers.ModelSerializer):
+class AnalysisRequestSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = AnalysisRequest
-        fields = '__all__'
+        fields = ('id', 'transcription_job', 'type', 'user_prompt', 'system_prompt', 'result_text', 'status', 'created_at', 'completed_at', 'error_message')
         read_only_fields = ('id', 'result_text', 'status', 'created_at', 'completed_at', 'error_message')
 
 class AnalysisSubmissionSerializer(serializers.Serializer):
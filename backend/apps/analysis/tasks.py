@@ -2,6 +2,7 @@ from celery import shared_task
 from django.utils import timezone
 from .models import AnalysisRequest
 from .services import LLMService
+from apps.transcription.events import publish_analysis
 import traceback
 
 @shared_task
@@ -13,6 +14,7 @@ def run_analysis(request_id):
 
     analysis_request.status = AnalysisRequest.Status.PROCESSING
     analysis_request.save()
+    publish_analysis(analysis_request)
 
     try:
         # Initialize service
@@ -48,6 +50,7 @@ def run_analysis(request_id):
         analysis_request.result_text = result
         analysis_request.completed_at = timezone.now()
         analysis_request.save()
+        publish_analysis(analysis_request)
         
         return f"AnalysisRequest {request_id} completed successfully."
 
@@ -55,4 +58,5 @@ def run_analysis(request_id):
         analysis_request.status = AnalysisRequest.Status.FAILED
         analysis_request.error_message = str(e) + "\n" + traceback.format_exc()
         analysis_request.save()
+        publish_analysis(analysis_request)
         return f"AnalysisRequest {request_id} failed: {str(e)}"
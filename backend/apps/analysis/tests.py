@@ -1,3 +1,57 @@
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from apps.media.models import File
+from apps.transcription.models import TranscriptionJob
+from apps.users.models import User
+from .models import AnalysisRequest
+import shutil
+import tempfile
 
-# Create your tests here.
+
+class AnalysisListTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.requests = [self.create_request(self.user) for _ in range(3)]
+        self.other_request = self.create_request(User.objects.create_user('bob', password='pw'))
+
+    def create_request(self, owner):
+        file_obj = File(name='talk.wav', owner=owner)
+        file_obj.file.save('talk.wav', ContentFile(b'data'))
+        job = TranscriptionJob.objects.create(file=file_obj, submitted_by=owner)
+        return AnalysisRequest.objects.create(transcription_job=job, system_prompt='prompt', result_text='long result')
+
+    def test_list_leaves_out_large_text(self):
+        response = self.client.get('/api/analysis/requests/')
+        results = response.json()['results']
+        self.assertEqual([row['id'] for row in results], [request.pk for request in reversed(self.requests)])
+        self.assertNotIn('result_text', results[0])
+        self.assertNotIn('system_prompt', results[0])
+        # Still available on the detail
+        detail = self.client.get(f'/api/analysis/requests/{self.requests[0].pk}/').json()
+        self.assertEqual(detail['result_text'], 'long result')
+
+    def test_sparse_fields(self):
+        results = self.client.get('/api/analysis/requests/?fields=id,status').json()['results']
+        self.assertEqual(set(results[0]), {'id', 'status'})
+        self.assertEqual(self.client.get('/api/analysis/requests/?fields=id,unknown').status_code, 400)
+
+    def test_batch_status_lookup(self):
+        AnalysisRequest.objects.filter(pk=self.requests[1].pk).update(status=AnalysisRequest.Status.COMPLETED)
+        ids = f"{self.requests[1].pk},{self.requests[2].pk},{self.other_request.pk}"
+        response = self.client.get(f'/api/analysis/requests/?ids={ids}')
+        self.assertEqual(
+            sorted(response.json(), key=lambda row: row['id']),
+            [
+                {'id': self.requests[1].pk, 'status': AnalysisRequest.Status.COMPLETED},
+                {'id': self.requests[2].pk, 'status': AnalysisRequest.Status.PENDING},
+            ],
+        )
+        self.assertEqual(self.client.get('/api/analysis/requests/?ids=1,a').status_code, 400)
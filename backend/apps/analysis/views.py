@@ -5,19 +5,24 @@ from .models import AnalysisRequest
 from .serializers import AnalysisRequestSerializer, AnalysisSubmissionSerializer
 from .tasks import run_analysis
 from apps.transcription.models import TranscriptionJob
+from apps.transcription.mixins import SparseFieldsViewMixin
+from apps.media.pagination import KeysetPagination
 
-class AnalysisRequestViewSet(mixins.CreateModelMixin,
+class AnalysisRequestViewSet(SparseFieldsViewMixin,
+                             mixins.CreateModelMixin,
                              mixins.RetrieveModelMixin,
                              mixins.ListModelMixin,
                              viewsets.GenericViewSet):
     queryset = AnalysisRequest.objects.all()
     serializer_class = AnalysisRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    list_exclude = ('system_prompt', 'result_text')
 
     def get_queryset(self):
         # Filter by user's access to the underlying transcription/file
         user = self.request.user
-        return AnalysisRequest.objects.filter(transcription_job__file__owner=user)
+        return self.sparse_queryset(AnalysisRequest.objects.filter(transcription_job__file__owner=user))
 
     def create(self, request, *args, **kwargs):
         serializer = AnalysisSubmissionSerializer(data=request.data)
@@ -0,0 +1,173 @@
+from contextlib import contextmanager
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from .models import Blob, blob_upload_to
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+def hash_path(path, block_size=1024 * 1024):
+    """
+    Hashes a local file in one sequential pass, with read-ahead requested
+    from the kernel where supported.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def uploaded_sha256(upload):
+    """
+    The SHA-256 of an uploaded file, computed while it was received by the
+    hashing upload handlers. Other uploads are hashed here.
+    """
+    sha256 = getattr(upload, 'sha256', None)
+    if sha256:
+        return sha256
+    digest = hashlib.sha256()
+    for block in upload.chunks():
+        digest.update(block)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def copy_into_place(path, target):
+    """
+    Copies `path` next to `target` and renames it into place, so the target
+    never exists half-written.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.', suffix='.part')
+    os.close(fd)
+    try:
+        shutil.copyfile(path, temp_path)
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def move_into_storage(path, name, storage=default_storage):
+    """
+    Moves the local file `path` into `storage` under `name` (or a free
+    variant of it) and returns the name used. On a local storage this is a
+    hard link and an unlink, no data is copied unless `path` is on another
+    file system.
+    """
+    try:
+        target = storage.path(name)
+    except NotImplementedError:
+        with open(path, 'rb') as f:
+            name = storage.save(name, f)
+        os.unlink(path)
+        return name
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    name = storage.get_available_name(name)
+    target = storage.path(name)
+    while True:
+        # Unlike a rename, link never replaces a file stored meanwhile under the same name
+        try:
+            os.link(path, target)
+            break
+        except FileExistsError:
+            name = storage.get_available_name(name)
+            target = storage.path(name)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Staging and media on different volumes. The name is free and
+            # the blob row is locked, nothing else stores under it meanwhile
+            copy_into_place(path, target)
+            break
+    os.unlink(path)
+    return name
+
+
+def acquire_blob(sha256, size, store):
+    """
+    Returns the Blob of `sha256` with one more reference. The content is only
+    stored when no File references it yet: `store(name)` must then store it
+    under `name` and return the name used. The blob row is locked meanwhile,
+    so a concurrent release cannot delete the content in between.
+
+    Call it outside of a transaction: the stored content and its row commit
+    together, and a rollback after storing would leave the content behind
+    unreferenced. Attach the blob within `new_reference`.
+    """
+    with transaction.atomic():
+        blob, _ = Blob.objects.select_for_update().get_or_create(sha256=sha256, defaults={'size': size})
+        if not blob.file:
+            blob.file.name = store(blob_upload_to(blob, None))
+            blob.size = size
+        blob.ref_count += 1
+        blob.save()
+    return blob
+
+
+def acquire_upload(upload):
+    """
+    Blob for a file uploaded in a request. A file Django spooled to disk is
+    moved into place, an identical blob just gains a reference.
+    """
+    return acquire_blob(
+        uploaded_sha256(upload), upload.size,
+        lambda name: default_storage.save(name, upload),
+    )
+
+
+def acquire_path(path, sha256=None):
+    """
+    Blob for a local file, which is moved into storage or deleted if the
+    content is already stored.
+    """
+    sha256 = sha256 or hash_path(path)
+    blob = acquire_blob(sha256, os.path.getsize(path), lambda name: move_into_storage(path, name))
+    if os.path.exists(path):
+        os.unlink(path)
+    return blob
+
+
+@contextmanager
+def new_reference(blob):
+    """
+    Wraps the transaction attaching a blob just acquired to a File, and
+    releases the reference if it fails.
+    """
+    try:
+        yield blob
+    except BaseException:
+        release_blob(blob.pk)
+        raise
+
+
+def attach_blob(file_obj, blob):
+    file_obj.blob = blob
+    file_obj.file.name = blob.file.name
+    file_obj.size = blob.size
+    file_obj.content_hash = blob.sha256
+
+
+def release_blob(blob_id):
+    """
+    Drops one reference; the content goes once the transaction commits if
+    nothing references it anymore.
+    """
+    Blob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    transaction.on_commit(lambda: reclaim_blob(blob_id))
+
+
+def reclaim_blob(blob_id):
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=blob_id, ref_count=0).first()
+        if blob and blob.file:
+            blob.file.delete(save=False)
+            blob.save(update_fields=['file'])
@@ -0,0 +1,154 @@
+from django.db import transaction
+from django.db.models import F
+from .models import ChunkedUpload, UploadSession
+from .uploads import staging_path
+import ctypes
+import ctypes.util
+import os
+
+
+class SHA256_CTX(ctypes.Structure):
+    # OpenSSL's SHA256state_st
+    _fields_ = [
+        ('h', ctypes.c_uint32 * 8),
+        ('Nl', ctypes.c_uint32),
+        ('Nh', ctypes.c_uint32),
+        ('data', ctypes.c_uint32 * 16),
+        ('num', ctypes.c_uint),
+        ('md_len', ctypes.c_uint),
+    ]
+
+
+def load_libcrypto():
+    for name in (ctypes.util.find_library('crypto'), 'libcrypto.so.3', 'libcrypto.so.1.1', 'libcrypto.dylib'):
+        if not name:
+            continue
+        try:
+            lib = ctypes.CDLL(name)
+            functions = (lib.SHA256_Init, lib.SHA256_Update, lib.SHA256_Final)
+        except (OSError, AttributeError):
+            continue
+        for function in functions:
+            function.restype = ctypes.c_int
+        lib.SHA256_Init.argtypes = [ctypes.POINTER(SHA256_CTX)]
+        lib.SHA256_Update.argtypes = [ctypes.POINTER(SHA256_CTX), ctypes.c_char_p, ctypes.c_size_t]
+        lib.SHA256_Final.argtypes = [ctypes.c_char_p, ctypes.POINTER(SHA256_CTX)]
+        return lib
+    return None
+
+
+libcrypto = load_libcrypto()
+
+
+class ResumableSHA256:
+    """
+    SHA-256 whose state can be saved as bytes and resumed later, in another
+    process, which hashlib does not allow. Uses OpenSSL's SHA256 functions;
+    `available()` is False when libcrypto cannot be loaded.
+    """
+    def __init__(self, state=None):
+        if state is None:
+            self.ctx = SHA256_CTX()
+            libcrypto.SHA256_Init(ctypes.byref(self.ctx))
+        elif len(state) != ctypes.sizeof(SHA256_CTX):
+            raise ValueError("Not a saved SHA-256 state")
+        else:
+            self.ctx = SHA256_CTX.from_buffer_copy(state)
+
+    @staticmethod
+    def available():
+        return libcrypto is not None
+
+    def update(self, data):
+        libcrypto.SHA256_Update(ctypes.byref(self.ctx), bytes(data), len(data))
+
+    def state(self):
+        return bytes(self.ctx)
+
+    def hexdigest(self):
+        ctx = SHA256_CTX.from_buffer_copy(self.ctx)
+        digest = ctypes.create_string_buffer(32)
+        libcrypto.SHA256_Final(digest, ctypes.byref(ctx))
+        return digest.raw.hex()
+
+
+def contiguous_end(chunks, start):
+    """
+    Returns where the data received from `start` stops, `chunks` being the
+    (offset, size) pairs sorted by offset.
+    """
+    end = start
+    for offset, size in chunks:
+        if offset > end:
+            break
+        end = max(end, offset + size)
+    return end
+
+
+def advance_upload_hash(session_id, wait=False, block_size=1024 * 1024):
+    """
+    Hashes the received data that follows the part of the upload already
+    hashed, up to the first missing chunk, and saves the SHA-256 state on the
+    session. Chunks are just written, so this reads from the page cache and
+    the whole upload is hashed once while it arrives. Returns the session.
+
+    Runs with the session row locked. Without `wait` a request that finds it
+    locked returns at once: the hash is advanced by the holder or by the
+    next chunk, and the finalization hashes whatever is left.
+    """
+    if not ResumableSHA256.available():
+        return None
+    with transaction.atomic():
+        session = (
+            UploadSession.objects.select_for_update(skip_locked=not wait)
+            .only('upload_id', 'hashed_size', 'hash_state')
+            .filter(pk=session_id).first()
+        )
+        if session is None or session.hashed_size is None:
+            return session
+        chunks = (
+            ChunkedUpload.objects.filter(upload_id=session.upload_id)
+            .alias(end=F('offset') + F('size')).filter(end__gt=session.hashed_size)
+            .order_by('offset').values_list('offset', 'size')
+        )
+        end = contiguous_end(chunks, session.hashed_size)
+        if end == session.hashed_size:
+            return session
+        digest = ResumableSHA256(session.hash_state and bytes(session.hash_state))
+        with open(staging_path(session.upload_id), 'rb') as f:
+            position = session.hashed_size
+            while position < end:
+                data = os.pread(f.fileno(), min(block_size, end - position), position)
+                if not data:
+                    break
+                digest.update(data)
+                position += len(data)
+        session.hashed_size = position
+        session.hash_state = digest.state()
+        UploadSession.objects.filter(pk=session_id).update(hashed_size=position, hash_state=session.hash_state)
+    return session
+
+
+def rewind_upload_hash(session_id, offset):
+    """
+    Forgets the chunk at `offset` before its bytes are overwritten. If they
+    were already hashed the saved state is dropped and the finalization hashes
+    the whole file instead.
+    """
+    with transaction.atomic():
+        # Waits for a hash being advanced, which may be reading these bytes
+        session = UploadSession.objects.select_for_update().only('upload_id', 'hashed_size').get(pk=session_id)
+        ChunkedUpload.objects.filter(upload_id=session.upload_id, offset=offset).delete()
+        if session.hashed_size is not None and session.hashed_size > offset:
+            UploadSession.objects.filter(pk=session_id).update(hashed_size=None, hash_state=None)
+
+
+def upload_sha256(session_id, size):
+    """
+    The SHA-256 of a complete upload of `size` bytes from its saved state,
+    hashing what the chunk requests left. None if no state could be kept.
+    """
+    session = advance_upload_hash(session_id, wait=True)
+    if session is None or session.hashed_size != size:
+        return None
+    return ResumableSHA256(bytes(session.hash_state)).hexdigest()
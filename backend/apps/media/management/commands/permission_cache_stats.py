@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.media import permission_cache
+import json
+import redis
+
+
+class Command(BaseCommand):
+    help = "Prints the hit rate of the Redis permission cache as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after printing them")
+
+    def handle(self, *args, **options):
+        try:
+            stats = permission_cache.stats()
+            if options['reset']:
+                permission_cache.reset_stats()
+        except redis.RedisError as e:
+            raise CommandError(f"Permission cache unavailable: {e}")
+        self.stdout.write(json.dumps(stats, indent=2))
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+def build_paths(apps, schema_editor):
+    # Top-down, one level at a time, so every parent path is known first
+    Folder = apps.get_model('media', 'Folder')
+    paths = {}
+    level = list(Folder.objects.filter(parent__isnull=True).values_list('pk', flat=True))
+    for pk in level:
+        paths[pk] = f"/{pk}/"
+    while level:
+        children = list(Folder.objects.filter(parent_id__in=level).values_list('pk', 'parent_id'))
+        for pk, parent_id in children:
+            paths[pk] = f"{paths[parent_id]}{pk}/"
+        level = [pk for pk, _ in children]
+    for pk, path in paths.items():
+        Folder.objects.filter(pk=pk).update(path=path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0003_file_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Ids of the ancestors and the folder itself, from the root, e.g. /1/5/9/', max_length=512),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
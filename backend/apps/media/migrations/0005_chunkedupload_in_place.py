@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0004_folder_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='chunkedupload',
+            unique_together={('upload_id', 'offset')},
+        ),
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0, help_text='Size of the chunk in bytes'),
+        ),
+        migrations.AlterField(
+            model_name='chunkedupload',
+            name='upload_id',
+            field=models.UUIDField(db_index=True),
+        ),
+        migrations.RemoveField(
+            model_name='chunkedupload',
+            name='file',
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0006_uploadsession'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='checksum',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 of the chunk', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='chunk_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='total_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
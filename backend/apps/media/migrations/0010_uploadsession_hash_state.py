@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0009_file_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='hash_state',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='hashed_size',
+            field=models.PositiveBigIntegerField(default=0, editable=False, null=True),
+        ),
+    ]
@@ -1,15 +1,113 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Max
+from django.db.models.functions import Concat, Length, Substr
+from django.dispatch import Signal
 from django.conf import settings
+import hashlib
+
+# Sent after a folder got a new parent and the paths of its subtree were rewritten
+folder_moved = Signal()
 
 class Folder(models.Model):
     name = models.CharField(max_length=255)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subfolders')
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='owned_folders')
     created_at = models.DateTimeField(auto_now_add=True)
+    path = models.CharField(
+        max_length=512, blank=True, default='', db_index=True, editable=False,
+        help_text="Ids of the ancestors and the folder itself, from the root, e.g. /1/5/9/",
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored parent, so save() only rewrites paths after a move
+        if 'parent_id' in field_names:
+            instance._saved_parent_id = values[field_names.index('parent_id')]
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'parent' in fields or 'parent_id' in fields:
+            self._saved_parent_id = self.parent_id
+
+    def has_moved(self):
+        # Folders not loaded from the database have their path recomputed
+        return not hasattr(self, '_saved_parent_id') or self._saved_parent_id != self.parent_id
+
+    def ancestor_ids(self):
+        """
+        Returns the ids from the root down to this folder (included), read from `path`.
+        """
+        return [int(pk) for pk in self.path.strip('/').split('/') if pk]
+
+    def ancestor_paths(self):
+        """
+        Returns the paths from the root down to this folder (included).
+        """
+        paths = []
+        for pk in self.ancestor_ids():
+            paths.append(f"{paths[-1] if paths else '/'}{pk}/")
+        return paths
+
+    def is_in_subtree_of(self, folder):
+        return bool(folder.path) and self.path.startswith(folder.path)
+
+    def save(self, *args, **kwargs):
+        if self.path and not self.has_moved():
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic():
+            parent_path = '/'
+            if self.parent_id:
+                parent_path = Folder.objects.values_list('path', flat=True).get(pk=self.parent_id)
+            old_path = self.path
+            if old_path and parent_path.startswith(old_path):
+                raise ValueError("A folder cannot be moved into itself or one of its subfolders.")
+            super().save(*args, **kwargs)
+
+            path = f"{parent_path}{self.pk}/"
+            longest = len(path)
+            if old_path and old_path != path:
+                # Every path of the subtree changes by the same length
+                longest += (
+                    Folder.objects.filter(path__startswith=old_path).aggregate(longest=Max(Length('path')))['longest']
+                    - len(old_path)
+                )
+            if longest > Folder._meta.get_field('path').max_length:
+                raise ValueError("Folders cannot be nested this deeply.")
+            self.path = path
+            Folder.objects.filter(pk=self.pk).update(path=self.path)
+            if old_path and old_path != self.path:
+                # Moved: re-root the whole subtree in one statement
+                Folder.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(models.Value(self.path), Substr('path', len(old_path) + 1))
+                )
+                folder_moved.send(sender=Folder, folder=self, old_path=old_path)
+        self._saved_parent_id = self.parent_id
 
     def __str__(self):
         return self.name
 
+def blob_upload_to(instance, filename):
+    return f"blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}"
+
+class Blob(models.Model):
+    """
+    Stored media content, addressed by its SHA-256 and shared by every File
+    with that content. When the last File goes the content is deleted and
+    the row is kept with an empty `file`, ready to be stored again.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_upload_to, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.sha256} ({self.ref_count} references)"
+
 class File(models.Model):
     name = models.CharField(max_length=255)
     file = models.FileField(upload_to='uploads/%Y/%m/%d/')
@@ -17,6 +115,9 @@ class File(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='uploaded_files')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     size = models.PositiveBigIntegerField(help_text="Size in bytes")
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True, help_text="SHA-256 of the file content")
+    # Files stored before content addressing have no blob
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='files')
 
     class Meta:
         indexes = [
@@ -33,6 +134,19 @@ class File(models.Model):
             self.size = self.file.size
         super().save(*args, **kwargs)
 
+    def compute_content_hash(self, save=True):
+        """
+        Hashes the stored file in 1MB blocks and caches the result on the row.
+        """
+        digest = hashlib.sha256()
+        with self.file.open('rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        self.content_hash = digest.hexdigest()
+        if save:
+            File.objects.filter(pk=self.pk).update(content_hash=self.content_hash)
+        return self.content_hash
+
     def __str__(self):
         return self.name
 
@@ -49,13 +163,59 @@ class Permission(models.Model):
     def __str__(self):
         return f"{self.user.username} on {self.folder.name}"
 
-class ChunkedUpload(models.Model):
+class UploadSession(models.Model):
+    """
+    A chunked upload, created by its first chunk. `complete_upload` moves it to
+    FINALIZING and the `finalize_upload` task assembles the File.
+    """
+    class Status(models.TextChoices):
+        UPLOADING = 'UPLOADING', 'Uploading'
+        FINALIZING = 'FINALIZING', 'Finalizing'
+        COMPLETED = 'COMPLETED', 'Completed'
+        FAILED = 'FAILED', 'Failed'
+
     upload_id = models.UUIDField(unique=True)
-    file = models.FileField(upload_to='chunked_uploads/%Y/%m/%d/')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.UPLOADING)
+    filename = models.CharField(max_length=255, blank=True, default='')
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')
+    # Declared when the session is created through the uploads API, chunk i then
+    # covers [i * chunk_size, (i + 1) * chunk_size). Empty for sessions started by upload_chunk.
+    total_size = models.PositiveBigIntegerField(null=True, blank=True)
+    chunk_size = models.PositiveIntegerField(null=True, blank=True)
+    file = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    # SHA-256 of the received prefix, advanced as contiguous chunks land (see
+    # `hashing.advance_upload_hash`). Null once a hashed chunk was overwritten.
+    hashed_size = models.PositiveBigIntegerField(null=True, default=0, editable=False)
+    hash_state = models.BinaryField(null=True, blank=True, editable=False)
+    error_message = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def chunk_count(self):
+        if not self.total_size or not self.chunk_size:
+            return None
+        return -(-self.total_size // self.chunk_size)
+
+    def __str__(self):
+        return f"Upload {self.upload_id} ({self.status})"
+
+class ChunkedUpload(models.Model):
+    """
+    One received chunk. The data itself is written at its offset into the
+    upload's single staging file (see `uploads.write_chunk`).
+    """
+    upload_id = models.UUIDField(db_index=True)
     offset = models.PositiveBigIntegerField()
+    size = models.PositiveBigIntegerField(default=0, help_text="Size of the chunk in bytes")
+    checksum = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of the chunk")
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chunked_uploads')
     status = models.CharField(max_length=20, default='IN_PROGRESS') # IN_PROGRESS, COMPLETE
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        unique_together = ('upload_id', 'offset')
+
     def __str__(self):
         return f"Chunk {self.offset} for {self.upload_id}"
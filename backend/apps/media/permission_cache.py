@@ -0,0 +1,139 @@
+from django.conf import settings
+from django.db import transaction
+from .models import Permission
+import logging
+import redis
+
+logger = logging.getLogger(__name__)
+
+FLAGS = ('can_view', 'can_edit', 'can_upload')
+# Field present in every cached entry, so users without any permission are cached too
+LOADED = '*'
+STATS_KEY = 'perm:stats'
+
+_client = None
+
+
+def grants_key(user_id):
+    return f"perm:grants:{user_id}"
+
+
+def version_key(user_id):
+    return f"perm:version:{user_id}"
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.PERMISSION_CACHE_REDIS_URL, socket_connect_timeout=2, socket_timeout=2,
+        )
+    return _client
+
+
+def is_enabled():
+    return getattr(settings, 'PERMISSION_CACHE_TTL', 3600) > 0
+
+
+def encode(flags):
+    return ''.join('1' if flag else '0' for flag in flags)
+
+
+def load_grants(user_id):
+    """
+    Reads the user's permissions from the database as {folder path: flags}.
+    """
+    return {
+        path: encode(flags)
+        for path, *flags in Permission.objects.filter(user_id=user_id).values_list('folder__path', *FLAGS)
+    }
+
+
+def store_grants(client, user_id, version, grants):
+    # Only store what was loaded if no invalidation happened meanwhile: the
+    # version is read before loading and watched until the write.
+    key = grants_key(user_id)
+    with client.pipeline() as pipe:
+        try:
+            pipe.watch(version_key(user_id))
+            if pipe.get(version_key(user_id)) != version:
+                return
+            pipe.multi()
+            pipe.delete(key)
+            pipe.hset(key, mapping={LOADED: '1', **grants})
+            pipe.expire(key, getattr(settings, 'PERMISSION_CACHE_TTL', 3600))
+            pipe.execute()
+        except redis.WatchError:
+            pass
+
+
+def get_grants(user_id, paths):
+    """
+    Returns the user's permissions on the folders with the given paths, as
+    {path: flags} with one '0'/'1' per entry of FLAGS. The user's entry is
+    loaded from the database on a miss. Returns None if the cache is disabled
+    or Redis is unavailable, callers then query the database.
+    """
+    if not is_enabled():
+        return None
+    key = grants_key(user_id)
+    try:
+        client = get_redis()
+        with client.pipeline(transaction=False) as pipe:
+            pipe.hmget(key, [LOADED, *paths])
+            pipe.hincrby(STATS_KEY, 'lookups')
+            values, _ = pipe.execute()
+        if values[0] is not None:
+            return {path: value.decode() for path, value in zip(paths, values[1:]) if value is not None}
+
+        client.hincrby(STATS_KEY, 'misses')
+        version = client.get(version_key(user_id))
+        grants = load_grants(user_id)
+        store_grants(client, user_id, version, grants)
+        return {path: grants[path] for path in paths if path in grants}
+    except redis.RedisError as e:
+        logger.warning("Permission cache unavailable: %s", e)
+        return None
+
+
+def invalidate(user_ids):
+    """
+    Drops the cached permissions of the given users once the current
+    transaction commits.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids or not is_enabled():
+        return
+
+    def drop():
+        try:
+            with get_redis().pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    pipe.incr(version_key(user_id))
+                    pipe.delete(grants_key(user_id))
+                pipe.hincrby(STATS_KEY, 'invalidations', len(user_ids))
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("Could not invalidate cached permissions of users %s: %s", user_ids, e)
+
+    transaction.on_commit(drop)
+
+
+def stats():
+    """
+    Returns the lookup/hit/miss/invalidation counters, shared by all processes.
+    """
+    counters = {key.decode(): int(value) for key, value in get_redis().hgetall(STATS_KEY).items()}
+    lookups = counters.get('lookups', 0)
+    misses = counters.get('misses', 0)
+    return {
+        "lookups": lookups,
+        "hits": lookups - misses,
+        "misses": misses,
+        "hit_rate": round((lookups - misses) / lookups, 4) if lookups else None,
+        "invalidations": counters.get('invalidations', 0),
+    }
+
+
+def reset_stats():
+    get_redis().delete(STATS_KEY)
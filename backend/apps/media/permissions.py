@@ -1,5 +1,8 @@
 from rest_framework import permissions
-from .models import Permission
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.lookups import StartsWith
+from .models import Folder, File, Permission
+from . import permission_cache
 
 class IsFolderOwner(permissions.BasePermission):
     """
@@ -15,7 +18,9 @@ class IsFolderOwner(permissions.BasePermission):
 
 class HasFolderAccess(permissions.BasePermission):
     """
-    Checks if the user has access to the folder (or file's folder) recursively.
+    Checks if the user has access to the folder (or file's folder): they own
+    it, or have a permission on it or any of its ancestors. The ancestors come
+    from `Folder.path`, so this is at most one query.
     """
     def has_object_permission(self, request, view, obj):
         user = request.user
@@ -24,40 +29,120 @@ class HasFolderAccess(permissions.BasePermission):
 
         # Determine the folder to check
         folder = None
-        if hasattr(obj, 'folder'): # It's a File
+        if isinstance(obj, File):
             folder = obj.folder
-        elif hasattr(obj, 'parent'): # It's a Folder
+        elif isinstance(obj, Folder):
             folder = obj
-        
+
         if folder is None:
-            # Root folder or file without folder? 
-            # If it's a root folder, check if user is owner.
-            # If it's a file without folder (if allowed), check owner.
+            # A file without folder, only its owner has access
             if hasattr(obj, 'owner'):
-                return obj.owner == user
+                return obj.owner_id == user.pk
             return False
 
         # Check ownership first
-        if folder.owner == user:
+        if folder.owner_id == user.pk:
             return True
 
-        # Recursive check up the tree
-        current_folder = folder
-        while current_folder:
-            # Check if permission exists for this folder
-            try:
-                perm = Permission.objects.get(folder=current_folder, user=user)
-                if request.method in permissions.SAFE_METHODS:
-                    if perm.can_view:
-                        return True
-                else:
-                    # Write methods
-                    if perm.can_edit:
-                        return True
-                    # Special case for upload? Handled in view logic usually, but here for general edit
-            except Permission.DoesNotExist:
-                pass
-            
-            current_folder = current_folder.parent
-        
-        return False
+        return has_granted_access(user, folder, grant_flag(request.method not in permissions.SAFE_METHODS))
+
+
+def grant_flag(write):
+    # Write methods need can_edit, uploads are checked by the views with can_upload
+    return 'can_edit' if write else 'can_view'
+
+
+def has_granted_access(user, folder, flag='can_view'):
+    """
+    Whether `user` has a permission with `flag` (can_view, can_edit or
+    can_upload) on `folder` or one of its ancestors. Read from the permission
+    cache, or with one query when it is unavailable.
+    """
+    grants = permission_cache.get_grants(user.pk, folder.ancestor_paths())
+    if grants is not None:
+        index = permission_cache.FLAGS.index(flag)
+        return any(flags[index] == '1' for flags in grants.values())
+    return Permission.objects.filter(user=user, folder_id__in=folder.ancestor_ids(), **{flag: True}).exists()
+
+
+def granted_on(user, write=False):
+    """
+    An Exists() that is true when `user` has a permission on the folder of the
+    outer query or on one of its ancestors (the permission folder's path is a
+    prefix of the folder's path).
+    """
+    return Exists(
+        Permission.objects.filter(
+            StartsWith(OuterRef('path'), F('folder__path')),
+            user=user, **{grant_flag(write): True},
+        )
+    )
+
+
+def accessible_folders(user, write=False, queryset=None):
+    """
+    Filters `queryset` (all folders by default) to the folders `user` can
+    view (or edit), in SQL.
+    """
+    if queryset is None:
+        queryset = Folder.objects.all()
+    return queryset.filter(Q(owner=user) | Q(granted_on(user, write)))
+
+
+def accessible_files(user, write=False, queryset=None):
+    """
+    Filters `queryset` (all files by default) to the files `user` can view
+    (or edit), in SQL: their own files outside folders, and the files of
+    accessible folders. Both branches are lookups on the (owner, folder) and
+    (folder, uploaded_at) indexes, the folders come from a subquery.
+    """
+    if queryset is None:
+        queryset = File.objects.all()
+    return queryset.filter(
+        Q(folder__isnull=True, owner=user)
+        | Q(folder__in=accessible_folders(user, write).values('pk'))
+    )
+
+
+class FolderAccess:
+    """
+    Applies the HasFolderAccess rules to many folders of one user: the user's
+    permissions are loaded once, and the ancestors of a folder are read from
+    its path, so checking a folder needs no query once it is loaded.
+    """
+    def __init__(self, user, write=False):
+        self.user = user
+        self._grants = set(
+            Permission.objects.filter(user=user, **{grant_flag(write): True}).values_list('folder_id', flat=True)
+        )
+        self._folders = {}
+
+    def _load(self, queryset):
+        for pk, path, owner_id in queryset.values_list('pk', 'path', 'owner_id'):
+            self._folders[pk] = (path, owner_id)
+
+    def subtree(self, folder_id):
+        """
+        Returns the ids of `folder_id` and all folders below it.
+        """
+        self._load(Folder.objects.filter(pk=folder_id))
+        if folder_id not in self._folders:
+            return [folder_id]
+        path = self._folders[folder_id][0]
+        self._load(Folder.objects.filter(path__startswith=path).exclude(pk=folder_id))
+        return [pk for pk, (folder_path, _) in self._folders.items() if folder_path.startswith(path)]
+
+    def has_folder_access(self, folder_id):
+        if folder_id not in self._folders:
+            self._load(Folder.objects.filter(pk=folder_id))
+        if folder_id not in self._folders:
+            return False
+        path, owner_id = self._folders[folder_id]
+        if owner_id == self.user.pk:
+            return True
+        return any(int(pk) in self._grants for pk in path.strip('/').split('/') if pk)
+
+    def has_file_access(self, file_obj):
+        if file_obj.folder_id is None:
+            return file_obj.owner_id == self.user.pk
+        return self.has_folder_access(file_obj.folder_id)
@@ -1,5 +1,9 @@
 from rest_framework import serializers
-from .models import Folder, File, Permission, ChunkedUpload
+from django.db import transaction
+from .blobs import acquire_upload, attach_blob, new_reference, release_blob
+from .models import Folder, File, Permission, ChunkedUpload, UploadSession
+from .uploads import MAX_UPLOAD_SIZE, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE, MAX_CHUNK_COUNT, write_chunk
+import os
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -36,6 +40,47 @@ class FileSerializer(serializers.ModelSerializer):
         
         return value
 
+    def create(self, validated_data):
+        upload = validated_data.pop('file')
+        file_obj = File(**validated_data)
+        # Identical content is stored once, the File only references it
+        with new_reference(acquire_upload(upload)) as blob, transaction.atomic():
+            attach_blob(file_obj, blob)
+            file_obj.save()
+        return file_obj
+
+    def update(self, instance, validated_data):
+        upload = validated_data.pop('file', None)
+        if upload is None:
+            return super().update(instance, validated_data)
+        with new_reference(acquire_upload(upload)) as blob, transaction.atomic():
+            if instance.blob_id:
+                release_blob(instance.blob_id)
+            attach_blob(instance, blob)
+            return super().update(instance, validated_data)
+
+MEDIA_TYPE_EXTENSIONS = {
+    'audio': ('.mp3', '.wav', '.m4a', '.ogg'),
+    'video': ('.mp4', '.mov', '.webm'),
+}
+
+class FileListFilterSerializer(serializers.Serializer):
+    """
+    Query parameters of the file list.
+    """
+    folder = serializers.IntegerField(required=False)
+    recursive = serializers.BooleanField(default=False)
+    media_type = serializers.ChoiceField(choices=sorted(MEDIA_TYPE_EXTENSIONS), required=False)
+    uploaded_from = serializers.DateField(required=False)
+    uploaded_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if 'uploaded_from' in attrs and 'uploaded_to' in attrs and attrs['uploaded_from'] > attrs['uploaded_to']:
+            raise serializers.ValidationError("uploaded_from must not be after uploaded_to.")
+        if attrs['recursive'] and 'folder' not in attrs:
+            raise serializers.ValidationError("recursive requires a folder.")
+        return attrs
+
 class FolderSerializer(serializers.ModelSerializer):
     owner_username = serializers.CharField(source='owner.username', read_only=True)
     # We might want to list subfolders and files here, or in a separate view.
@@ -59,6 +104,18 @@ class FolderSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Invalid folder name")
         return value
 
+    def validate_parent(self, value):
+        if value is not None and self.instance is not None and value.is_in_subtree_of(self.instance):
+            raise serializers.ValidationError("A folder cannot be moved into itself or one of its subfolders.")
+        return value
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        except ValueError as e:
+            # Raised by Folder.save() when the paths of the tree would not fit
+            raise serializers.ValidationError({'parent': [str(e)]})
+
 class FolderDetailSerializer(FolderSerializer):
     subfolders = FolderSerializer(many=True, read_only=True)
     files = FileSerializer(many=True, read_only=True)
@@ -68,7 +125,55 @@ class FolderDetailSerializer(FolderSerializer):
         fields = FolderSerializer.Meta.fields + ('subfolders', 'files', 'permissions')
 
 class ChunkedUploadSerializer(serializers.ModelSerializer):
+    file = serializers.FileField(write_only=True)
+    total_size = serializers.IntegerField(write_only=True, required=False, min_value=1, max_value=MAX_UPLOAD_SIZE,
+                                          help_text="Size of the whole upload, preallocated on the first chunk")
+
     class Meta:
         model = ChunkedUpload
-        fields = ('id', 'upload_id', 'file', 'offset', 'user', 'status', 'created_at')
-        read_only_fields = ('id', 'user', 'created_at')
+        fields = ('id', 'upload_id', 'file', 'offset', 'size', 'total_size', 'user', 'status', 'created_at')
+        read_only_fields = ('id', 'size', 'user', 'status', 'created_at')
+        # Re-sent chunks overwrite the same bytes, the row is updated by the view
+        validators = []
+
+    def validate(self, attrs):
+        if attrs['offset'] + attrs['file'].size > attrs.get('total_size', MAX_UPLOAD_SIZE):
+            raise serializers.ValidationError(f"Chunk exceeds the upload size (limit is {MAX_UPLOAD_SIZE // (1024 * 1024)}MB).")
+        return attrs
+
+    def create(self, validated_data):
+        chunk = validated_data.pop('file')
+        write_chunk(validated_data['upload_id'], validated_data['offset'], chunk, validated_data.pop('total_size', None))
+        upload, _ = ChunkedUpload.objects.update_or_create(
+            upload_id=validated_data['upload_id'],
+            offset=validated_data['offset'],
+            defaults={'size': chunk.size, 'user': validated_data['user']},
+        )
+        return upload
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = (
+            'upload_id', 'status', 'filename', 'folder', 'total_size', 'chunk_size', 'chunk_count',
+            'file', 'error_message', 'created_at', 'updated_at',
+        )
+        read_only_fields = ('upload_id', 'status', 'file', 'error_message', 'created_at', 'updated_at')
+        extra_kwargs = {
+            'filename': {'required': True, 'allow_blank': False},
+            'total_size': {'required': True, 'allow_null': False, 'min_value': 1, 'max_value': MAX_UPLOAD_SIZE},
+            'chunk_size': {'required': True, 'allow_null': False, 'min_value': MIN_CHUNK_SIZE, 'max_value': MAX_CHUNK_SIZE},
+        }
+
+    def validate_filename(self, value):
+        extensions = [extension for group in MEDIA_TYPE_EXTENSIONS.values() for extension in group]
+        if os.path.splitext(value)[1].lower() not in extensions:
+            raise serializers.ValidationError(f"Unsupported file extension. Allowed: {', '.join(extensions)}")
+        return value
+
+    def validate(self, attrs):
+        if -(-attrs['total_size'] // attrs['chunk_size']) > MAX_CHUNK_COUNT:
+            raise serializers.ValidationError(f"At most {MAX_CHUNK_COUNT} chunks are allowed, use larger chunks.")
+        return attrs
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import File, Folder, Permission, folder_moved
+from .blobs import release_blob
+from . import permission_cache
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_permission_user(sender, instance, **kwargs):
+    permission_cache.invalidate([instance.user_id])
+
+
+@receiver(folder_moved, sender=Folder)
+def invalidate_moved_subtree(sender, folder, **kwargs):
+    # Permissions inside the subtree are cached by folder path, which just changed
+    permission_cache.invalidate(
+        Permission.objects.filter(folder__path__startswith=folder.path).values_list('user_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=File)
+def release_file_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        release_blob(instance.blob_id)
@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from urllib.parse import quote
+import mimetypes
+import os
+import re
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """
+    The next `length` bytes of an open file. Keeps fileno() so a WSGI server
+    file wrapper (gunicorn) sends exactly the range with os.sendfile, other
+    servers read it in blocks.
+    """
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
+
+
+def parse_range(header, size):
+    """
+    Returns the (start, end) byte positions, end included, requested by a
+    single range Range header, None to send the whole file (no or an
+    unsupported header) or False if the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        # Suffix range: the last `end` bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def if_range_matches(header, etag, last_modified):
+    if not header:
+        return True
+    if header.startswith('"'):
+        return header == etag
+    if header.startswith('W/'):
+        # Weak validators never match If-Range
+        return False
+    return parse_http_date_safe(header) == int(last_modified)
+
+
+def offloaded_response(file_obj, path):
+    """
+    Lets the front web server send the file, which also handles Range, or
+    None when MEDIA_SENDFILE is not set.
+    """
+    backend = getattr(settings, 'MEDIA_SENDFILE', '')
+    if not backend:
+        return None
+    response = HttpResponse()
+    if backend == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_SENDFILE_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(file_obj.file.name)
+    elif backend == 'x-sendfile':
+        response['X-Sendfile'] = path
+    else:
+        raise ValueError(f"Unknown MEDIA_SENDFILE backend: {backend}")
+    return response
+
+
+def stream_file(request, file_obj):
+    """
+    Response playing `file_obj` in the browser: offloaded to the web server
+    when configured, otherwise served here with Range/If-Range support.
+    """
+    path = file_obj.file.path
+    content_type = mimetypes.guess_type(file_obj.name)[0] or 'application/octet-stream'
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        # e.g. reclaimed content or an upload that never finished storing
+        raise Http404("The media file is missing.")
+    etag = f'"{file_obj.content_hash}"' if file_obj.content_hash else f'"{file_obj.pk}-{stat.st_size}-{int(stat.st_mtime)}"'
+
+    response = offloaded_response(file_obj, path)
+    if response is None:
+        size = stat.st_size
+        byte_range = None
+        if if_range_matches(request.headers.get('If-Range'), etag, stat.st_mtime):
+            byte_range = parse_range(request.headers.get('Range'), size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        else:
+            start, end = byte_range or (0, size - 1)
+            f = open(path, 'rb')
+            f.seek(start)
+            response = FileResponse(FileRange(f, end - start + 1), content_type=content_type, filename=file_obj.name)
+            response['Content-Length'] = str(end - start + 1)
+            if byte_range:
+                response.status_code = 206
+                response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        # Blobs have no extension, the web server cannot guess the type
+        response['Content-Type'] = content_type
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
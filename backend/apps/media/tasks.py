@@ -1,13 +1,100 @@
 from celery import shared_task
+from django.db import transaction
+from django.utils import timezone
+from apps.transcription.events import publish
+from .models import File, UploadSession, ChunkedUpload
+from .blobs import acquire_path, attach_blob, hash_path, new_reference
+from .hashing import upload_sha256
+from .uploads import assembled_path, covered_size, discard
+import logging
+
+logger = logging.getLogger(__name__)
 
 @shared_task
 def process_file_upload(file_id):
     """
-    Placeholder task for processing uploaded files (e.g., generating thumbnails, 
-    extracting metadata, or triggering transcription).
+    Processes uploaded files after they are stored. Currently computes the
+    content hash used to deduplicate transcriptions, for files stored before
+    it was computed while uploading.
     """
     print(f"Processing file {file_id}...")
-    # Simulate processing time
-    # time.sleep(5) 
+    try:
+        file_obj = File.objects.get(pk=file_id)
+    except File.DoesNotExist:
+        return f"File {file_id} not found."
+
+    # Content hash lets transcription reuse results of identical uploads
+    if not file_obj.content_hash:
+        file_obj.compute_content_hash()
     print(f"File {file_id} processed.")
     return f"File {file_id} processed successfully."
+
+
+def publish_upload(session):
+    publish([session.user_id], {
+        "type": "upload.session",
+        "id": str(session.upload_id),
+        "status": session.status,
+        "file": session.file_id,
+        "error_message": session.error_message,
+    })
+
+
+def fail_upload(session, exc):
+    """
+    Marks a FINALIZING session FAILED and drops its chunks, the upload has to
+    be started again.
+    """
+    session.status = UploadSession.Status.FAILED
+    session.error_message = str(exc) if isinstance(exc, ValueError) else "Could not store the uploaded file."
+    UploadSession.objects.filter(pk=session.pk).update(
+        status=session.status, error_message=session.error_message, updated_at=timezone.now()
+    )
+    ChunkedUpload.objects.filter(upload_id=session.upload_id).delete()
+    discard(session.upload_id)
+    publish_upload(session)
+
+
+@shared_task
+def finalize_upload(session_id):
+    """
+    Assembles the File of an upload session that complete_upload moved to
+    FINALIZING. No row is locked while the file is stored, the final state
+    change is a single conditional update. Any error fails the session.
+    """
+    try:
+        session = UploadSession.objects.select_related('folder').get(
+            pk=session_id, status=UploadSession.Status.FINALIZING
+        )
+    except UploadSession.DoesNotExist:
+        return f"Upload session {session_id} is not finalizing."
+
+    chunks = ChunkedUpload.objects.filter(upload_id=session.upload_id).order_by('offset').values_list('offset', 'size')
+    file_obj = File(name=session.filename, folder=session.folder, owner=session.user)
+    try:
+        size = covered_size(chunks)
+        if session.total_size is not None and size != session.total_size:
+            raise ValueError(f"Expected {session.total_size} bytes, received {size}")
+        path = assembled_path(session.upload_id, size)
+        # Hashed while the chunks arrived, only a tail the chunk requests did
+        # not get to is read here. The whole file when no state could be kept.
+        sha256 = upload_sha256(session.pk, size) or hash_path(path)
+
+        # Moved into the blob store, or dropped if the content is already stored
+        with new_reference(acquire_path(path, sha256)) as blob, transaction.atomic():
+            attach_blob(file_obj, blob)
+            file_obj.save()
+            UploadSession.objects.filter(pk=session.pk).update(
+                status=UploadSession.Status.COMPLETED, file=file_obj, updated_at=timezone.now()
+            )
+            ChunkedUpload.objects.filter(upload_id=session.upload_id).delete()
+            transaction.on_commit(lambda: process_file_upload.delay(file_obj.pk))
+    except Exception as e:
+        logger.exception("Finalizing upload %s failed", session.upload_id)
+        fail_upload(session, e)
+        return f"Upload {session.upload_id} failed: {e}"
+
+    session.status = UploadSession.Status.COMPLETED
+    session.file = file_obj
+    publish_upload(session)
+    return f"Upload {session.upload_id} stored as file {file_obj.pk}."
@@ -1,3 +1,697 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from apps.users.models import User
+from unittest import mock, skipUnless
+from . import permission_cache
+from .blobs import acquire_path, attach_blob
+from .hashing import ResumableSHA256
+from .models import Blob, ChunkedUpload, File, Folder, Permission, UploadSession
+from .permissions import has_granted_access
+from .streaming import if_range_matches, parse_range
+from .throttling import MediaStreamThrottle
+from .tasks import finalize_upload
+from .uploads import covered_size, missing_ranges, staging_path, write_chunk
+import errno
+import hashlib
+import os
+import redis
+import shutil
+import tempfile
 
-# Create your tests here.
+
+class TempMediaMixin:
+    """
+    Runs each test with its own MEDIA_ROOT and upload staging directory.
+    """
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'chunked_uploads'),
+            PERMISSION_CACHE_TTL=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class FolderPathTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def folder(self, name, parent=None):
+        return Folder.objects.create(name=name, parent=parent, owner=self.user)
+
+    def move(self, folder, parent):
+        return self.client.patch(f'/api/media/folders/{folder.pk}/', {'parent': parent.pk}, format='json')
+
+    def test_move_re_roots_the_subtree(self):
+        a = self.folder('a')
+        b = self.folder('b', a)
+        c = self.folder('c', b)
+        other = self.folder('other')
+        self.assertEqual(c.path, f"/{a.pk}/{b.pk}/{c.pk}/")
+
+        self.assertEqual(self.move(b, other).status_code, 200)
+        b.refresh_from_db()
+        c.refresh_from_db()
+        self.assertEqual(b.path, f"/{other.pk}/{b.pk}/")
+        self.assertEqual(c.path, f"/{other.pk}/{b.pk}/{c.pk}/")
+        self.assertTrue(c.is_in_subtree_of(other))
+        self.assertEqual(c.ancestor_ids(), [other.pk, b.pk, c.pk])
+
+    def test_saving_without_moving_keeps_the_paths(self):
+        a = self.folder('a')
+        b = self.folder('b', a)
+        b = Folder.objects.get(pk=b.pk)
+        b.name = 'renamed'
+        with self.assertNumQueries(1):
+            b.save()
+
+    def test_refreshed_folder_can_move_again(self):
+        a = self.folder('a')
+        b = self.folder('b', a)
+        other = self.folder('other')
+        # Moved through another instance, e.g. by another request
+        moved = Folder.objects.get(pk=b.pk)
+        moved.parent = other
+        moved.save()
+        b.refresh_from_db()
+        b.parent = a
+        b.save()
+        self.assertEqual(Folder.objects.get(pk=b.pk).path, f"/{a.pk}/{b.pk}/")
+
+    def test_move_into_own_subtree_is_rejected(self):
+        a = self.folder('a')
+        b = self.folder('b', a)
+        self.assertEqual(self.move(a, b).status_code, 400)
+        self.assertEqual(self.move(a, a).status_code, 400)
+        a.refresh_from_db()
+        self.assertEqual(a.path, f"/{a.pk}/")
+
+    def test_paths_must_fit(self):
+        max_length = Folder._meta.get_field('path').max_length
+        chain = [self.folder('0')]
+        while len(chain[-1].path) + len(str(chain[-1].pk)) + 2 <= max_length:
+            chain.append(self.folder(str(len(chain)), chain[-1]))
+        response = self.client.post('/api/media/folders/', {'name': 'too deep', 'parent': chain[-1].pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Folder.objects.filter(name='too deep').exists())
+
+        # Moving a subtree one level down would lengthen its deepest path
+        other = self.folder('other', self.folder('root'))
+        self.assertEqual(self.move(chain[1], other).status_code, 400)
+        chain[-1].refresh_from_db()
+        self.assertTrue(chain[-1].path.startswith(chain[0].path))
+
+
+class KeysetPaginationTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.files = [self.create_file(f'{i}.wav') for i in range(5)]
+        # Two files with the same timestamp, ordered by id
+        File.objects.filter(pk=self.files[2].pk).update(uploaded_at=self.files[1].uploaded_at)
+
+    def create_file(self, name):
+        file_obj = File(name=name, owner=self.user)
+        file_obj.file.save(name, ContentFile(b'data'), save=False)
+        file_obj.save()
+        return file_obj
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [row['id'] for row in data['results']], data['next'], data['previous']
+
+    def expected_order(self):
+        return list(File.objects.order_by('-uploaded_at', '-pk').values_list('pk', flat=True))
+
+    def test_pages_follow_the_cursor(self):
+        first, next_url, previous_url = self.page('/api/media/files/?page_size=2')
+        self.assertIsNone(previous_url)
+        second, next_url, _ = self.page(next_url)
+        third, last_url, _ = self.page(next_url)
+        self.assertEqual(first + second + third, self.expected_order())
+        self.assertIsNone(last_url)
+
+        # Going back from the third page gives the second one again
+        _, _, previous_url = self.page(next_url)
+        self.assertEqual(self.page(previous_url)[0], second)
+
+    def test_new_rows_do_not_shift_later_pages(self):
+        first, next_url, _ = self.page('/api/media/files/?page_size=2')
+        self.create_file('new.wav')
+        second, _, _ = self.page(next_url)
+        self.assertEqual(second, self.expected_order()[3:5])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/media/files/?cursor=bm90IGpzb24').status_code, 404)
+
+
+class FileListAccessTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.root = Folder.objects.create(name='root', owner=self.alice)
+        self.shared = Folder.objects.create(name='shared', parent=self.root, owner=self.alice)
+        self.nested = Folder.objects.create(name='nested', parent=self.shared, owner=self.alice)
+        Permission.objects.create(folder=self.shared, user=self.bob, can_view=True)
+        self.create_file('root.wav', self.alice, self.root)
+        self.create_file('shared.wav', self.alice, self.shared)
+        self.create_file('nested.mp4', self.alice, self.nested)
+        self.create_file('loose.wav', self.alice)
+        self.create_file('own.wav', self.bob)
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+
+    def create_file(self, name, owner, folder=None):
+        file_obj = File(name=name, owner=owner, folder=folder)
+        file_obj.file.save(name, ContentFile(b'data'), save=False)
+        file_obj.save()
+        return file_obj
+
+    def listed(self, query=''):
+        response = self.client.get(f'/api/media/files/{query}')
+        self.assertEqual(response.status_code, 200)
+        return {row['name'] for row in response.json()['results']}
+
+    def test_shared_subtree_and_own_files(self):
+        self.assertEqual(self.listed(), {'shared.wav', 'nested.mp4', 'own.wav'})
+        self.assertEqual(self.listed('?media_type=video'), {'nested.mp4'})
+
+    def test_folder_filter(self):
+        self.assertEqual(self.listed(f'?folder={self.shared.pk}'), {'shared.wav'})
+        self.assertEqual(self.listed(f'?folder={self.nested.pk}'), {'nested.mp4'})
+        self.assertEqual(self.listed(f'?folder={self.shared.pk}&recursive=true'), {'shared.wav', 'nested.mp4'})
+        self.assertEqual(self.client.get(f'/api/media/files/?folder={self.root.pk}').status_code, 403)
+        self.assertEqual(self.client.get('/api/media/files/?recursive=true').status_code, 400)
+
+    def test_revoked_grant_hides_the_files(self):
+        Permission.objects.filter(user=self.bob).delete()
+        self.assertEqual(self.listed(), {'own.wav'})
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.listed(), {'root.wav', 'shared.wav', 'nested.mp4', 'loose.wav'})
+
+
+class FakeRedis:
+    """
+    The subset of Redis used by the permission cache, in memory. Pipelines
+    buffer their commands except between WATCH and MULTI, and EXEC fails
+    with WatchError when a watched key changed. `before_exec` runs right
+    before a transaction executes, to interleave another client's writes.
+    """
+    def __init__(self):
+        self.data = {}
+        self.before_exec = None
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self, transaction)
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+    def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({field: str(value).encode() for field, value in mapping.items()})
+
+    def hmget(self, key, fields):
+        values = self.data.get(key, {})
+        return [values.get(field) for field in fields]
+
+    def hincrby(self, key, field, amount=1):
+        values = self.data.setdefault(key, {})
+        values[field] = str(int(values.get(field, 0)) + amount).encode()
+        return int(values[field])
+
+    def hgetall(self, key):
+        return {field.encode(): value for field, value in self.data.get(key, {}).items()}
+
+
+class FakePipeline:
+    def __init__(self, client, transaction):
+        self.client = client
+        self.transaction = transaction
+        self.watched = None
+        self.buffering = True
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.commands = []
+
+    def watch(self, key):
+        self.watched = (key, self.client.get(key))
+        self.buffering = False
+
+    def multi(self):
+        self.buffering = True
+
+    def execute(self):
+        if self.transaction and self.client.before_exec:
+            self.client.before_exec()
+        if self.watched and self.client.get(self.watched[0]) != self.watched[1]:
+            raise redis.WatchError("Watched variable changed.")
+        commands, self.commands = self.commands, []
+        return [command() for command in commands]
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if not self.buffering:
+            return method
+        return lambda *args, **kwargs: self.commands.append(lambda: method(*args, **kwargs))
+
+
+class PermissionCacheTests(TestCase):
+    def setUp(self):
+        settings_override = override_settings(PERMISSION_CACHE_TTL=3600)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.redis = FakeRedis()
+        client_patch = mock.patch.object(permission_cache, '_client', self.redis)
+        client_patch.start()
+        self.addCleanup(client_patch.stop)
+
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        self.root = Folder.objects.create(name='root', owner=self.alice)
+        self.shared = Folder.objects.create(name='shared', parent=self.root, owner=self.alice)
+        self.other = Folder.objects.create(name='other', owner=self.alice)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.permission = Permission.objects.create(folder=self.shared, user=self.bob, can_view=True)
+
+    def grants(self, folder):
+        return permission_cache.get_grants(self.bob.pk, folder.ancestor_paths())
+
+    def cached(self):
+        return self.redis.get(permission_cache.grants_key(self.bob.pk))
+
+    def test_hit_after_the_first_lookup(self):
+        self.assertEqual(self.grants(self.shared), {self.shared.path: '100'})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.grants(self.shared), {self.shared.path: '100'})
+            self.assertEqual(self.grants(self.root), {})
+            self.assertTrue(has_granted_access(self.bob, self.shared))
+            self.assertFalse(has_granted_access(self.bob, self.shared, 'can_edit'))
+        stats = permission_cache.stats()
+        self.assertEqual((stats['lookups'], stats['misses']), (5, 1))
+
+    def test_users_without_permissions_are_cached(self):
+        self.assertEqual(permission_cache.get_grants(self.alice.pk, self.root.ancestor_paths()), {})
+        with self.assertNumQueries(0):
+            self.assertEqual(permission_cache.get_grants(self.alice.pk, self.root.ancestor_paths()), {})
+
+    def test_grant_and_revoke_invalidate(self):
+        self.grants(self.shared)
+        with self.captureOnCommitCallbacks(execute=True):
+            Permission.objects.create(folder=self.other, user=self.bob, can_view=True, can_upload=True)
+        self.assertIsNone(self.cached())
+        self.assertEqual(self.grants(self.other), {self.other.path: '101'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.permission.delete()
+        self.assertIsNone(self.cached())
+        self.assertEqual(self.grants(self.shared), {})
+        self.assertFalse(has_granted_access(self.bob, self.shared))
+
+    def test_folder_move_invalidates_the_subtree_grants(self):
+        old_path = self.shared.path
+        self.assertEqual(self.grants(self.shared), {old_path: '100'})
+        self.shared.parent = self.other
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shared.save()
+        self.assertIsNone(self.cached())
+        self.assertEqual(self.grants(self.shared), {self.shared.path: '100'})
+        self.assertNotEqual(self.shared.path, old_path)
+
+    def test_invalidation_during_the_load_is_not_overwritten(self):
+        load_grants = permission_cache.load_grants
+
+        def load_then_revoke(user_id):
+            # Read before the revoke commits, invalidated right after
+            grants = load_grants(user_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.permission.delete()
+            return grants
+
+        with mock.patch('apps.media.permission_cache.load_grants', side_effect=load_then_revoke):
+            self.assertEqual(self.grants(self.shared), {self.shared.path: '100'})
+        self.assertIsNone(self.cached())
+        self.assertEqual(self.grants(self.shared), {})
+
+    def test_stale_write_loses_the_watch_race(self):
+        version = self.redis.get(permission_cache.version_key(self.bob.pk))
+        # Another process invalidates between the version check and EXEC
+        self.redis.before_exec = lambda: self.redis.incr(permission_cache.version_key(self.bob.pk))
+        permission_cache.store_grants(self.redis, self.bob.pk, version, {self.shared.path: '100'})
+        self.assertIsNone(self.cached())
+
+        self.redis.before_exec = None
+        version = self.redis.get(permission_cache.version_key(self.bob.pk))
+        permission_cache.store_grants(self.redis, self.bob.pk, version, {self.shared.path: '100'})
+        self.assertEqual(self.cached(), {permission_cache.LOADED: b'1', self.shared.path: b'100'})
+
+    def test_unavailable_redis_falls_back_to_the_database(self):
+        with mock.patch.object(self.redis, 'pipeline', side_effect=redis.ConnectionError):
+            self.assertIsNone(self.grants(self.shared))
+            self.assertTrue(has_granted_access(self.bob, self.shared))
+
+    def test_disabled_with_a_zero_ttl(self):
+        with override_settings(PERMISSION_CACHE_TTL=0):
+            self.assertIsNone(self.grants(self.shared))
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                permission_cache.invalidate([self.bob.pk])
+        self.assertEqual(callbacks, [])
+
+
+class BlobTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+
+    def local_file(self, data):
+        fd, path = tempfile.mkstemp(dir=self.media_root)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return path
+
+    def create_file(self, data):
+        file_obj = File(name='talk.wav', owner=self.user)
+        attach_blob(file_obj, acquire_path(self.local_file(data)))
+        file_obj.save()
+        return file_obj
+
+    def test_identical_content_is_stored_once(self):
+        first = self.create_file(b'same audio')
+        second = self.create_file(b'same audio')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertEqual(os.listdir(self.media_root), ['blobs'])
+
+    def test_content_is_reclaimed_with_the_last_reference(self):
+        first = self.create_file(b'same audio')
+        second = self.create_file(b'same audio')
+        path = first.file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        blob = Blob.objects.get()
+        self.assertEqual((blob.ref_count, blob.file.name), (0, ''))
+        self.assertFalse(os.path.exists(path))
+
+        # The emptied row is reused when the content comes back
+        third = self.create_file(b'same audio')
+        self.assertEqual(third.blob_id, blob.pk)
+        with third.file.open('rb') as f:
+            self.assertEqual(f.read(), b'same audio')
+
+    def test_copies_across_file_systems(self):
+        path = self.local_file(b'other volume')
+        with mock.patch('apps.media.blobs.os.link', side_effect=OSError(errno.EXDEV, 'Invalid cross-device link')):
+            blob = acquire_path(path)
+        with blob.file.open('rb') as f:
+            self.assertEqual(f.read(), b'other volume')
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(os.listdir(os.path.dirname(blob.file.path)), [blob.sha256])
+
+
+class ChunkAssemblyTests(TempMediaMixin, SimpleTestCase):
+    def test_covered_size(self):
+        self.assertEqual(covered_size([]), 0)
+        self.assertEqual(covered_size([(0, 10), (10, 10), (20, 5)]), 25)
+        # Overlapping re-sent chunks are fine
+        self.assertEqual(covered_size([(0, 10), (5, 10)]), 15)
+        with self.assertRaisesMessage(ValueError, "Missing data at offset 10"):
+            covered_size([(0, 10), (20, 10)])
+        with self.assertRaises(ValueError):
+            covered_size([(5, 10)])
+
+    def test_missing_ranges(self):
+        self.assertEqual(missing_ranges([], 100), [(0, 100)])
+        self.assertEqual(missing_ranges([(0, 100)], 100), [])
+        self.assertEqual(missing_ranges([(10, 20), (50, 10)], 100), [(0, 10), (30, 50), (60, 100)])
+        self.assertEqual(missing_ranges([(0, 40), (20, 40)], 100), [(60, 100)])
+
+    def test_chunks_are_written_in_place_in_any_order(self):
+        upload_id = '0b7c6d1e-3c2a-4f57-9a8e-6a1f0f4b2d10'
+        data = os.urandom(3000)
+        for offset in (2000, 0, 1000):
+            write_chunk(upload_id, offset, SimpleUploadedFile('chunk', data[offset:offset + 1000]), total_size=len(data))
+        with open(staging_path(upload_id), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_staging_path_only_accepts_upload_ids(self):
+        with self.assertRaises(ValueError):
+            staging_path('../../etc/passwd')
+
+
+class UploadSessionTestCase(TempMediaMixin, TestCase):
+    chunk_size = 64 * 1024
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.data = os.urandom(self.chunk_size * 2 + 100)
+        response = self.client.post('/api/media/uploads/', {
+            'filename': 'talk.mp3', 'total_size': len(self.data), 'chunk_size': self.chunk_size,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = response.json()['upload_id']
+
+    def put_chunk(self, index, body=None, checksum=None):
+        if body is None:
+            body = self.data[index * self.chunk_size:(index + 1) * self.chunk_size]
+        return self.client.generic(
+            'PUT', f'/api/media/uploads/{self.upload_id}/chunks/{index}/', body,
+            content_type='application/octet-stream',
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(body).hexdigest(),
+        )
+
+    def missing_chunks(self):
+        return self.client.get(f'/api/media/uploads/{self.upload_id}/missing/').json()['missing_chunks']
+
+
+class UploadSessionChunkTests(UploadSessionTestCase):
+    def test_chunk_size_must_match(self):
+        self.assertEqual(self.put_chunk(0, body=b'short').status_code, 400)
+        self.assertEqual(self.put_chunk(3).status_code, 400)
+        self.assertEqual(self.missing_chunks(), [0, 1, 2])
+
+    def test_chunks_in_any_order(self):
+        self.assertEqual([self.put_chunk(i).status_code for i in (2, 0)], [201, 201])
+        self.assertEqual(self.missing_chunks(), [1])
+        missing = self.client.get(f'/api/media/uploads/{self.upload_id}/missing/').json()
+        self.assertEqual(missing['missing'], [{'start': self.chunk_size, 'end': 2 * self.chunk_size}])
+        self.assertEqual(missing['received_bytes'], len(self.data) - self.chunk_size)
+        self.assertEqual(self.put_chunk(1).status_code, 201)
+        self.assertEqual(self.missing_chunks(), [])
+
+    def test_resending_a_chunk_is_a_no_op(self):
+        self.assertEqual(self.put_chunk(0).status_code, 201)
+        self.assertEqual(self.put_chunk(0).status_code, 200)
+        self.assertEqual(ChunkedUpload.objects.count(), 1)
+
+    def test_checksum_mismatch_leaves_chunk_missing(self):
+        self.assertEqual(self.put_chunk(0, checksum='0' * 64).status_code, 400)
+        self.assertEqual(self.missing_chunks(), [0, 1, 2])
+
+    def test_failed_retry_of_a_received_chunk_marks_it_missing(self):
+        self.assertEqual(self.put_chunk(0).status_code, 201)
+        corrupted = os.urandom(self.chunk_size)
+        response = self.put_chunk(0, body=corrupted, checksum=hashlib.sha256(self.data[:self.chunk_size]).hexdigest()[::-1])
+        self.assertEqual(response.status_code, 400)
+        # The staging file was overwritten, so the chunk has to be sent again
+        self.assertEqual(self.missing_chunks(), [0, 1, 2])
+        self.assertEqual(self.client.post(f'/api/media/uploads/{self.upload_id}/complete/').status_code, 400)
+
+
+@mock.patch('apps.media.tasks.publish')
+class FinalizeUploadTests(UploadSessionTestCase):
+    def finalize(self):
+        for index in range(3):
+            self.put_chunk(index)
+        session = UploadSession.objects.get(upload_id=self.upload_id)
+        UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.Status.FINALIZING)
+        finalize_upload(session.pk)
+        session.refresh_from_db()
+        return session
+
+    def test_stores_the_assembled_file(self, publish):
+        session = self.finalize()
+        self.assertEqual(session.status, UploadSession.Status.COMPLETED)
+        with session.file.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(session.file.content_hash, hashlib.sha256(self.data).hexdigest())
+        self.assertFalse(os.path.exists(staging_path(self.upload_id)))
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_storage_error_fails_the_session(self, publish):
+        with mock.patch('apps.media.tasks.acquire_path', side_effect=OSError(errno.EIO, 'I/O error')):
+            session = self.finalize()
+        self.assertEqual(session.status, UploadSession.Status.FAILED)
+        self.assertEqual(session.error_message, "Could not store the uploaded file.")
+        self.assertEqual(publish.call_args[0][1]['status'], UploadSession.Status.FAILED)
+        self.assertFalse(File.objects.exists())
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertFalse(os.path.exists(staging_path(self.upload_id)))
+
+    @skipUnless(ResumableSHA256.available(), "libcrypto is not available")
+    def test_hashed_while_the_chunks_arrive(self, publish):
+        self.put_chunk(2)
+        self.put_chunk(0)
+        session = UploadSession.objects.get(upload_id=self.upload_id)
+        # Stops at the missing chunk
+        self.assertEqual(session.hashed_size, self.chunk_size)
+        partial = ResumableSHA256(bytes(session.hash_state))
+        self.assertEqual(partial.hexdigest(), hashlib.sha256(self.data[:self.chunk_size]).hexdigest())
+
+        self.put_chunk(1)
+        session.refresh_from_db()
+        self.assertEqual(session.hashed_size, len(self.data))
+        with mock.patch('apps.media.tasks.hash_path') as hash_path:
+            session = self.finalize()
+        hash_path.assert_not_called()
+        self.assertEqual(session.file.content_hash, hashlib.sha256(self.data).hexdigest())
+
+    @skipUnless(ResumableSHA256.available(), "libcrypto is not available")
+    def test_finalizing_hashes_the_tail_left(self, publish):
+        for index in range(3):
+            self.put_chunk(index)
+        # As if the last chunk's request found the session locked
+        UploadSession.objects.update(hashed_size=0, hash_state=None)
+        with mock.patch('apps.media.tasks.hash_path') as hash_path:
+            session = self.finalize()
+        hash_path.assert_not_called()
+        self.assertEqual(session.file.content_hash, hashlib.sha256(self.data).hexdigest())
+
+    def test_overwriting_a_hashed_chunk_drops_the_state(self, publish):
+        self.put_chunk(0)
+        self.put_chunk(1)
+        replacement = os.urandom(self.chunk_size)
+        self.data = replacement + self.data[self.chunk_size:]
+        self.assertEqual(self.put_chunk(0, body=replacement).status_code, 201)
+        self.assertIsNone(UploadSession.objects.get().hashed_size)
+        session = self.finalize()
+        self.assertEqual(session.file.content_hash, hashlib.sha256(self.data).hexdigest())
+        with session.file.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_failed_transaction_releases_the_blob(self, publish):
+        with mock.patch('apps.media.tasks.File.save', side_effect=OSError(errno.EIO, 'I/O error')):
+            with self.captureOnCommitCallbacks(execute=True):
+                session = self.finalize()
+        self.assertEqual(session.status, UploadSession.Status.FAILED)
+        blob = Blob.objects.get()
+        self.assertEqual((blob.ref_count, blob.file.name), (0, ''))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'blobs', blob.sha256[:2], blob.sha256[2:4])), [])
+
+    def test_failed_enqueue_hands_the_session_back(self, publish):
+        for index in range(3):
+            self.put_chunk(index)
+        url = f'/api/media/uploads/{self.upload_id}/complete/'
+        # Run the commit hooks in the request, as outside of a test transaction
+        with mock.patch('django.db.transaction.on_commit', side_effect=lambda callback: callback()):
+            with mock.patch('apps.media.views.finalize_upload.delay', side_effect=ConnectionError) as delay:
+                self.assertEqual(self.client.post(url).status_code, 503)
+            self.assertEqual(delay.call_count, 1)
+            self.assertEqual(UploadSession.objects.get().status, UploadSession.Status.UPLOADING)
+
+            with mock.patch('apps.media.views.finalize_upload.delay') as delay:
+                response = self.client.post(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], UploadSession.Status.FINALIZING)
+        delay.assert_called_once_with(UploadSession.objects.get().pk)
+
+
+class RangeTests(SimpleTestCase):
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=900-5000', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        self.assertEqual(parse_range('bytes = 10 - 19', 1000), (10, 19))
+
+    def test_whole_file_for_missing_or_unsupported_ranges(self):
+        for header in (None, '', 'bytes=-', 'bytes=0-1,5-6', 'items=0-9', 'bytes=a-b'):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=1000-', 'bytes=1200-1300', 'bytes=20-10', 'bytes=-0'):
+            self.assertIs(parse_range(header, 1000), False, header)
+
+    def test_if_range(self):
+        last_modified = 1700000000.5
+        self.assertTrue(if_range_matches(None, '"abc"', last_modified))
+        self.assertTrue(if_range_matches('"abc"', '"abc"', last_modified))
+        self.assertFalse(if_range_matches('"old"', '"abc"', last_modified))
+        self.assertFalse(if_range_matches('W/"abc"', '"abc"', last_modified))
+        self.assertTrue(if_range_matches('Tue, 14 Nov 2023 22:13:20 GMT', '"abc"', last_modified))
+        self.assertFalse(if_range_matches('Tue, 14 Nov 2023 22:13:21 GMT', '"abc"', last_modified))
+        self.assertFalse(if_range_matches('not a date', '"abc"', last_modified))
+
+
+class StreamTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.data = os.urandom(5000)
+        self.file = File(name='talk.mp3', owner=self.user)
+        self.file.file.save('talk.mp3', ContentFile(self.data), save=False)
+        self.file.save()
+        self.url = f'/api/media/files/{self.file.pk}/stream/'
+
+    def test_range_request(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/5000')
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertEqual(b''.join(response.streaming_content), self.data[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */5000')
+
+    def test_missing_content_is_not_found(self):
+        os.unlink(self.file.file.path)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_stream_has_its_own_rate(self):
+        with mock.patch.object(MediaStreamThrottle, 'THROTTLE_RATES', {'media_stream': '2/hour'}):
+            statuses = [self.client.get(self.url, HTTP_RANGE='bytes=0-0').status_code for _ in range(3)]
+        self.assertEqual(statuses, [206, 206, 429])
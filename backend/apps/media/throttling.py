@@ -0,0 +1,9 @@
+from rest_framework.throttling import UserRateThrottle
+
+
+class MediaStreamThrottle(UserRateThrottle):
+    """
+    Rate of files/<id>/stream/, counted apart from the user's API rate: a
+    player sends a Range request for every seek and buffer refill.
+    """
+    scope = 'media_stream'
@@ -0,0 +1,187 @@
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+import errno
+import hashlib
+import os
+import uuid
+
+MAX_UPLOAD_SIZE = 500 * 1024 * 1024
+# Upload sessions: the last chunk may be smaller than MIN_CHUNK_SIZE
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+MAX_CHUNK_COUNT = 10000
+
+
+class HashingUploadHandlerMixin:
+    """
+    Computes the SHA-256 of an uploaded file while it is received and sets
+    it as the `sha256` attribute of the resulting file.
+    """
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.sha256 = self.sha256.hexdigest()
+        return uploaded
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def staging_dir():
+    return getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'chunked_uploads'))
+
+
+def staging_path(upload_id):
+    # Parsed again so a malformed id can never point outside the staging directory
+    return os.path.join(staging_dir(), f"{uuid.UUID(str(upload_id))}.part")
+
+
+def preallocate(fd, size):
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # Not available on this platform or file system, a sparse file will do
+        os.ftruncate(fd, size)
+
+
+def pwrite_all(fd, data, position):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, position)
+        view = view[written:]
+        position += written
+    return position
+
+
+def copy_range(src_path, fd, size, offset):
+    """
+    Copies a chunk Django already spooled to disk into the staging file in
+    the kernel. Returns False if copy_file_range is not supported here.
+    """
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    with open(src_path, 'rb') as src:
+        copied = 0
+        try:
+            while copied < size:
+                count = os.copy_file_range(src.fileno(), fd, size - copied, copied, offset + copied)
+                if count == 0:
+                    raise OSError(errno.EIO, "Chunk ended early")
+                copied += count
+        except OSError as e:
+            if e.errno in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                return False
+            raise
+    return True
+
+
+def write_chunk(upload_id, offset, chunk, total_size=None):
+    """
+    Writes an uploaded chunk at `offset` of the upload's staging file. The
+    first chunk creates the file, preallocated to `total_size` when given.
+    Chunks may arrive in any order and every byte is written only once.
+    """
+    os.makedirs(staging_dir(), exist_ok=True)
+    fd = os.open(staging_path(upload_id), os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        if total_size and os.fstat(fd).st_size < total_size:
+            preallocate(fd, total_size)
+        if isinstance(chunk, TemporaryUploadedFile) and copy_range(chunk.temporary_file_path(), fd, chunk.size, offset):
+            return
+        position = offset
+        for data in chunk.chunks():
+            position = pwrite_all(fd, data, position)
+    finally:
+        os.close(fd)
+
+
+def covered_size(chunks):
+    """
+    Returns the size of the file made of `chunks` ((offset, size) pairs
+    sorted by offset), or raises ValueError if they leave a gap.
+    """
+    total_size = 0
+    for offset, size in chunks:
+        if offset > total_size:
+            raise ValueError(f"Missing data at offset {total_size}")
+        total_size = max(total_size, offset + size)
+    return total_size
+
+
+def missing_ranges(chunks, total_size):
+    """
+    Returns the [start, end) byte ranges of a `total_size` file not covered
+    by `chunks` ((offset, size) pairs sorted by offset).
+    """
+    missing = []
+    position = 0
+    for offset, size in chunks:
+        if offset > position:
+            missing.append((position, offset))
+        position = max(position, offset + size)
+    if position < total_size:
+        missing.append((position, total_size))
+    return missing
+
+
+def create_staging(upload_id, total_size):
+    os.makedirs(staging_dir(), exist_ok=True)
+    fd = os.open(staging_path(upload_id), os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        preallocate(fd, total_size)
+    finally:
+        os.close(fd)
+
+
+def write_stream(upload_id, offset, stream, size, block_size=1024 * 1024):
+    """
+    Writes `size` bytes read from `stream` (a request body) at `offset` of the
+    staging file and returns their SHA-256, computed while writing. Raises
+    ValueError if the stream ends early.
+    """
+    digest = hashlib.sha256()
+    fd = os.open(staging_path(upload_id), os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        position = offset
+        remaining = size
+        while remaining:
+            data = stream.read(min(block_size, remaining))
+            if not data:
+                raise ValueError(f"Expected {size} bytes, received {size - remaining}")
+            digest.update(data)
+            position = pwrite_all(fd, data, position)
+            remaining -= len(data)
+    finally:
+        os.close(fd)
+    return digest.hexdigest()
+
+
+def assembled_path(upload_id, size):
+    """
+    Returns the staging file of `upload_id`, cut to `size` to drop
+    preallocated space past the last chunk.
+    """
+    path = staging_path(upload_id)
+    os.truncate(path, size)
+    return path
+
+
+def discard(upload_id):
+    try:
+        os.unlink(staging_path(upload_id))
+    except FileNotFoundError:
+        pass
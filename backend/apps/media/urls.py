@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FolderViewSet, FileViewSet
+from .views import FolderViewSet, FileViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'folders', FolderViewSet, basename='folder')
 router.register(r'files', FileViewSet, basename='file')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
     path('', include(router.urls)),
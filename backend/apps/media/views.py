@@ -1,14 +1,73 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.shortcuts import get_object_or_404
 from django.core.files.base import ContentFile
-from .models import Folder, File, Permission, ChunkedUpload
-from .serializers import FolderSerializer, FolderDetailSerializer, FileSerializer, PermissionSerializer, ChunkedUploadSerializer
-from .permissions import IsFolderOwner, HasFolderAccess
-from .tasks import process_file_upload
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Folder, File, Permission, ChunkedUpload, UploadSession
+from .serializers import FolderSerializer, FolderDetailSerializer, FileSerializer, PermissionSerializer, ChunkedUploadSerializer, FileListFilterSerializer, UploadSessionSerializer, MEDIA_TYPE_EXTENSIONS
+from .permissions import IsFolderOwner, HasFolderAccess, has_granted_access, accessible_files
+from .tasks import process_file_upload, finalize_upload
+from .pagination import KeysetPagination
+from .authentication import QueryParamJWTAuthentication
+from .throttling import MediaStreamThrottle
+from .hashing import advance_upload_hash, rewind_upload_hash
+from .streaming import stream_file
+from .uploads import MAX_UPLOAD_SIZE, covered_size, create_staging, discard, missing_ranges, write_stream
+import datetime
+import logging
 import os
+import re
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def start_finalizing(session, **fields):
+    """
+    Moves an UPLOADING session to FINALIZING (setting `fields`) and queues
+    `finalize_upload`. A short transaction, the assembly runs in the worker.
+    Returns the session as it is now: back to UPLOADING if the task could not
+    be queued, so completing it can be retried.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status == UploadSession.Status.UPLOADING:
+            for name, value in fields.items():
+                setattr(session, name, value)
+            session.status = UploadSession.Status.FINALIZING
+            session.save(update_fields=['status', 'updated_at', *fields])
+            transaction.on_commit(lambda: queue_finalize(session))
+    return session
+
+
+def queue_finalize(session):
+    try:
+        finalize_upload.delay(session.pk)
+    except Exception:
+        # Nothing would ever finalize it, hand the session back to the client
+        logger.exception("Could not queue the finalization of upload %s", session.upload_id)
+        UploadSession.objects.filter(pk=session.pk, status=UploadSession.Status.FINALIZING).update(
+            status=UploadSession.Status.UPLOADING, updated_at=timezone.now(),
+        )
+        session.status = UploadSession.Status.UPLOADING
+
+
+def finalizing_response(session):
+    if session.status == UploadSession.Status.UPLOADING:
+        return Response(
+            {'error': 'The upload could not be finalized right now, complete it again later'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_202_ACCEPTED)
 
 class FolderViewSet(viewsets.ModelViewSet):
     queryset = Folder.objects.all()
@@ -38,110 +97,255 @@ class FolderViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['post'], permission_classes=[IsFolderOwner])
+    def unshare(self, request, pk=None):
+        folder = self.get_object()
+        user_id = str(request.data.get('user', ''))
+        if not user_id.isdigit():
+            return Response({'error': 'user is required'}, status=status.HTTP_400_BAD_REQUEST)
+        deleted, _ = Permission.objects.filter(folder=folder, user_id=user_id).delete()
+        if not deleted:
+            return Response({'error': 'This folder is not shared with this user'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class FileViewSet(viewsets.ModelViewSet):
     queryset = File.objects.all()
     serializer_class = FileSerializer
     permission_classes = [permissions.IsAuthenticated, HasFolderAccess]
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = KeysetPagination
+    cursor_ordering_field = 'uploaded_at'
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return self.filter_list(self.request.user, self.request.query_params)
+        return File.objects.all()
+
+    def filter_list(self, user, params):
+        """
+        Files the user can view, in one query: in an accessible folder
+        (optionally its whole subtree), or all accessible files.
+        """
+        filters = FileListFilterSerializer(data=params)
+        filters.is_valid(raise_exception=True)
+        data = filters.validated_data
+
+        if 'folder' in data:
+            folder = get_object_or_404(Folder, pk=data['folder'])
+            if folder.owner_id != user.pk and not has_granted_access(user, folder):
+                raise PermissionDenied("You do not have access to this folder.")
+            if data['recursive']:
+                queryset = File.objects.filter(folder__in=Folder.objects.filter(path__startswith=folder.path).values('pk'))
+            else:
+                queryset = File.objects.filter(folder=folder)
+        else:
+            queryset = accessible_files(user)
+
+        if 'media_type' in data:
+            extensions = Q()
+            for extension in MEDIA_TYPE_EXTENSIONS[data['media_type']]:
+                extensions |= Q(name__iendswith=extension)
+            queryset = queryset.filter(extensions)
+        # Day bounds in the current time zone, so the uploaded_at index is used
+        if 'uploaded_from' in data:
+            queryset = queryset.filter(uploaded_at__gte=start_of_day(data['uploaded_from']))
+        if 'uploaded_to' in data:
+            queryset = queryset.filter(uploaded_at__lt=start_of_day(data['uploaded_to'] + datetime.timedelta(days=1)))
+        return queryset.select_related('owner')
 
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
+        file_obj = serializer.save(owner=self.request.user)
+        process_file_upload.delay(file_obj.id)
+
+    @action(detail=True, methods=['get'], authentication_classes=[QueryParamJWTAuthentication],
+            throttle_classes=[MediaStreamThrottle])
+    def stream(self, request, pk=None):
+        """
+        The file content for playback, with Range requests for seeking.
+        """
+        return stream_file(request, self.get_object())
 
     @action(detail=False, methods=['post'], url_path='upload')
     def upload(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(owner=request.user)
+        file_obj = serializer.save(owner=request.user)
+        process_file_upload.delay(file_obj.id)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['post'], url_path='upload_chunk')
     def upload_chunk(self, request):
         serializer = ChunkedUploadSerializer(data=request.data)
         if serializer.is_valid():
+            session, _ = UploadSession.objects.get_or_create(
+                upload_id=serializer.validated_data['upload_id'], defaults={'user': request.user}
+            )
+            if session.user_id != request.user.pk:
+                return Response({'error': 'This upload belongs to another user'}, status=status.HTTP_403_FORBIDDEN)
+            if session.chunk_size:
+                return Response({'error': 'Send the chunks of this upload to uploads/<upload_id>/chunks/<index>/'}, status=status.HTTP_400_BAD_REQUEST)
+            if session.status != UploadSession.Status.UPLOADING:
+                return Response({'error': 'This upload is already completed'}, status=status.HTTP_409_CONFLICT)
+            rewind_upload_hash(session.pk, serializer.validated_data['offset'])
             serializer.save(user=request.user)
+            advance_upload_hash(session.pk)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['post'], url_path='complete_upload')
     def complete_upload(self, request):
-        from django.db import transaction
-        
+        """
+        Checks the chunks and hands the upload to the `finalize_upload` task.
+        Returns the upload session, FINALIZING until the file is stored: poll
+        it at uploads/<upload_id>/ or wait for its `upload.session` event.
+        """
         upload_id = request.data.get('upload_id')
         filename = request.data.get('filename')
         folder_id = request.data.get('folder_id')
         
         if not upload_id or not filename:
              return Response({'error': 'upload_id and filename are required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload_id = uuid.UUID(str(upload_id))
+        except ValueError:
+            return Response({'error': 'upload_id must be a UUID'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Validate file extension
         allowed_extensions = ['.mp3', '.wav', '.mp4', '.m4a', '.mov', '.ogg', '.webm']
-        import os
         ext = os.path.splitext(filename)[1].lower()
         if ext not in allowed_extensions:
             return Response({'error': f"Unsupported file extension. Allowed: {', '.join(allowed_extensions)}"}, status=status.HTTP_400_BAD_REQUEST)
 
+        folder = None
+        if folder_id:
+            folder = get_object_or_404(Folder, pk=folder_id)
+            if folder.owner != request.user and not has_granted_access(request.user, folder, 'can_upload'):
+                return Response({'error': 'No upload permission on this folder'}, status=status.HTTP_403_FORBIDDEN)
+
+        session = UploadSession.objects.filter(upload_id=upload_id, user=request.user).first()
+        if session is None:
+            return Response({'error': 'No chunks found'}, status=status.HTTP_404_NOT_FOUND)
+        if session.status != UploadSession.Status.UPLOADING:
+            # Completing twice is harmless, report where the first call got
+            return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+        chunks = ChunkedUpload.objects.filter(upload_id=upload_id).order_by('offset').values_list('offset', 'size')
+        try:
+            total_size = covered_size(chunks)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if total_size == 0:
+            return Response({'error': 'No chunks found'}, status=status.HTTP_404_NOT_FOUND)
+        if total_size > MAX_UPLOAD_SIZE:
+            ChunkedUpload.objects.filter(upload_id=upload_id).delete()
+            discard(upload_id)
+            return Response({'error': f"Total file size exceeds limit of {MAX_UPLOAD_SIZE // (1024 * 1024)}MB."}, status=status.HTTP_400_BAD_REQUEST)
+
+        session = start_finalizing(session, filename=filename, folder=folder)
+        return finalizing_response(session)
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Chunked uploads with a declared size:
+
+    - POST uploads/ with filename, total_size, chunk_size (and folder) starts one.
+    - PUT uploads/<upload_id>/chunks/<index>/ sends a chunk as the raw request
+      body with its SHA-256 in the X-Chunk-SHA256 header. Chunks can be sent in
+      any order and in parallel, re-sending a received chunk is a no-op.
+    - GET uploads/<upload_id>/missing/ lists what is left to send.
+    - POST uploads/<upload_id>/complete/ finalizes it like complete_upload.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = 'upload_id'
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user).order_by('-created_at')
+
+    def perform_create(self, serializer):
+        folder = serializer.validated_data.get('folder')
+        if folder and folder.owner != self.request.user and not has_granted_access(self.request.user, folder, 'can_upload'):
+            raise PermissionDenied('No upload permission on this folder')
+        session = serializer.save(user=self.request.user, upload_id=uuid.uuid4())
+        create_staging(session.upload_id, session.total_size)
+
+    def received_chunks(self, session):
+        return list(
+            ChunkedUpload.objects.filter(upload_id=session.upload_id).order_by('offset').values_list('offset', 'size')
+        )
+
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<index>[0-9]+)', parser_classes=[])
+    def chunk(self, request, upload_id=None, index=None):
+        session = self.get_object()
+        if not session.chunk_size:
+            return Response({'error': 'This upload has no declared size, use upload_chunk'}, status=status.HTTP_400_BAD_REQUEST)
+        if session.status != UploadSession.Status.UPLOADING:
+            return Response({'error': 'This upload is already completed'}, status=status.HTTP_409_CONFLICT)
+
+        index = int(index)
+        if index >= session.chunk_count:
+            return Response({'error': f"Chunk index must be below {session.chunk_count}"}, status=status.HTTP_400_BAD_REQUEST)
+        offset = index * session.chunk_size
+        size = min(session.chunk_size, session.total_size - offset)
+        if request.META.get('CONTENT_LENGTH') != str(size):
+            return Response({'error': f"Chunk {index} must be exactly {size} bytes"}, status=status.HTTP_400_BAD_REQUEST)
+        checksum = request.headers.get('X-Chunk-SHA256', '').lower()
+        if not re.fullmatch(r'[0-9a-f]{64}', checksum):
+            return Response({'error': 'X-Chunk-SHA256 header with the hex SHA-256 of the chunk is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = {'index': index, 'offset': offset, 'size': size, 'checksum': checksum}
+        if ChunkedUpload.objects.filter(upload_id=session.upload_id, offset=offset, checksum=checksum).exists():
+            # Re-sent, the data is already in place
+            return Response(data, status=status.HTTP_200_OK)
+
+        # The bytes at this offset are about to be overwritten: forget the
+        # chunk first, so it stays missing unless the new data verifies
+        rewind_upload_hash(session.pk, offset)
         try:
-            with transaction.atomic():
-                # Add select_for_update to prevent race conditions
-                chunks = ChunkedUpload.objects.filter(upload_id=upload_id).select_for_update().order_by('offset')
-                if not chunks.exists():
-                    return Response({'error': 'No chunks found'}, status=status.HTTP_404_NOT_FOUND)
-
-                # Check total size
-                total_size = sum(chunk.file.size for chunk in chunks)
-                limit_mb = 500
-                if total_size > limit_mb * 1024 * 1024:
-                     chunks.delete()
-                     return Response({'error': f"Total file size exceeds limit of {limit_mb}MB."}, status=status.HTTP_400_BAD_REQUEST)
-
-                import tempfile
-                import shutil
-                from django.core.files import File as DjangoFile
-
-                tmp_path = None
-                try:
-                    # Assemble file to temporary path to avoid memory issues
-                    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-                        for chunk in chunks:
-                            with chunk.file.open('rb') as f:
-                                shutil.copyfileobj(f, tmp_file, length=1024*1024) # 1MB chunks
-                        tmp_path = tmp_file.name
-
-                    # Create File object
-                    folder = None
-                    if folder_id:
-                        folder = get_object_or_404(Folder, pk=folder_id)
-                        if folder.owner != request.user:
-                             perm = Permission.objects.filter(folder=folder, user=request.user, can_upload=True).exists()
-                             if not perm:
-                                 if tmp_path and os.path.exists(tmp_path):
-                                    os.unlink(tmp_path)
-                                 return Response({'error': 'No upload permission on this folder'}, status=status.HTTP_403_FORBIDDEN)
-
-                    file_obj = File.objects.create(
-                        name=filename,
-                        folder=folder,
-                        owner=request.user,
-                        size=total_size
-                    )
-                    
-                    # Save content to FileField
-                    with open(tmp_path, 'rb') as f:
-                        file_obj.file.save(filename, DjangoFile(f))
-                    file_obj.save()
-
-                    # Cleanup
-                    os.unlink(tmp_path)
-                    chunks.delete()
-
-                    # Trigger async task
-                    process_file_upload.delay(file_obj.id)
-
-                    return Response(FileSerializer(file_obj).data, status=status.HTTP_201_CREATED)
-
-                except Exception as e:
-                    if tmp_path and os.path.exists(tmp_path):
-                        os.unlink(tmp_path)
-                    raise e # Re-raise to trigger transaction rollback
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            received = write_stream(session.upload_id, offset, request.stream, size)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if received != checksum:
+            # Not recorded, the chunk is missing until it is sent again
+            return Response({'error': 'Checksum mismatch', 'received': received}, status=status.HTTP_400_BAD_REQUEST)
+
+        ChunkedUpload.objects.update_or_create(
+            upload_id=session.upload_id, offset=offset,
+            defaults={'size': size, 'checksum': checksum, 'user': request.user},
+        )
+        advance_upload_hash(session.pk)
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def missing(self, request, upload_id=None):
+        session = self.get_object()
+        chunks = self.received_chunks(session)
+        total_size = session.total_size or max((offset + size for offset, size in chunks), default=0)
+        ranges = missing_ranges(chunks, total_size)
+        data = {
+            'received_bytes': total_size - sum(end - start for start, end in ranges),
+            'missing': [{'start': start, 'end': end} for start, end in ranges],
+        }
+        if session.chunk_size:
+            received = {offset for offset, _ in chunks}
+            data['missing_chunks'] = [
+                index for index in range(session.chunk_count) if index * session.chunk_size not in received
+            ]
+        return Response(data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, upload_id=None):
+        session = self.get_object()
+        if session.status != UploadSession.Status.UPLOADING:
+            return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+        if not session.chunk_size:
+            return Response({'error': 'This upload has no declared size, use complete_upload'}, status=status.HTTP_400_BAD_REQUEST)
+        ranges = missing_ranges(self.received_chunks(session), session.total_size)
+        if ranges:
+            return Response({
+                'error': 'Some chunks are missing',
+                'missing': [{'start': start, 'end': end} for start, end in ranges],
+            }, status=status.HTTP_400_BAD_REQUEST)
+        session = start_finalizing(session)
+        return finalizing_response(session)
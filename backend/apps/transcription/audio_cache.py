@@ -0,0 +1,187 @@
+from django.conf import settings
+import av
+import logging
+import numpy as np
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+
+class AudioCache:
+    """
+    Disk cache of decoded audio.
+
+    Each file is decoded once to 16 kHz mono 16-bit PCM and stored as a raw
+    sidecar that is opened with `np.memmap`, so retries, re-transcriptions
+    and long-audio windows read samples without going through PyAV again.
+    Least recently used sidecars are deleted when the cache grows beyond
+    `max_bytes`.
+    """
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.pcm")
+
+    @staticmethod
+    def key_for(file_obj):
+        return file_obj.content_hash or f"file_{file_obj.pk}"
+
+    def sidecar(self, file_obj):
+        """
+        Returns the path of the sidecar of `file_obj`, decoding the file first
+        if it is not cached.
+        """
+        path = self.path_for(self.key_for(file_obj))
+        try:
+            # Mark as recently used for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            self._decode(file_obj.file.path, path)
+            self.evict(keep=path)
+        return path
+
+    def load(self, file_obj):
+        """
+        Returns the int16 samples of `file_obj` as a read-only memory map,
+        decoding the file first if it is not cached.
+        """
+        path = self.sidecar(file_obj)
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=np.int16)
+        return np.memmap(path, dtype=np.int16, mode='r')
+
+    def waveform(self, file_obj, start=0.0, end=None, block_seconds=60):
+        """
+        Returns the float32 waveform of `file_obj` from `start` to `end`
+        seconds. The sidecar is read and converted a block at a time into the
+        result, so the int16 samples are never held next to it.
+        """
+        path = self.sidecar(file_obj)
+        count = os.path.getsize(path) // 2
+        first = min(count, int(start * SAMPLE_RATE))
+        last = count if end is None else min(count, int(end * SAMPLE_RATE))
+        audio = np.empty(max(0, last - first), dtype=np.float32)
+        block_size = block_seconds * SAMPLE_RATE
+        with open(path, 'rb') as f:
+            f.seek(first * 2)
+            for position in range(0, len(audio), block_size):
+                block = np.fromfile(f, dtype=np.int16, count=min(block_size, len(audio) - position))
+                np.multiply(block, np.float32(1 / 32768.0), out=audio[position:position + len(block)])
+        return audio
+
+    def head(self, file_obj, seconds):
+        """
+        Returns the first `seconds` of int16 samples. Uses the cached sidecar
+        if there is one, otherwise decodes only the beginning of the file.
+        """
+        count = int(seconds * SAMPLE_RATE)
+        path = self.path_for(self.key_for(file_obj))
+        try:
+            samples = np.memmap(path, dtype=np.int16, mode='r')
+            return np.array(samples[:count])
+        except (FileNotFoundError, ValueError):
+            pass
+
+        blocks = []
+        decoded = 0
+        for block in iter_pcm(file_obj.file.path):
+            blocks.append(block)
+            decoded += len(block)
+            if decoded >= count:
+                break
+        if not blocks:
+            return np.zeros(0, dtype=np.int16)
+        return np.concatenate(blocks)[:count]
+
+    def _decode(self, source_path, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for block in iter_pcm(source_path):
+                    out.write(block.tobytes())
+            # Publish atomically so concurrent workers never read a partial sidecar
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def evict(self, keep=None):
+        if not self.max_bytes:
+            return
+        with self._lock:
+            entries = []
+            for directory, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if not filename.endswith('.pcm'):
+                        continue
+                    path = os.path.join(directory, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                    total -= size
+                    logger.info("Evicted cached audio %s", path)
+                except FileNotFoundError:
+                    pass
+
+
+def iter_pcm(source_path):
+    """
+    Decodes an audio/video file and yields blocks of 16 kHz mono int16 samples.
+    """
+    resampler = av.audio.resampler.AudioResampler(format='s16', layout='mono', rate=SAMPLE_RATE)
+    with av.open(source_path, metadata_errors='ignore') as container:
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                yield resampled.to_ndarray().reshape(-1)
+        for resampled in resampler.resample(None):
+            yield resampled.to_ndarray().reshape(-1)
+
+
+_audio_cache = None
+
+
+def get_audio_cache():
+    global _audio_cache
+    if _audio_cache is None:
+        _audio_cache = AudioCache(
+            settings.AUDIO_CACHE_DIR,
+            max_bytes=getattr(settings, 'AUDIO_CACHE_MAX_MB', 0) * 1024 * 1024,
+        )
+    return _audio_cache
+
+
+def to_float32(samples):
+    """
+    Converts int16 PCM samples to the float32 [-1, 1] waveform the model expects.
+    """
+    audio = np.asarray(samples).astype(np.float32)
+    audio /= 32768.0
+    return audio
+
+
+def load_audio(file_obj, start=0.0, end=None):
+    """
+    Returns the float32 16 kHz mono waveform of `file_obj` (from `start` to
+    `end` seconds), decoded once and cached on disk.
+    """
+    return get_audio_cache().waveform(file_obj, start, end)
@@ -0,0 +1,186 @@
+from .long_audio import SAMPLE_RATE
+import concurrent.futures
+import datetime
+import multiprocessing
+import numpy as np
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+
+def synthesize_speech(seconds, sample_rate=SAMPLE_RATE, seed=0):
+    """
+    Returns a deterministic speech-like float32 waveform: voiced syllables with
+    a gliding pitch and formant-shaped harmonics, separated by short pauses,
+    over a low noise floor. It exercises the model like speech does without
+    shipping recordings.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    audio = np.zeros(total, dtype=np.float32)
+    position = 0
+
+    while position < total:
+        length = min(int(rng.uniform(0.12, 0.3) * sample_rate), total - position)
+        t = np.arange(length) / sample_rate
+        pitch = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(1, 3) * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+        formants = rng.uniform([300, 900, 2200], [900, 2200, 3200])
+
+        syllable = np.zeros(length)
+        for harmonic in range(1, 30):
+            frequency = harmonic * pitch
+            gain = sum(np.exp(-((frequency - formant) / 150) ** 2) for formant in formants) + 0.02
+            syllable += gain / np.sqrt(harmonic) * np.sin(harmonic * phase)
+        envelope = np.sqrt(np.sin(np.pi * (np.arange(length) + 0.5) / length))
+        audio[position:position + length] = syllable * envelope
+
+        pause = rng.choice([0.03, 0.05, 0.08, 0.4], p=[0.4, 0.3, 0.2, 0.1])
+        position += length + int(pause * sample_rate)
+
+    audio /= max(float(np.abs(audio).max()), 1e-9)
+    audio = 0.5 * audio + 0.005 * rng.standard_normal(total)
+    return audio.astype(np.float32)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_config(model_size, compute_type, cpu_threads, beam_sizes, durations, repeat=1, language='en'):
+    """
+    Loads one model configuration on the CPU and transcribes synthetic audio of
+    every duration with every beam size. Runs in a fresh process (see
+    `run_benchmark`) so the peak RSS belongs to this configuration only.
+    Models are only read from the local cache, nothing is downloaded.
+    """
+    from faster_whisper import WhisperModel
+    from .services import WhisperService
+
+    started = time.perf_counter()
+    model = WhisperModel(
+        model_size,
+        device='cpu',
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        local_files_only=True,
+    )
+    load_seconds = time.perf_counter() - started
+    load_rss_mb = peak_rss_mb()
+
+    service = WhisperService(model_size, device='cpu', compute_type=compute_type, model=model)
+    # Warm up so one-time allocations are not charged to the first run
+    service.transcribe(synthesize_speech(2.0), language=language, beam_size=1)
+
+    runs = []
+    for beam_size in beam_sizes:
+        for seconds in durations:
+            audio = synthesize_speech(seconds, seed=int(seconds))
+            wall_times, cpu_times = [], []
+            for _ in range(repeat):
+                wall_started, cpu_started = time.perf_counter(), time.process_time()
+                result = service.transcribe(audio, language=language, beam_size=beam_size)
+                wall_times.append(time.perf_counter() - wall_started)
+                cpu_times.append(time.process_time() - cpu_started)
+
+            wall = float(np.median(wall_times))
+            runs.append({
+                "beam_size": beam_size,
+                "audio_seconds": seconds,
+                "wall_seconds": round(wall, 3),
+                "wall_seconds_min": round(min(wall_times), 3),
+                "cpu_seconds": round(float(np.median(cpu_times)), 3),
+                "rtf": round(wall / seconds, 4),
+                "segments": len(result["segments"]),
+                "peak_rss_mb": peak_rss_mb(),
+            })
+
+    return {
+        "model_size": model_size,
+        "compute_type": compute_type,
+        "cpu_threads": cpu_threads,
+        "load_seconds": round(load_seconds, 3),
+        "load_peak_rss_mb": load_rss_mb,
+        "peak_rss_mb": peak_rss_mb(),
+        "runs": runs,
+    }
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    import ctranslate2
+    import faster_whisper
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "faster_whisper": faster_whisper.__version__,
+        "ctranslate2": ctranslate2.__version__,
+    }
+
+
+def run_benchmark(model_sizes, compute_types, beam_sizes, cpu_threads, durations, repeat=1, language='en',
+                  isolate=True, on_result=None):
+    """
+    Benchmarks every (model size, compute type, thread count) combination.
+    Each combination runs in its own spawned process unless `isolate` is False.
+    A combination that fails (e.g. the model is not cached locally) is
+    reported with its error instead of stopping the benchmark.
+    Returns a JSON-serializable report.
+    """
+    # Never reach out to the Hugging Face Hub, spawned processes inherit this
+    os.environ['HF_HUB_OFFLINE'] = '1'
+
+    results = []
+    for model_size in model_sizes:
+        for compute_type in compute_types:
+            for threads in cpu_threads:
+                args = (model_size, compute_type, threads, beam_sizes, durations, repeat, language)
+                try:
+                    if isolate:
+                        with concurrent.futures.ProcessPoolExecutor(
+                            max_workers=1, mp_context=multiprocessing.get_context('spawn')
+                        ) as executor:
+                            result = executor.submit(run_config, *args).result()
+                    else:
+                        result = run_config(*args)
+                except Exception as e:
+                    result = {
+                        "model_size": model_size,
+                        "compute_type": compute_type,
+                        "cpu_threads": threads,
+                        "error": f"{type(e).__name__}: {e}",
+                    }
+                results.append(result)
+                if on_result:
+                    on_result(result)
+
+    return {
+        "environment": environment_info(),
+        "parameters": {
+            "model_sizes": list(model_sizes),
+            "compute_types": list(compute_types),
+            "beam_sizes": list(beam_sizes),
+            "cpu_threads": list(cpu_threads),
+            "durations": list(durations),
+            "repeat": repeat,
+            "language": language,
+        },
+        "results": results,
+    }
@@ -0,0 +1,124 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+import json
+import logging
+import redis
+import redis.asyncio
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def user_channel(user_id):
+    return f"events:user:{user_id}"
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.EVENTS_REDIS_URL, socket_connect_timeout=2, socket_timeout=2)
+    return _client
+
+
+def publish(user_ids, event):
+    """
+    Publishes `event` (a dict with a "type") to the event channel of each user.
+    Never raises, status updates must not break the task that sends them.
+    """
+    data = json.dumps(event, default=str)
+    try:
+        client = get_redis()
+        for user_id in {user_id for user_id in user_ids if user_id}:
+            client.publish(user_channel(user_id), data)
+    except redis.RedisError as e:
+        logger.warning("Could not publish %s event: %s", event.get("type"), e)
+
+
+def publish_job(job, **changes):
+    """
+    Publishes the status of a transcription job to its file owner and submitter.
+    `changes` override fields that were updated in the database only.
+    """
+    event = {
+        "type": "transcription.job",
+        "id": job.pk,
+        "file": job.file_id,
+        "status": job.status,
+        "progress": job.progress,
+        "language": job.language,
+    }
+    event.update(changes)
+    publish([job.file.owner_id, job.submitted_by_id], event)
+
+
+def publish_analysis(analysis_request):
+    job = analysis_request.transcription_job
+    publish([job.file.owner_id], {
+        "type": "analysis.request",
+        "id": analysis_request.pk,
+        "transcription_job": job.pk,
+        "status": analysis_request.status,
+    })
+
+
+async def authenticate(request):
+    """
+    Authenticates with the usual JWT header, or a `token` query parameter
+    since browsers cannot set headers on an EventSource.
+    """
+    auth = JWTAuthentication()
+    raw_token = request.GET.get('token')
+    if raw_token is None:
+        header = auth.get_header(request)
+        raw_token = auth.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        validated_token = auth.get_validated_token(raw_token)
+        return await sync_to_async(auth.get_user)(validated_token)
+    except (InvalidToken, TokenError):
+        return None
+
+
+async def stream_events(user_id):
+    client = redis.asyncio.Redis.from_url(settings.EVENTS_REDIS_URL)
+    pubsub = client.pubsub()
+    await pubsub.subscribe(user_channel(user_id))
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=getattr(settings, 'EVENTS_KEEPALIVE_SECONDS', 15),
+            )
+            if message is None:
+                # Keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            data = message['data'].decode('utf-8')
+            yield f"event: {json.loads(data)['type']}\ndata: {data}\n\n"
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+        await client.aclose()
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events stream of the user's transcription job and analysis
+    status changes, published by the Celery tasks through Redis pub/sub.
+    Needs an ASGI server so idle connections do not hold a worker thread.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided or are invalid."}, status=401)
+
+    response = StreamingHttpResponse(stream_events(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Disable response buffering in nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
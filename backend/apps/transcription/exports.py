@@ -0,0 +1,72 @@
+from rest_framework import renderers
+import json
+
+EXPORT_CONTENT_TYPES = {
+    'srt': 'application/x-subrip; charset=utf-8',
+    'vtt': 'text/vtt; charset=utf-8',
+    'json': 'application/json',
+}
+
+
+def format_timestamp(seconds, decimal_marker):
+    milliseconds = int(round(max(0.0, seconds) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{decimal_marker}{milliseconds:03d}"
+
+
+def iter_srt(segments):
+    for number, segment in enumerate(segments, start=1):
+        yield (
+            f"{number}\n"
+            f"{format_timestamp(segment['start'], ',')} --> {format_timestamp(segment['end'], ',')}\n"
+            f"{segment['text'].strip()}\n\n"
+        )
+
+
+def iter_vtt(segments):
+    yield "WEBVTT\n\n"
+    for segment in segments:
+        # "-->" is not allowed in cue text
+        text = segment['text'].strip().replace('-->', '->')
+        yield (
+            f"{format_timestamp(segment['start'], '.')} --> {format_timestamp(segment['end'], '.')}\n"
+            f"{text}\n\n"
+        )
+
+
+def iter_json(segments):
+    yield "["
+    for number, segment in enumerate(segments):
+        prefix = "," if number else ""
+        yield prefix + json.dumps({
+            "index": segment['index'],
+            "start": segment['start'],
+            "end": segment['end'],
+            "text": segment['text'],
+        }, ensure_ascii=False)
+    yield "]"
+
+
+EXPORTERS = {
+    'srt': iter_srt,
+    'vtt': iter_vtt,
+    'json': iter_json,
+}
+
+
+class ExportRenderer(renderers.BaseRenderer):
+    """
+    Lets clients ask for subtitle media types (e.g. `Accept: text/vtt`).
+    The export itself is a StreamingHttpResponse that no renderer touches,
+    so only error responses get here: they are rendered as JSON.
+    """
+    media_type = '*/*'
+    format = 'export'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = renderers.JSONRenderer.media_type
+        return renderers.JSONRenderer().render(data, renderer_context=renderer_context)
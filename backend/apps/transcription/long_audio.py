@@ -0,0 +1,147 @@
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+
+
+def frame_energy(audio, sample_rate=SAMPLE_RATE, block_frames=10000):
+    """
+    Returns the RMS energy of consecutive FRAME_SECONDS frames of `audio`.
+    Works on float or int16 samples, in blocks so memory-mapped audio is
+    never converted as a whole.
+    """
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    frame_count = len(audio) // frame_length
+    energy = np.zeros(frame_count, dtype=np.float32)
+    for first in range(0, frame_count, block_frames):
+        last = min(frame_count, first + block_frames)
+        frames = np.asarray(audio[first * frame_length:last * frame_length]).reshape(last - first, frame_length)
+        energy[first:last] = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    return energy
+
+
+def find_split_points(audio, window_seconds, search_seconds, sample_rate=SAMPLE_RATE):
+    """
+    Picks cut points (in seconds) roughly every `window_seconds`.
+    Each cut is placed at the quietest frame within the `search_seconds`
+    before the target position, so words are not split in half.
+    """
+    duration = len(audio) / sample_rate
+    energy = frame_energy(audio, sample_rate)
+    cuts = []
+    last_cut = 0.0
+
+    while duration - last_cut > window_seconds:
+        target = last_cut + window_seconds
+        first_frame = int(max(last_cut + 1, target - search_seconds) / FRAME_SECONDS)
+        last_frame = max(first_frame + 1, int(target / FRAME_SECONDS))
+        candidates = energy[first_frame:last_frame]
+        if len(candidates):
+            cut = (first_frame + int(np.argmin(candidates)) + 0.5) * FRAME_SECONDS
+        else:
+            cut = target
+        cuts.append(round(cut, 3))
+        last_cut = cut
+
+    return cuts
+
+
+def plan_windows(audio, window_seconds, overlap_seconds, search_seconds, sample_rate=SAMPLE_RATE):
+    """
+    Splits the audio into windows cut at silences.
+
+    Each window "owns" the range between two cuts and is transcribed with
+    `overlap_seconds` of extra context on both sides. Segments decoded in the
+    overlap belong to the neighbouring window and are dropped when stitching.
+    """
+    duration = len(audio) / sample_rate
+    bounds = [0.0] + find_split_points(audio, window_seconds, search_seconds, sample_rate) + [duration]
+
+    windows = []
+    for index, (owned_start, owned_end) in enumerate(zip(bounds, bounds[1:])):
+        windows.append({
+            "index": index,
+            "start": max(0.0, owned_start - overlap_seconds),
+            "end": min(duration, owned_end + overlap_seconds),
+            "owned_start": owned_start,
+            "owned_end": owned_end,
+        })
+    return windows
+
+
+def owned_segments(segments, window):
+    """
+    Shifts the timestamps of a window's segments by the window start and keeps
+    the segments whose midpoint falls in the window's owned range, the others
+    belong to the neighbouring window.
+    """
+    owned = []
+    for segment in segments:
+        start = segment["start"] + window["start"]
+        end = segment["end"] + window["start"]
+        if window["owned_start"] <= (start + end) / 2 < window["owned_end"]:
+            owned.append({"start": round(start, 3), "end": round(max(start, end), 3), "text": segment["text"]})
+    return owned
+
+
+def window_progress(windows, duration):
+    """
+    Returns the progress (0-100) of a long recording from the owned ranges of
+    its transcribed `windows`, and the checkpoint: the end of the transcribed
+    audio counted from the start, without gaps.
+    """
+    done = sum(window["owned_end"] - window["owned_start"] for window in windows)
+    checkpoint = 0.0
+    for window in sorted(windows, key=lambda w: w["owned_start"]):
+        if window["owned_start"] > checkpoint:
+            break
+        checkpoint = max(checkpoint, window["owned_end"])
+    progress = round(min(100.0, done / duration * 100), 2) if duration else 0.0
+    return progress, checkpoint
+
+
+def stitch_results(windows, segments, duration):
+    """
+    Merges the windows of a long recording into the single-pass result shape
+    returned by `WhisperService.transcribe`.
+
+    `windows` are the transcribed windows with their language, `segments` the
+    owned segments of all windows (see `owned_segments`) sorted by start. A
+    segment repeating the previous one across a window boundary is skipped.
+    """
+    stitched = []
+    for segment in segments:
+        start = segment["start"]
+        if stitched:
+            previous = stitched[-1]
+            if segment["text"].strip() == previous["text"].strip() and start < previous["end"]:
+                continue
+            # Keep timestamps monotonic across window boundaries
+            start = max(start, previous["end"])
+        stitched.append({
+            "start": round(start, 3),
+            "end": round(max(start, segment["end"]), 3),
+            "text": segment["text"],
+        })
+
+    language_weights = {}
+    for window in windows:
+        owned = window["owned_end"] - window["owned_start"]
+        weight, probability = language_weights.get(window["language"], (0.0, 0.0))
+        language_weights[window["language"]] = (
+            weight + owned,
+            probability + owned * (window.get("language_probability") or 0.0),
+        )
+
+    language, language_probability = None, None
+    if language_weights:
+        language, (weight, probability) = max(language_weights.items(), key=lambda item: item[1][0])
+        language_probability = probability / weight if weight else None
+
+    return {
+        "language": language,
+        "language_probability": language_probability,
+        "duration": duration,
+        "text": " ".join(segment["text"] for segment in stitched).strip(),
+        "segments": stitched,
+    }
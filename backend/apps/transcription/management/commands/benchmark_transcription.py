@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.transcription.benchmark import run_benchmark
+import json
+
+
+def csv_list(cast):
+    def parse(value):
+        try:
+            return [cast(item.strip()) for item in value.split(',') if item.strip()]
+        except ValueError:
+            raise CommandError(f"Invalid list: {value}")
+    return parse
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks WhisperService.transcribe on synthetic speech-like audio (CPU only, "
+        "locally cached models) and writes real-time factor, peak RSS and load time as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', type=csv_list(str), default=['tiny'],
+                            help="Model sizes or local model directories, comma separated")
+        parser.add_argument('--compute-types', type=csv_list(str), default=['int8'])
+        parser.add_argument('--beam-sizes', type=csv_list(int), default=[1, 5])
+        parser.add_argument('--threads', type=csv_list(int), default=[1, 4])
+        parser.add_argument('--durations', type=csv_list(float), default=[10.0, 30.0, 60.0],
+                            help="Synthetic audio durations in seconds")
+        parser.add_argument('--repeat', type=int, default=1, help="Runs per measurement, the median is reported")
+        parser.add_argument('--language', default='en')
+        parser.add_argument('--no-isolate', action='store_true',
+                            help="Run in this process instead of one process per configuration")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        report = run_benchmark(
+            model_sizes=options['models'],
+            compute_types=options['compute_types'],
+            beam_sizes=options['beam_sizes'],
+            cpu_threads=options['threads'],
+            durations=options['durations'],
+            repeat=max(1, options['repeat']),
+            language=options['language'],
+            isolate=not options['no_isolate'],
+            on_result=self.log_result,
+        )
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Benchmark report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def log_result(self, result):
+        config = f"{result['model_size']} {result['compute_type']} threads={result['cpu_threads']}"
+        if 'error' in result:
+            self.stderr.write(self.style.ERROR(f"{config}: {result['error']}"))
+            return
+        self.stderr.write(f"{config}: loaded in {result['load_seconds']}s, peak RSS {result['peak_rss_mb']} MB")
+        for run in result['runs']:
+            self.stderr.write(
+                f"  beam={run['beam_size']} {run['audio_seconds']}s audio: "
+                f"RTF {run['rtf']} ({run['wall_seconds']}s wall, {run['cpu_seconds']}s CPU)"
+            )
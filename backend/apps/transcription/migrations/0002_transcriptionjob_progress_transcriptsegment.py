@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcription', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriptSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField(help_text='Position of the segment in the transcript')),
+                ('start', models.FloatField(help_text='Start time in seconds')),
+                ('end', models.FloatField(help_text='End time in seconds')),
+                ('text', models.TextField()),
+            ],
+            options={
+                'ordering': ['job', 'index'],
+            },
+        ),
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='progress',
+            field=models.FloatField(default=0, help_text='Percentage of the audio transcribed so far'),
+        ),
+        migrations.AddField(
+            model_name='transcriptsegment',
+            name='job',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='transcription.transcriptionjob'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='transcriptsegment',
+            unique_together={('job', 'index')},
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcription', '0002_transcriptionjob_progress_transcriptsegment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='batch_pending',
+            field=models.BooleanField(default=False, help_text='Waiting to be picked up by the batching worker'),
+        ),
+        migrations.AddIndex(
+            model_name='transcriptionjob',
+            index=models.Index(fields=['batch_pending', 'created_at'], name='transcripti_batch_p_72be84_idx'),
+        ),
+    ]
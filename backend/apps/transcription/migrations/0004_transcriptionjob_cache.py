@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcription', '0003_transcriptionjob_batch_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='cache_source',
+            field=models.ForeignKey(blank=True, help_text='Job whose result was reused for identical content', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cache_hits', to='transcription.transcriptionjob'),
+        ),
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='cpu_seconds',
+            field=models.FloatField(blank=True, help_text='CPU time spent transcribing', null=True),
+        ),
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='cpu_seconds_saved',
+            field=models.FloatField(default=0, help_text='CPU time saved by reusing a cached result'),
+        ),
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='model_size',
+            field=models.CharField(blank=True, default='', help_text='Whisper model used for the transcription', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='requested_language',
+            field=models.CharField(blank=True, help_text='Language specified at submission, empty for auto-detection', max_length=50, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0003_file_content_hash'),
+        ('transcription', '0004_transcriptionjob_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LanguageDetection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('language', models.CharField(blank=True, max_length=50, null=True)),
+                ('language_probability', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='languagedetection',
+            name='file',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='language_detection', to='media.file'),
+        ),
+    ]
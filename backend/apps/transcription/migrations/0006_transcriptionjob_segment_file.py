@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcription', '0005_languagedetection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='segment_file',
+            field=models.FileField(blank=True, help_text='Final segments in columnar form, see segment_store', upload_to='transcripts/%Y/%m/%d/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcription', '0006_transcriptionjob_segment_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='checkpoint_offset',
+            field=models.FloatField(default=0, help_text='Audio position (seconds) up to which segments are stored'),
+        ),
+    ]
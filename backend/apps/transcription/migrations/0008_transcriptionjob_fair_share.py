@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_existing_jobs_dispatched(apps, schema_editor):
+    # Jobs created before the dispatcher were sent to the workers right away
+    TranscriptionJob = apps.get_model('transcription', 'TranscriptionJob')
+    File = apps.get_model('media', 'File')
+    TranscriptionJob.objects.update(
+        dispatched_at=models.F('created_at'),
+        submitted_by=models.Subquery(File.objects.filter(pk=models.OuterRef('file')).values('owner')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media', '0003_file_content_hash'),
+        ('transcription', '0007_transcriptionjob_checkpoint_offset'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, help_text='When the fair-share dispatcher sent the job to the workers', null=True),
+        ),
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='submitted_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transcription_jobs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='transcriptionjob',
+            index=models.Index(fields=['submitted_by', 'dispatched_at', 'status'], name='transcripti_submitt_4de88f_idx'),
+        ),
+        migrations.RunPython(mark_existing_jobs_dispatched, migrations.RunPython.noop),
+    ]
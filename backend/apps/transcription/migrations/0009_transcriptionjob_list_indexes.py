@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcription', '0008_transcriptionjob_fair_share'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transcriptionjob',
+            index=models.Index(fields=['status'], name='transcripti_status_78a1b8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transcriptionjob',
+            index=models.Index(fields=['file'], name='transcripti_file_id_a3f059_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transcriptionjob',
+            index=models.Index(fields=['created_at'], name='transcripti_created_56fccb_idx'),
+        ),
+    ]
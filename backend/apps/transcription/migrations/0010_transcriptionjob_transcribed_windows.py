@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcription', '0009_transcriptionjob_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcriptionjob',
+            name='transcribed_windows',
+            field=models.JSONField(blank=True, default=dict, help_text='Long recordings: windows stored so far, by index, with their language and CPU time'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+from rest_framework import serializers
+from rest_framework.response import Response
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Keeps only the fields listed in the `fields` serializer context entry.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields:
+            unknown = set(fields) - set(self.fields)
+            if unknown:
+                raise serializers.ValidationError({"fields": f"Unknown fields: {', '.join(sorted(unknown))}"})
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsViewMixin:
+    """
+    Sparse fieldsets for list and retrieve.
+
+    - `?fields=id,status` returns only those fields.
+    - `?ids=1,2,3` is a batch status lookup: only those objects, with
+      `status_fields`, unpaginated.
+    - Otherwise list responses leave out `list_exclude` (large text columns).
+
+    Only the database columns needed by the selected fields are read.
+    """
+    list_exclude = ()
+    status_fields = ('id', 'status')
+    max_ids = 100
+
+    def get_requested_fields(self):
+        if self.action not in ('list', 'retrieve'):
+            return None
+        fields = self.request.query_params.get('fields')
+        if fields:
+            return [name.strip() for name in fields.split(',') if name.strip()]
+        if self.action == 'list' and 'ids' in self.request.query_params:
+            return list(self.status_fields)
+        if self.action == 'list':
+            return [name for name in self.get_serializer_class().Meta.fields if name not in self.list_exclude]
+        return None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_requested_fields()
+        return context
+
+    def get_requested_ids(self):
+        try:
+            ids = [int(pk) for pk in self.request.query_params['ids'].split(',') if pk.strip()]
+        except ValueError:
+            raise serializers.ValidationError({"ids": "ids must be a comma separated list of integers."})
+        if len(ids) > self.max_ids:
+            raise serializers.ValidationError({"ids": f"At most {self.max_ids} ids are allowed."})
+        return ids
+
+    def sparse_queryset(self, queryset):
+        """
+        Restricts `queryset` to the columns (and joins) the selected fields need.
+        """
+        if self.get_requested_fields() is None:
+            return queryset
+
+        model_fields = {field.name: field for field in queryset.model._meta.concrete_fields}
+        columns = {queryset.model._meta.pk.name}
+        related = []
+        for field in self.get_serializer().fields.values():
+            name = field.source.split('.')[0]
+            if name not in model_fields:
+                continue
+            columns.add(name)
+            if isinstance(field, serializers.BaseSerializer) and model_fields[name].is_relation:
+                # Nested serializer, join it and the relations its fields go through
+                related.append(name)
+                child = getattr(field, 'child', field)
+                related.extend(
+                    f"{name}__{sub_field.source.split('.')[0]}"
+                    for sub_field in child.fields.values() if '.' in sub_field.source
+                )
+        queryset = queryset.only(*columns)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        if 'ids' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).filter(pk__in=self.get_requested_ids())
+        return Response(self.get_serializer(queryset, many=True).data)
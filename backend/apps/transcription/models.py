@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.db import models
 from apps.media.models import File
+from .segment_store import SegmentIndex
 
 class TranscriptionJob(models.Model):
     class Status(models.TextChoices):
@@ -9,23 +11,78 @@ class TranscriptionJob(models.Model):
         FAILED = 'FAILED', 'Failed'
 
     file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='transcription_jobs')
+    submitted_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='transcription_jobs')
     status = models.CharField(
         max_length=20,
         choices=Status.choices,
         default=Status.PENDING
     )
     language = models.CharField(max_length=50, blank=True, null=True, help_text="Detected or specified language")
+    requested_language = models.CharField(max_length=50, blank=True, null=True, help_text="Language specified at submission, empty for auto-detection")
+    model_size = models.CharField(max_length=50, blank=True, default='', help_text="Whisper model used for the transcription")
     transcript_text = models.TextField(blank=True, null=True, help_text="JSON or plain text transcript")
+    progress = models.FloatField(default=0, help_text="Percentage of the audio transcribed so far")
+    checkpoint_offset = models.FloatField(default=0, help_text="Audio position (seconds) up to which segments are stored")
+    segment_file = models.FileField(upload_to='transcripts/%Y/%m/%d/', blank=True, help_text="Final segments in columnar form, see segment_store")
+    transcribed_windows = models.JSONField(default=dict, blank=True, help_text="Long recordings: windows stored so far, by index, with their language and CPU time")
+    batch_pending = models.BooleanField(default=False, help_text="Waiting to be picked up by the batching worker")
     created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(blank=True, null=True, help_text="When the fair-share dispatcher sent the job to the workers")
     completed_at = models.DateTimeField(blank=True, null=True)
     error_message = models.TextField(blank=True, null=True)
+    cache_source = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='cache_hits', help_text="Job whose result was reused for identical content")
+    cpu_seconds = models.FloatField(blank=True, null=True, help_text="CPU time spent transcribing")
+    cpu_seconds_saved = models.FloatField(default=0, help_text="CPU time saved by reusing a cached result")
 
     class Meta:
         indexes = [
             models.Index(fields=['status']),
             models.Index(fields=['file']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['batch_pending', 'created_at']),
+            models.Index(fields=['submitted_by', 'dispatched_at', 'status']),
         ]
 
+    def get_segment_index(self):
+        """
+        Returns a memory-mapped SegmentIndex of the final segments, or None
+        while the job is running (segments are then in TranscriptSegment rows).
+        """
+        if not self.segment_file:
+            return None
+        return SegmentIndex(self.segment_file.path)
+
     def __str__(self):
         return f"Job {self.id} for {self.file.name} ({self.status})"
+
+
+class TranscriptSegment(models.Model):
+    job = models.ForeignKey(TranscriptionJob, on_delete=models.CASCADE, related_name='segments')
+    index = models.PositiveIntegerField(help_text="Position of the segment in the transcript")
+    start = models.FloatField(help_text="Start time in seconds")
+    end = models.FloatField(help_text="End time in seconds")
+    text = models.TextField()
+
+    class Meta:
+        ordering = ['job', 'index']
+        unique_together = ('job', 'index')
+
+    def __str__(self):
+        return f"Segment {self.index} of Job {self.job_id}"
+
+
+class LanguageDetection(models.Model):
+    file = models.OneToOneField(File, on_delete=models.CASCADE, related_name='language_detection')
+    status = models.CharField(
+        max_length=20,
+        choices=TranscriptionJob.Status.choices,
+        default=TranscriptionJob.Status.PENDING
+    )
+    language = models.CharField(max_length=50, blank=True, null=True)
+    language_probability = models.FloatField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    error_message = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Language detection for {self.file.name} ({self.status})"
@@ -0,0 +1,113 @@
+import numpy as np
+
+# File layout (little endian):
+#   8 bytes  MAGIC
+#   8 bytes  segment count n (uint64)
+#   n float32  start times
+#   n float32  end times
+#   n float32  running maximum of the end times (searchable even if ends overlap)
+#   n+1 uint32 offsets of each segment's text in the blob
+#   UTF-8 text blob
+MAGIC = b'TSEG0001'
+HEADER_SIZE = 16
+
+
+def pack_segments(segments):
+    """
+    Serializes a list of {"start", "end", "text"} dicts into the columnar format.
+    """
+    count = len(segments)
+    starts = np.array([segment["start"] for segment in segments], dtype='<f4')
+    ends = np.array([segment["end"] for segment in segments], dtype='<f4')
+    end_max = np.maximum.accumulate(ends) if count else ends
+    texts = [segment["text"].encode('utf-8') for segment in segments]
+    offsets = np.zeros(count + 1, dtype='<u4')
+    if count:
+        np.cumsum([len(text) for text in texts], out=offsets[1:])
+
+    return b''.join([
+        MAGIC,
+        np.array([count], dtype='<u8').tobytes(),
+        starts.tobytes(),
+        ends.tobytes(),
+        end_max.tobytes(),
+        offsets.tobytes(),
+        b''.join(texts),
+    ])
+
+
+class SegmentIndex:
+    """
+    Read-only, memory-mapped view of a packed transcript.
+
+    Supports `len()`, integer and slice indexing (so it can be paginated like
+    a queryset) and time-window lookups by binary search, without reading
+    the rest of the file.
+    """
+    def __init__(self, path, first=0, last=None):
+        self.path = path
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self._data[:8]) != MAGIC:
+            raise ValueError(f"Not a transcript segment file: {path}")
+        count = int(self._data[8:16].view('<u8')[0])
+
+        position = HEADER_SIZE
+        self._starts = self._data[position:position + 4 * count].view('<f4')
+        position += 4 * count
+        self._ends = self._data[position:position + 4 * count].view('<f4')
+        position += 4 * count
+        self._end_max = self._data[position:position + 4 * count].view('<f4')
+        position += 4 * count
+        self._offsets = self._data[position:position + 4 * (count + 1)].view('<u4')
+        position += 4 * (count + 1)
+        self._text_start = position
+
+        self.first = first
+        self.last = count if last is None else min(last, count)
+
+    def _view(self, first, last):
+        view = object.__new__(SegmentIndex)
+        view.__dict__.update(self.__dict__)
+        view.first, view.last = first, max(first, last)
+        return view
+
+    def __len__(self):
+        return max(0, self.last - self.first)
+
+    def _segment(self, i):
+        text_first = self._text_start + int(self._offsets[i])
+        text_last = self._text_start + int(self._offsets[i + 1])
+        return {
+            "index": i,
+            "start": round(float(self._starts[i]), 3),
+            "end": round(float(self._ends[i]), 3),
+            "text": bytes(self._data[text_first:text_last]).decode('utf-8'),
+        }
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            first, last, _ = key.indices(len(self))
+            return [self._segment(i) for i in range(self.first + first, self.first + last)]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return self._segment(self.first + key)
+
+    def __iter__(self):
+        for i in range(self.first, self.last):
+            yield self._segment(i)
+
+    def after(self, index):
+        """
+        Returns the segments with an index greater than `index`.
+        """
+        return self._view(max(self.first, index + 1), self.last)
+
+    def window(self, start, end):
+        """
+        Returns the segments overlapping the [start, end) time range.
+        """
+        first = int(np.searchsorted(self._end_max[self.first:self.last], start, side='right')) + self.first
+        last = int(np.searchsorted(self._starts[self.first:self.last], end, side='left')) + self.first
+        return self._view(first, last)
@@ -1,15 +1,50 @@
 from rest_framework import serializers
-from .models import TranscriptionJob
+from .models import TranscriptionJob, TranscriptSegment, LanguageDetection
 from apps.media.serializers import FileSerializer
+from .mixins import SparseFieldsSerializerMixin
+from .services import WHISPER_LANGUAGE_CODES
 
-class TranscriptionJobSerializer(serializers.ModelSerializer):
+class TranscriptionJobSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     file_details = FileSerializer(source='file', read_only=True)
 
     class Meta:
         model = TranscriptionJob
-        fields = ('id', 'file', 'file_details', 'status', 'language', 'transcript_text', 'created_at', 'completed_at', 'error_message')
-        read_only_fields = ('id', 'status', 'language', 'transcript_text', 'created_at', 'completed_at', 'error_message')
+        fields = ('id', 'file', 'file_details', 'status', 'progress', 'language', 'model_size', 'transcript_text', 'created_at', 'dispatched_at', 'completed_at', 'error_message', 'cache_source', 'cpu_seconds', 'cpu_seconds_saved')
+        read_only_fields = ('id', 'status', 'progress', 'language', 'model_size', 'transcript_text', 'created_at', 'dispatched_at', 'completed_at', 'error_message', 'cache_source', 'cpu_seconds', 'cpu_seconds_saved')
+
+class TranscriptSegmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TranscriptSegment
+        fields = ('index', 'start', 'end', 'text')
+
+class LanguageDetectionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LanguageDetection
+        fields = ('file', 'status', 'language', 'language_probability', 'created_at', 'completed_at', 'error_message')
+        read_only_fields = fields
 
 class TranscriptionSubmissionSerializer(serializers.Serializer):
     file_id = serializers.IntegerField()
-    language = serializers.CharField(required=False, allow_null=True)
+    language = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+    def validate_language(self, value):
+        if not value:
+            return None
+        value = value.strip().lower()
+        if value not in WHISPER_LANGUAGE_CODES:
+            raise serializers.ValidationError(f"Unsupported language code: {value}")
+        return value
+
+class BulkTranscriptionSubmissionSerializer(TranscriptionSubmissionSerializer):
+    file_id = None
+    folder_id = serializers.IntegerField(required=False)
+    recursive = serializers.BooleanField(default=True)
+    file_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=1000)
+
+    def validate(self, attrs):
+        if ('folder_id' in attrs) == ('file_ids' in attrs):
+            raise serializers.ValidationError("Provide either folder_id or file_ids.")
+        return attrs
+
+class LanguageDetectionRequestSerializer(serializers.Serializer):
+    file_id = serializers.IntegerField()
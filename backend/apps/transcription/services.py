@@ -1,26 +1,202 @@
-from faster_whisper import WhisperModel
+from faster_whisper import WhisperModel, BatchedInferencePipeline
+from faster_whisper.audio import decode_audio
+from bisect import bisect_right
+from collections import OrderedDict
+from .long_audio import find_split_points
+import av
+import numpy as np
+from django.conf import settings
+import logging
 import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Approximate resident size (MB) of each model with float32 weights.
+# Quantized compute types shrink this, see COMPUTE_TYPE_FACTORS.
+MODEL_MEMORY_MB = {
+    'tiny': 75,
+    'tiny.en': 75,
+    'base': 145,
+    'base.en': 145,
+    'small': 485,
+    'small.en': 485,
+    'distil-small.en': 335,
+    'medium': 1530,
+    'medium.en': 1530,
+    'distil-medium.en': 790,
+    'large-v1': 3090,
+    'large-v2': 3090,
+    'large-v3': 3090,
+    'large': 3090,
+    'distil-large-v2': 1510,
+    'distil-large-v3': 1510,
+    'large-v3-turbo': 1620,
+    'turbo': 1620,
+}
+
+COMPUTE_TYPE_FACTORS = {
+    'float32': 1.0,
+    'float16': 0.5,
+    'bfloat16': 0.5,
+    'int8_float32': 0.3,
+    'int8_float16': 0.3,
+    'int8_bfloat16': 0.3,
+    'int8': 0.25,
+}
+
+# Language codes Whisper's multilingual models can transcribe, one token each
+# in the model vocabulary. Kept here since faster-whisper only exposes them on
+# a loaded model (WhisperModel.supported_languages).
+WHISPER_LANGUAGE_CODES = frozenset({
+    'af', 'am', 'ar', 'as', 'az', 'ba', 'be', 'bg', 'bn', 'bo', 'br', 'bs', 'ca', 'cs', 'cy', 'da',
+    'de', 'el', 'en', 'es', 'et', 'eu', 'fa', 'fi', 'fo', 'fr', 'gl', 'gu', 'ha', 'haw', 'he', 'hi',
+    'hr', 'ht', 'hu', 'hy', 'id', 'is', 'it', 'ja', 'jw', 'ka', 'kk', 'km', 'kn', 'ko', 'la', 'lb',
+    'ln', 'lo', 'lt', 'lv', 'mg', 'mi', 'mk', 'ml', 'mn', 'mr', 'ms', 'mt', 'my', 'ne', 'nl', 'nn',
+    'no', 'oc', 'pa', 'pl', 'ps', 'pt', 'ro', 'ru', 'sa', 'sd', 'si', 'sk', 'sl', 'sn', 'so', 'sq',
+    'sr', 'su', 'sv', 'sw', 'ta', 'te', 'tg', 'th', 'tk', 'tl', 'tr', 'tt', 'uk', 'ur', 'uz', 'vi',
+    'yi', 'yo', 'zh', 'yue',
+})
+
+
+class WhisperModelPool:
+    """
+    Process-resident registry of loaded Whisper models.
+
+    Models are keyed by (model_size, device, compute_type) and kept until the
+    estimated resident memory exceeds `max_memory_mb`, at which point the least
+    recently used models are evicted.
+    """
+    def __init__(self, max_memory_mb=None, loader=None):
+        self.max_memory_mb = max_memory_mb
+        self._loader = loader or WhisperModel
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def estimate_memory_mb(model_size, compute_type):
+        base = MODEL_MEMORY_MB.get(os.path.basename(str(model_size)).lower(), MODEL_MEMORY_MB['large-v3'])
+        return base * COMPUTE_TYPE_FACTORS.get(compute_type, 1.0)
+
+    @property
+    def resident_memory_mb(self):
+        return sum(memory_mb for _, memory_mb in self._models.values())
+
+    def get(self, model_size, device="cpu", compute_type="int8"):
+        key = (model_size, device, compute_type)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key][0]
+
+            memory_mb = self.estimate_memory_mb(model_size, compute_type)
+            self._evict_for(memory_mb)
+
+            logger.info("Loading Whisper model %s (device=%s, compute_type=%s)", model_size, device, compute_type)
+            model = self._loader(model_size, device=device, compute_type=compute_type)
+            self._models[key] = (model, memory_mb)
+            self.loads += 1
+            return model
+
+    def _evict_for(self, memory_mb):
+        if not self.max_memory_mb:
+            return
+        # Always keep room for the requested model, even if it alone exceeds the cap.
+        while self._models and self.resident_memory_mb + memory_mb > self.max_memory_mb:
+            key, _ = self._models.popitem(last=False)
+            self.evictions += 1
+            logger.info("Evicted Whisper model %s (device=%s, compute_type=%s)", *key)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loads": self.loads,
+                "hits": self.hits,
+                "evictions": self.evictions,
+                "resident_models": [list(key) for key in self._models],
+                "resident_memory_mb": round(self.resident_memory_mb, 1),
+                "max_memory_mb": self.max_memory_mb,
+            }
+
+
+_model_pool = None
+_model_pool_lock = threading.Lock()
+
+
+def get_model_pool():
+    """
+    Returns the per-process model pool, creating it on first use.
+    """
+    global _model_pool
+    if _model_pool is None:
+        with _model_pool_lock:
+            if _model_pool is None:
+                _model_pool = WhisperModelPool(
+                    max_memory_mb=getattr(settings, 'WHISPER_MODEL_POOL_MAX_MB', None)
+                )
+    return _model_pool
+
+
+def get_media_duration(file_path):
+    """
+    Returns the duration of an audio/video file in seconds, read from the
+    container header without decoding the audio. Returns None if unknown.
+    """
+    with av.open(file_path) as container:
+        if container.duration:
+            return container.duration / av.time_base
+        for stream in container.streams.audio:
+            if stream.duration and stream.time_base:
+                return float(stream.duration * stream.time_base)
+    return None
+
 
 class WhisperService:
-    def __init__(self, model_size="base", device="cpu", compute_type="int8"):
+    def __init__(self, model_size=None, device=None, compute_type=None, model=None):
         # In production, device should be "cuda" if GPU is available.
         # compute_type="int8" is good for CPU/low-resource.
-        self.model = WhisperModel(model_size, device=device, compute_type=compute_type)
+        self.model_size = model_size or getattr(settings, 'WHISPER_MODEL_SIZE', 'base')
+        self.device = device or getattr(settings, 'WHISPER_DEVICE', 'cpu')
+        self.compute_type = compute_type or getattr(settings, 'WHISPER_COMPUTE_TYPE', 'int8')
+        # An explicit model (e.g. loaded by the benchmark) bypasses the pool
+        self.model = model or get_model_pool().get(self.model_size, device=self.device, compute_type=self.compute_type)
 
-    def transcribe(self, file_path):
+    def transcribe(self, audio, language=None, on_segments=None, batch_size=50, clip_start=0.0, initial_prompt=None,
+                   beam_size=5):
         """
-        Transcribes the given audio/video file.
+        Transcribes the given audio/video file, or a 16 kHz float32 waveform.
         Returns a dictionary with text and segments.
+
+        `language` skips auto-detection when given (e.g. "en").
+        If `on_segments` is given, it is called with each batch of up to
+        `batch_size` new segments, the progress (0-100) reached so far and the
+        language, while the model is still decoding.
+        `clip_start` (seconds) starts decoding later in the audio, e.g. to resume
+        from a checkpoint; timestamps stay relative to the start of the audio.
         """
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File not found: {file_path}")
+        if isinstance(audio, str) and not os.path.exists(audio):
+            raise FileNotFoundError(f"File not found: {audio}")
+
+        segments, info = self.model.transcribe(
+            audio,
+            language=language or None,
+            beam_size=beam_size,
+            clip_timestamps=[clip_start] if clip_start else "0",
+            initial_prompt=initial_prompt,
+        )
 
-        segments, info = self.model.transcribe(file_path, beam_size=5)
-        
         # Collect segments generator into a list
         segment_list = []
-        full_text = ""
-        
+        batch = []
+
         for segment in segments:
             segment_data = {
                 "start": segment.start,
@@ -28,12 +204,117 @@ class WhisperService:
                 "text": segment.text
             }
             segment_list.append(segment_data)
-            full_text += segment.text + " "
+            batch.append(segment_data)
+            if on_segments and len(batch) >= batch_size:
+                on_segments(batch, self._progress(segment.end, info.duration), info.language)
+                batch = []
+
+        if on_segments and batch:
+            on_segments(batch, 100.0, info.language)
 
         return {
             "language": info.language,
             "language_probability": info.language_probability,
             "duration": info.duration,
-            "text": full_text.strip(),
+            "text": " ".join(segment["text"] for segment in segment_list).strip(),
             "segments": segment_list
         }
+
+    def detect_language(self, audio):
+        """
+        Detects the spoken language from the first 30 seconds of a 16 kHz
+        float32 waveform. Returns the language and its probability.
+        """
+        if not self.model.model.is_multilingual:
+            return {"language": "en", "language_probability": 1.0}
+        audio = audio[:self.model.feature_extractor.n_samples]
+        language, probability, _ = self.model.detect_language(audio=audio)
+        return {"language": language, "language_probability": probability}
+
+    def transcribe_batch(self, audios, languages=None, batch_size=8):
+        """
+        Transcribes several short clips with faster-whisper's batched pipeline.
+
+        The clips are concatenated and handed to the pipeline as explicit clip
+        timestamps (at most 30 seconds each), so chunks from different files
+        share encoder/decoder batches. Clips without a language are detected
+        one by one, then each language group is decoded in one call.
+        `audios` are file paths or 16 kHz float32 waveforms.
+        Returns one result per clip, in the shape of `transcribe`.
+        """
+        languages = list(languages or [None] * len(audios))
+        sampling_rate = self.model.feature_extractor.sampling_rate
+        audios = list(audios)
+        for i, audio in enumerate(audios):
+            if isinstance(audio, str):
+                if not os.path.exists(audio):
+                    raise FileNotFoundError(f"File not found: {audio}")
+                audios[i] = decode_audio(audio, sampling_rate=sampling_rate)
+
+        probabilities = [1.0 if language else None for language in languages]
+        for i, audio in enumerate(audios):
+            if languages[i] is None:
+                if self.model.model.is_multilingual:
+                    languages[i], probabilities[i], _ = self.model.detect_language(audio=audio)
+                else:
+                    languages[i], probabilities[i] = "en", 1.0
+
+        results = [None] * len(audios)
+        for language in set(languages):
+            indexes = [i for i, clip_language in enumerate(languages) if clip_language == language]
+            group = self._transcribe_group([audios[i] for i in indexes], language, batch_size)
+            for i, result in zip(indexes, group):
+                result["language_probability"] = probabilities[i]
+                results[i] = result
+        return results
+
+    def _transcribe_group(self, audios, language, batch_size):
+        sampling_rate = self.model.feature_extractor.sampling_rate
+        chunk_length = self.model.feature_extractor.chunk_length
+
+        clips = []
+        clip_timestamps = []
+        offset = 0.0
+        for audio in audios:
+            duration = len(audio) / sampling_rate
+            bounds = [0.0] + find_split_points(audio, chunk_length, chunk_length / 3, sampling_rate) + [duration]
+            for start, end in zip(bounds, bounds[1:]):
+                if end > start:
+                    clip_timestamps.append({"start": offset + start, "end": offset + end})
+            clips.append((offset, duration))
+            offset += duration
+
+        results = [
+            {"language": language, "language_probability": None, "duration": duration, "segments": []}
+            for _, duration in clips
+        ]
+        if clip_timestamps:
+            pipeline = BatchedInferencePipeline(model=self.model)
+            segments, _ = pipeline.transcribe(
+                np.concatenate(audios),
+                language=language,
+                beam_size=5,
+                batch_size=batch_size,
+                clip_timestamps=clip_timestamps,
+                without_timestamps=False,
+            )
+            clip_starts = [clip_offset for clip_offset, _ in clips]
+            for segment in segments:
+                # Map the segment back to its clip by midpoint
+                index = max(0, bisect_right(clip_starts, (segment.start + segment.end) / 2) - 1)
+                clip_offset, duration = clips[index]
+                results[index]["segments"].append({
+                    "start": max(0.0, segment.start - clip_offset),
+                    "end": min(duration, segment.end - clip_offset),
+                    "text": segment.text
+                })
+
+        for result in results:
+            result["text"] = " ".join(segment["text"] for segment in result["segments"]).strip()
+        return results
+
+    @staticmethod
+    def _progress(position, duration):
+        if not duration:
+            return 0.0
+        return round(min(100.0, position / duration * 100), 2)
@@ -1,51 +1,598 @@
-from celery import shared_task
+from celery import shared_task, chord, group
+from celery.signals import worker_process_init
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Max, Min
 from django.utils import timezone
-from .models import TranscriptionJob
-from .services import WhisperService
+from .events import publish_job
+from .audio_cache import get_audio_cache, load_audio, to_float32
+from .models import TranscriptionJob, TranscriptSegment, LanguageDetection
+from .services import WhisperService, get_model_pool, get_media_duration
+from .segment_store import pack_segments
+from . import long_audio
+from bisect import bisect_left
+from datetime import timedelta
 import json
+import logging
+import time
 import traceback
 
-@shared_task(bind=True, max_retries=3, default_retry_delay=60)
-def run_transcription(self, job_id):
-    import traceback
+logger = logging.getLogger(__name__)
+
+
+@worker_process_init.connect
+def preload_whisper_models(**kwargs):
+    """
+    Loads the configured models once per worker process so the first job
+    does not pay for reading the weights from disk.
+    """
+    pool = get_model_pool()
+    for model_size in getattr(settings, 'WHISPER_PRELOAD_MODELS', []):
+        try:
+            pool.get(
+                model_size,
+                device=getattr(settings, 'WHISPER_DEVICE', 'cpu'),
+                compute_type=getattr(settings, 'WHISPER_COMPUTE_TYPE', 'int8'),
+            )
+        except Exception:
+            logger.exception("Failed to preload Whisper model %s", model_size)
+
+
+@shared_task
+def whisper_model_pool_stats():
+    """
+    Returns the load/hit/eviction counters of the worker process that runs it.
+    """
+    return get_model_pool().stats()
+
+
+def save_segments(job, segments, start_index=0):
+    TranscriptSegment.objects.bulk_create([
+        TranscriptSegment(
+            job=job,
+            index=start_index + i,
+            start=segment['start'],
+            end=segment['end'],
+            text=segment['text'],
+        )
+        for i, segment in enumerate(segments)
+    ])
+
+
+def complete_job(job, result, cpu_seconds=None):
+    if 'segments' in result:
+        # Final segments go to the compact columnar file, the rows were only
+        # needed to follow the job while it was running
+        job.segment_file.save(f"job_{job.pk}.seg", ContentFile(pack_segments(result['segments'])), save=False)
+    job.status = TranscriptionJob.Status.COMPLETED
+    job.cpu_seconds = cpu_seconds
+    job.language = result.get('language')
+    job.transcript_text = result.get('text', '') # Store plain text
+    job.progress = 100
+    job.completed_at = timezone.now()
+    job.save()
+    publish_job(job)
+    if job.segment_file:
+        job.segments.all().delete()
+    # The submitter has a free slot again
+    dispatch_transcriptions.delay()
+
+
+def fail_job(job, exc, tb=None):
+    job.status = TranscriptionJob.Status.FAILED
+    job.error_message = str(exc) + "\n" + (tb or traceback.format_exc())
+    # Only touch the failure fields, progress and checkpoint are updated
+    # directly in the database while the job runs
+    job.save(update_fields=['status', 'error_message'])
+    publish_job(job)
+    dispatch_transcriptions.delay()
+
+
+def find_cached_result(job):
+    """
+    Returns a completed job for identical content, transcribed with the same
+    model and requested language, whose result can be reused.
+    """
+    if not getattr(settings, 'TRANSCRIPTION_CACHE_ENABLED', True) or not job.file.content_hash:
+        return None
+    return (
+        TranscriptionJob.objects
+        .filter(
+            status=TranscriptionJob.Status.COMPLETED,
+            file__content_hash=job.file.content_hash,
+            model_size=job.model_size,
+            requested_language=job.requested_language,
+            cache_source__isnull=True,
+        )
+        .exclude(pk=job.pk)
+        .order_by('-completed_at')
+        .first()
+    )
+
+
+def clone_job_result(job, source):
+    job.segments.all().delete()
+    if source.segment_file:
+        # Segment files are never modified, the clone can share it
+        job.segment_file.name = source.segment_file.name
+    else:
+        TranscriptSegment.objects.bulk_create(
+            (
+                TranscriptSegment(job=job, index=segment.index, start=segment.start, end=segment.end, text=segment.text)
+                for segment in source.segments.iterator(chunk_size=1000)
+            ),
+            batch_size=1000,
+        )
+    job.cache_source = source
+    job.cpu_seconds_saved = source.cpu_seconds or 0
+    complete_job(job, {'language': source.language, 'text': source.transcript_text})
+
+
+def probe_duration(file_path):
+    try:
+        return get_media_duration(file_path)
+    except Exception:
+        logger.warning("Could not read duration of %s", file_path, exc_info=True)
+        return None
+
+
+def is_long_audio(duration):
+    threshold = getattr(settings, 'TRANSCRIPTION_LONG_AUDIO_MIN_SECONDS', 0)
+    return bool(threshold) and duration is not None and duration >= threshold
+
+
+def is_short_clip(duration):
+    threshold = getattr(settings, 'TRANSCRIPTION_BATCH_MAX_SECONDS', 0)
+    return bool(threshold) and duration is not None and duration <= threshold
+
+
+def transcription_priority(duration):
+    """
+    Shortest job first: maps a media duration to a broker priority, 0 (first)
+    for the shortest media. Unknown durations get the middle priority.
+    """
+    bounds = getattr(settings, 'TRANSCRIPTION_PRIORITY_BOUNDS', [])
+    if duration is None:
+        return min(len(bounds) // 2, 9)
+    return min(bisect_left(bounds, duration), 9)
+
+
+def transcription_queue(duration):
+    threshold = getattr(settings, 'TRANSCRIPTION_LONG_QUEUE_MIN_SECONDS', 0)
+    if threshold and duration is not None and duration >= threshold:
+        return 'transcription_long'
+    return 'transcription'
+
+
+def transcription_signature(job, **kwargs):
+    """
+    Returns the `run_transcription` call for `job`, with a queue and priority
+    picked from the media duration so short clips do not wait behind long
+    recordings.
+    """
+    duration = probe_duration(job.file.file.path)
+    return run_transcription.signature(
+        (job.pk,),
+        kwargs,
+        queue=transcription_queue(duration),
+        priority=transcription_priority(duration),
+    )
+
+
+def enqueue_transcription(job, **kwargs):
+    return transcription_signature(job, **kwargs).apply_async()
+
+
+def in_flight_jobs():
+    """
+    Jobs handed to the workers that have not finished yet.
+    """
+    return TranscriptionJob.objects.filter(
+        dispatched_at__isnull=False,
+        status__in=[TranscriptionJob.Status.PENDING, TranscriptionJob.Status.PROCESSING],
+    )
+
+
+def reclaim_stale_jobs():
+    """
+    Puts jobs dispatched more than TRANSCRIPTION_DISPATCH_TIMEOUT_SECONDS ago
+    and still pending or running back in the queue. Their task was lost (the
+    send failed, the worker was killed) and they would hold their submitter's
+    slot forever. Returns how many jobs were reclaimed.
+    """
+    timeout = getattr(settings, 'TRANSCRIPTION_DISPATCH_TIMEOUT_SECONDS', 0)
+    if not timeout:
+        return 0
+    count = in_flight_jobs().filter(dispatched_at__lt=timezone.now() - timedelta(seconds=timeout)).update(
+        dispatched_at=None, status=TranscriptionJob.Status.PENDING, batch_pending=False
+    )
+    if count:
+        logger.warning("Reclaimed %s transcription jobs dispatched more than %ss ago", count, timeout)
+    return count
+
+
+@shared_task
+def dispatch_transcriptions():
+    """
+    Fair-share dispatcher. New jobs wait in the database until their submitter
+    has fewer than TRANSCRIPTION_USER_MAX_IN_FLIGHT jobs queued or running.
+    Free slots (at most TRANSCRIPTION_MAX_IN_FLIGHT overall) are handed out
+    round-robin across users, least busy first, so one large submission
+    cannot starve everyone else. Runs on submission, whenever a job ends and
+    periodically from celery beat, which also reclaims lost jobs.
+    """
+    user_cap = getattr(settings, 'TRANSCRIPTION_USER_MAX_IN_FLIGHT', 4)
+    total_cap = getattr(settings, 'TRANSCRIPTION_MAX_IN_FLIGHT', 0)
+
+    reclaim_stale_jobs()
+    with transaction.atomic():
+        waiting = TranscriptionJob.objects.filter(dispatched_at__isnull=True, status=TranscriptionJob.Status.PENDING)
+        oldest = dict(
+            waiting.values_list('submitted_by').annotate(oldest=Min('created_at')).order_by()
+        )
+        if not oldest:
+            return "No transcription jobs waiting."
+
+        # Lock the submitters so concurrent dispatchers cannot both fill the same free slots
+        list(
+            get_user_model().objects.select_for_update()
+            .filter(pk__in=[user_id for user_id in oldest if user_id is not None])
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        busy = dict(in_flight_jobs().values_list('submitted_by').annotate(count=Count('id')).order_by())
+        free = max(0, total_cap - sum(busy.values())) if total_cap else None
+
+        queues = []
+        for user_id in sorted(oldest, key=lambda user_id: (busy.get(user_id, 0), oldest[user_id])):
+            slots = max(0, user_cap - busy.get(user_id, 0)) if user_cap else free
+            if slots == 0:
+                continue
+            pending = waiting.filter(submitted_by=user_id).order_by('created_at').values_list('pk', flat=True)
+            queues.append(list(pending[:slots] if slots else pending))
+
+        picked = []
+        while queues and free != 0:
+            for queue in list(queues):
+                picked.append(queue.pop(0))
+                if not queue:
+                    queues.remove(queue)
+                if free is not None:
+                    free -= 1
+                    if free == 0:
+                        break
+
+        TranscriptionJob.objects.filter(pk__in=picked).update(dispatched_at=timezone.now())
+    if not picked:
+        return "No free transcription slots."
+
+    # Send the picked jobs as one group, each on its own queue and priority
+    try:
+        group(
+            transcription_signature(job)
+            for job in TranscriptionJob.objects.filter(pk__in=picked).select_related('file')
+        ).apply_async()
+    except Exception:
+        logger.exception("Could not dispatch transcription jobs %s", picked)
+        TranscriptionJob.objects.filter(pk__in=picked).update(dispatched_at=None)
+        raise
+    return f"Dispatched {len(picked)} transcription jobs."
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60, acks_late=True, reject_on_worker_lost=True)
+def run_transcription(self, job_id, allow_batch=True):
     try:
         job = TranscriptionJob.objects.get(id=job_id)
     except TranscriptionJob.DoesNotExist:
         return f"Job {job_id} not found."
 
     job.status = TranscriptionJob.Status.PROCESSING
+    job.model_size = job.model_size or getattr(settings, 'WHISPER_MODEL_SIZE', 'base')
     job.save()
+    publish_job(job)
 
     try:
-        # Initialize Whisper Service
-        # Note: In production, this should probably be a singleton or loaded more efficiently
-        # TODO: Make model size configurable via settings or job parameters
-        service = WhisperService(model_size="base") 
-        
         # Get file path
         file_path = job.file.file.path
-        
-        # Run transcription
-        result = service.transcribe(file_path)
-        
+
+        # Reuse the result of an identical upload if there is one
+        if not job.file.content_hash:
+            job.file.compute_content_hash()
+        source = find_cached_result(job)
+        if source:
+            clone_job_result(job, source)
+            return f"Job {job_id} reused the result of job {source.pk}."
+
+        duration = probe_duration(file_path)
+        if is_long_audio(duration):
+            # Keeps the windows stored by an earlier attempt
+            window_count = dispatch_long_transcription(job)
+            return f"Job {job_id} split into {window_count} windows."
+
+        # A retried or redelivered job continues from its last checkpoint,
+        # otherwise it starts over without segments from a previous attempt
+        checkpoint = job.checkpoint_offset if job.segments.exists() else 0.0
+        if not checkpoint:
+            job.segments.all().delete()
+            job.progress = 0
+            job.checkpoint_offset = 0
+            job.save(update_fields=['progress', 'checkpoint_offset'])
+
+        if allow_batch and is_short_clip(duration):
+            # Short clips are transcribed together by flush_transcription_batch
+            job.status = TranscriptionJob.Status.PENDING
+            job.batch_pending = True
+            job.save()
+            publish_job(job)
+            schedule_batch_flush()
+            return f"Job {job_id} queued for batched transcription."
+
+        if checkpoint:
+            logger.info("Resuming job %s from checkpoint at %.1fs", job_id, checkpoint)
+
+        # Models are cached per worker process, see WhisperModelPool
+        service = WhisperService(model_size=job.model_size)
+        cpu_start = time.process_time()
+        previous = [
+            {'start': segment.start, 'end': segment.end, 'text': segment.text}
+            for segment in job.segments.order_by('index')
+        ]
+        persisted = {'count': len(previous)}
+
+        def persist_segments(batch, progress, language):
+            # Store segments as they are decoded so clients can read partial
+            # transcripts, and checkpoint how far the audio has been decoded
+            with transaction.atomic():
+                save_segments(job, batch, start_index=persisted['count'])
+                TranscriptionJob.objects.filter(pk=job.pk).update(
+                    progress=progress,
+                    checkpoint_offset=batch[-1]['end'],
+                    language=language,
+                )
+            persisted['count'] += len(batch)
+            publish_job(job, progress=progress, language=language)
+
+        # Run transcription on the cached waveform, decoded once per file.
+        # A resumed job keeps the language of the first attempt and is primed
+        # with the last checkpointed text so decoding continues seamlessly.
+        result = service.transcribe(
+            load_audio(job.file),
+            language=job.requested_language or (job.language if checkpoint else None),
+            on_segments=persist_segments,
+            batch_size=getattr(settings, 'TRANSCRIPT_SEGMENT_BATCH_SIZE', 50),
+            clip_start=checkpoint,
+            initial_prompt=" ".join(segment['text'].strip() for segment in previous[-5:]) or None,
+        )
+        if previous:
+            result['segments'] = previous + result['segments']
+            result['text'] = " ".join(segment['text'] for segment in result['segments']).strip()
+
         # Update job
-        job.status = TranscriptionJob.Status.COMPLETED
-        job.language = result.get('language')
-        job.transcript_text = result.get('text', '') # Store plain text
-        job.completed_at = timezone.now()
-        job.save()
-        
+        complete_job(job, result, cpu_seconds=time.process_time() - cpu_start)
+
+        logger.info("Whisper model pool stats: %s", get_model_pool().stats())
+        return f"Job {job_id} completed successfully."
+
+    except Exception as e:
+        # IO and connection errors are retried, resuming from the checkpoint.
+        # The job keeps its slot meanwhile and only fails once retries run out.
+        if isinstance(e, (IOError, ConnectionError, OSError)) and self.request.retries < self.max_retries:
+            logger.warning("Job %s interrupted, retrying: %s", job_id, e)
+            raise self.retry(exc=e)
+
+        fail_job(job, e)
+        return f"Job {job_id} failed: {str(e)}"
+
+
+def dispatch_long_transcription(job):
+    """
+    Cuts the audio at silences into windows and transcribes them in parallel
+    with a Celery chord. Each window stores its segments as soon as it is
+    done, `finalize_long_transcription` only removes the overlap duplicates.
+    Windows stored by an earlier attempt of the job are not transcribed again.
+    """
+    samples = get_audio_cache().load(job.file)
+    duration = len(samples) / long_audio.SAMPLE_RATE
+    windows = long_audio.plan_windows(
+        samples,
+        window_seconds=getattr(settings, 'TRANSCRIPTION_LONG_AUDIO_WINDOW_SECONDS', 600),
+        overlap_seconds=getattr(settings, 'TRANSCRIPTION_LONG_AUDIO_OVERLAP_SECONDS', 1.0),
+        search_seconds=getattr(settings, 'TRANSCRIPTION_LONG_AUDIO_SEARCH_SECONDS', 30),
+    )
+
+    planned = {str(window['index']): [window['owned_start'], window['owned_end']] for window in windows}
+    stored = job.transcribed_windows
+    if not stored or any(planned.get(key) != [w['owned_start'], w['owned_end']] for key, w in stored.items()):
+        # First attempt, or the windows were planned differently: start over
+        job.segments.all().delete()
+        job.transcribed_windows = {}
+        job.progress = 0
+        job.checkpoint_offset = 0
+        job.save(update_fields=['transcribed_windows', 'progress', 'checkpoint_offset'])
+
+    # Windows keep the priority of the whole recording
+    priority = transcription_priority(duration)
+    header = [transcribe_window.s(job.id, window, duration).set(priority=priority) for window in windows]
+    callback = finalize_long_transcription.s(job.id, duration).on_error(
+        long_transcription_failed.s(job.id)
+    )
+    chord(header)(callback)
+    return len(windows)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60, acks_late=True, reject_on_worker_lost=True)
+def transcribe_window(self, job_id, window, duration):
+    """
+    Transcribes one window of a long recording, read from the cached audio,
+    and stores the segments it owns (timestamps shifted to the recording)
+    together with the job's progress and checkpoint. Acknowledged late, so a
+    window lost with its worker is redelivered on its own.
+    """
+    key = str(window['index'])
+    job = TranscriptionJob.objects.select_related('file').get(pk=job_id)
+    if key in job.transcribed_windows:
+        return job.transcribed_windows[key]
+
+    try:
+        audio = load_audio(job.file, window['start'], window['end'])
+        service = WhisperService(model_size=job.model_size or None)
+        cpu_start = time.process_time()
+        result = service.transcribe(audio, language=job.requested_language)
+    except (IOError, ConnectionError, OSError) as e:
+        raise self.retry(exc=e)
+
+    summary = {
+        "owned_start": window['owned_start'],
+        "owned_end": window['owned_end'],
+        "language": result["language"],
+        "language_probability": result["language_probability"],
+        "cpu_seconds": time.process_time() - cpu_start,
+    }
+    with transaction.atomic():
+        # Windows finish in any order, the job row serializes their indexes
+        job = TranscriptionJob.objects.select_for_update().select_related('file').get(pk=job_id)
+        if key in job.transcribed_windows:
+            return job.transcribed_windows[key]
+        last_index = job.segments.aggregate(last=Max('index'))['last']
+        save_segments(
+            job, long_audio.owned_segments(result["segments"], window),
+            start_index=0 if last_index is None else last_index + 1,
+        )
+        job.transcribed_windows[key] = summary
+        job.progress, job.checkpoint_offset = long_audio.window_progress(job.transcribed_windows.values(), duration)
+        if not job.language:
+            job.language = result["language"]
+        job.save(update_fields=['transcribed_windows', 'progress', 'checkpoint_offset', 'language'])
+    publish_job(job)
+    return summary
+
+
+@shared_task
+def finalize_long_transcription(window_summaries, job_id, duration):
+    """
+    Completes a long recording once all its windows are stored. The window
+    summaries are also stored on the job and read from there.
+    """
+    try:
+        job = TranscriptionJob.objects.get(id=job_id)
+    except TranscriptionJob.DoesNotExist:
+        return f"Job {job_id} not found."
+
+    try:
+        windows = list(job.transcribed_windows.values())
+        segments = [
+            {'start': segment.start, 'end': segment.end, 'text': segment.text}
+            for segment in job.segments.order_by('start', 'index')
+        ]
+        result = long_audio.stitch_results(windows, segments, duration)
+        complete_job(job, result, cpu_seconds=sum(w.get('cpu_seconds', 0) for w in windows))
         return f"Job {job_id} completed successfully."
-        
     except Exception as e:
-        job.status = TranscriptionJob.Status.FAILED
-        job.error_message = str(e) + "\n" + traceback.format_exc()
-        job.save()
-        
-        # Retry on certain exceptions (e.g. IO errors, connection errors)
-        # For now, retry on all exceptions except maybe some specific ones
-        if isinstance(e, (IOError, ConnectionError, OSError)):
-             raise self.retry(exc=e)
-             
+        fail_job(job, e)
         return f"Job {job_id} failed: {str(e)}"
 
+
+@shared_task
+def long_transcription_failed(request, exc, tb, job_id):
+    job = TranscriptionJob.objects.filter(id=job_id).first()
+    if job:
+        fail_job(job, exc, tb=str(tb or ''))
+
+
+def schedule_batch_flush():
+    """
+    Flushes the batch right away once it is full, otherwise arms a flush
+    after the maximum wait. Every queued job arms its own: concurrent
+    submissions cannot tell which of them came first, and a flush finding
+    nothing to claim does nothing.
+    """
+    pending = TranscriptionJob.objects.filter(
+        batch_pending=True, status=TranscriptionJob.Status.PENDING
+    ).count()
+    if pending >= getattr(settings, 'TRANSCRIPTION_BATCH_SIZE', 8):
+        flush_transcription_batch.delay()
+    else:
+        flush_transcription_batch.apply_async(
+            countdown=getattr(settings, 'TRANSCRIPTION_BATCH_MAX_WAIT_SECONDS', 5)
+        )
+
+
+@shared_task
+def flush_transcription_batch():
+    """
+    Claims up to TRANSCRIPTION_BATCH_SIZE short clips waiting for batching,
+    transcribes them in one batched pipeline run and stores each result.
+    """
+    with transaction.atomic():
+        jobs = list(
+            TranscriptionJob.objects.select_for_update(skip_locked=True)
+            .filter(batch_pending=True, status=TranscriptionJob.Status.PENDING)
+            .select_related('file')
+            .order_by('created_at')[:getattr(settings, 'TRANSCRIPTION_BATCH_SIZE', 8)]
+        )
+        TranscriptionJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            batch_pending=False, status=TranscriptionJob.Status.PROCESSING
+        )
+        for job in jobs:
+            job.batch_pending = False
+            job.status = TranscriptionJob.Status.PROCESSING
+    if not jobs:
+        return "No batched jobs pending."
+    for job in jobs:
+        publish_job(job)
+
+    try:
+        cpu_start = time.process_time()
+        results = WhisperService().transcribe_batch(
+            [load_audio(job.file) for job in jobs],
+            languages=[job.requested_language for job in jobs],
+            batch_size=getattr(settings, 'TRANSCRIPTION_BATCH_INFERENCE_SIZE', 8),
+        )
+    except Exception:
+        # Fall back to transcribing the clips one by one
+        logger.exception("Batched transcription failed for jobs %s", [job.pk for job in jobs])
+        for job in jobs:
+            enqueue_transcription(job, allow_batch=False)
+        return f"Batch of {len(jobs)} jobs re-queued individually."
+
+    # Split the batch CPU time between the clips by audio duration
+    cpu_seconds = time.process_time() - cpu_start
+    total_duration = sum(result['duration'] for result in results) or 1
+    for job, result in zip(jobs, results):
+        complete_job(job, result, cpu_seconds=cpu_seconds * result['duration'] / total_duration)
+
+    if TranscriptionJob.objects.filter(batch_pending=True, status=TranscriptionJob.Status.PENDING).exists():
+        flush_transcription_batch.apply_async(
+            countdown=getattr(settings, 'TRANSCRIPTION_BATCH_MAX_WAIT_SECONDS', 5)
+        )
+    return f"Batch of {len(jobs)} jobs completed successfully."
+
+
+@shared_task
+def run_language_detection(detection_id):
+    """
+    Detects the spoken language of a file from its first 30 seconds only.
+    """
+    try:
+        detection = LanguageDetection.objects.select_related('file').get(id=detection_id)
+    except LanguageDetection.DoesNotExist:
+        return f"LanguageDetection {detection_id} not found."
+
+    detection.status = TranscriptionJob.Status.PROCESSING
+    detection.save()
+
+    try:
+        samples = get_audio_cache().head(detection.file, seconds=30)
+        result = WhisperService().detect_language(to_float32(samples))
+        detection.status = TranscriptionJob.Status.COMPLETED
+        detection.language = result['language']
+        detection.language_probability = result['language_probability']
+        detection.completed_at = timezone.now()
+        detection.save()
+        return f"LanguageDetection {detection_id} completed successfully."
+    except Exception as e:
+        detection.status = TranscriptionJob.Status.FAILED
+        detection.error_message = str(e) + "\n" + traceback.format_exc()
+        detection.save()
+        return f"LanguageDetection {detection_id} failed: {str(e)}"
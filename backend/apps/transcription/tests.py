@@ -1,3 +1,862 @@
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.db.models.query import QuerySet
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from types import SimpleNamespace
+from unittest import mock
+from apps.analysis.models import AnalysisRequest
+from apps.media.models import File, Folder
+from apps.users.models import User
+from datetime import timedelta
+from .audio_cache import AudioCache, iter_pcm
+from .events import authenticate, publish_analysis, publish_job, stream_events, user_channel
+from .exports import format_timestamp, iter_json, iter_srt, iter_vtt
+from .models import LanguageDetection, TranscriptionJob, TranscriptSegment
+from .serializers import TranscriptionSubmissionSerializer
+from .segment_store import SegmentIndex, pack_segments
+from .services import WhisperModelPool, get_model_pool
+from .tasks import (
+    dispatch_transcriptions, finalize_long_transcription, run_transcription, schedule_batch_flush, transcription_priority,
+    transcription_queue,
+)
+from . import long_audio
+import io
+import json
+import os
+import numpy as np
+import redis
+import shutil
+import tempfile
+import wave
 
-# Create your tests here.
+
+def wav_bytes(seconds, sample_rate=16000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    samples = (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+class FakeWhisperModel:
+    """
+    Decodes one two-second segment at a time from `clip_timestamps`, raising
+    `errors` (one per call, None to succeed) after `crash_after` segments.
+    """
+    duration = 14.0
+    errors = []
+    crash_after = 2
+    calls = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def transcribe(self, audio, **kwargs):
+        type(self).calls.append(kwargs)
+        start = kwargs['clip_timestamps'][0] if kwargs['clip_timestamps'] != "0" else 0.0
+        error = type(self).errors.pop(0) if type(self).errors else None
+
+        def segments():
+            for i in range(int(start // 2), int(self.duration // 2)):
+                if error and i >= int(start // 2) + self.crash_after:
+                    raise error
+                yield SimpleNamespace(start=i * 2.0, end=i * 2.0 + 2, text=f" word{i}")
+        return segments(), SimpleNamespace(language='de', language_probability=0.9, duration=self.duration)
+
+
+class WhisperModelPoolTests(SimpleTestCase):
+    def pool(self, max_memory_mb):
+        return WhisperModelPool(max_memory_mb=max_memory_mb, loader=lambda size, **kwargs: object())
+
+    def test_models_are_loaded_once(self):
+        pool = self.pool(None)
+        model = pool.get('base')
+        self.assertIs(pool.get('base'), model)
+        self.assertIsNot(pool.get('base', compute_type='float32'), model)
+        self.assertEqual((pool.loads, pool.hits), (2, 1))
+
+    def test_least_recently_used_model_is_evicted(self):
+        # int8: tiny about 19 MB, base 36 MB, small 121 MB
+        pool = self.pool(160)
+        base = pool.get('base')
+        pool.get('tiny')
+        pool.get('base')
+        pool.get('small')
+        self.assertEqual(pool.evictions, 1)
+        self.assertEqual([key[0] for key in pool._models], ['base', 'small'])
+        self.assertIs(pool.get('base'), base)
+
+    def test_a_model_larger_than_the_cap_still_loads(self):
+        pool = self.pool(100)
+        pool.get('base')
+        pool.get('large-v3')
+        self.assertEqual([key[0] for key in pool._models], ['large-v3'])
+
+
+class SegmentStoreTests(SimpleTestCase):
+    def index(self, segments):
+        fd, path = tempfile.mkstemp(suffix='.seg')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pack_segments(segments))
+        self.addCleanup(os.unlink, path)
+        return SegmentIndex(path)
+
+    def test_round_trip_and_slicing(self):
+        segments = [{'start': i * 2.0, 'end': i * 2.0 + 2, 'text': f" mot {i} é"} for i in range(10)]
+        index = self.index(segments)
+        self.assertEqual(len(index), 10)
+        self.assertEqual(index[3], {'index': 3, 'start': 6.0, 'end': 8.0, 'text': " mot 3 é"})
+        self.assertEqual(index[-1]['index'], 9)
+        self.assertEqual([segment['index'] for segment in index[2:5]], [2, 3, 4])
+        self.assertEqual([segment['index'] for segment in index.after(7)], [8, 9])
+        with self.assertRaises(IndexError):
+            index[10]
+
+    def test_time_window(self):
+        index = self.index([
+            {'start': 0.0, 'end': 2.5, 'text': 'a'},
+            # Ends before the previous one, the lookup uses the running maximum of the ends
+            {'start': 2.0, 'end': 2.4, 'text': 'b'},
+            {'start': 4.0, 'end': 6.0, 'text': 'c'},
+            {'start': 6.0, 'end': 8.0, 'text': 'd'},
+        ])
+        self.assertEqual([s['text'] for s in index.window(2.3, 4.0)], ['a', 'b'])
+        self.assertEqual([s['text'] for s in index.window(4.5, 5.0)], ['c'])
+        self.assertEqual([s['text'] for s in index.window(5.0, 20.0)], ['c', 'd'])
+        self.assertEqual(len(index.window(8.0, 9.0)), 0)
+
+    def test_empty(self):
+        index = self.index([])
+        self.assertEqual((len(index), list(index), len(index.window(0, 10))), (0, [], 0))
+
+
+class RoutingTests(SimpleTestCase):
+    @override_settings(TRANSCRIPTION_PRIORITY_BOUNDS=[60, 300, 900, 1800])
+    def test_shortest_job_first(self):
+        self.assertEqual(
+            [transcription_priority(duration) for duration in (10, 60, 61, 600, 1000, 7200)],
+            [0, 0, 1, 2, 3, 4],
+        )
+        self.assertEqual(transcription_priority(None), 2)
+
+    @override_settings(TRANSCRIPTION_PRIORITY_BOUNDS=list(range(1, 20)))
+    def test_priority_stays_within_the_broker_range(self):
+        self.assertEqual(transcription_priority(100), 9)
+
+    @override_settings(TRANSCRIPTION_LONG_QUEUE_MIN_SECONDS=1800)
+    def test_long_media_have_their_own_queue(self):
+        self.assertEqual(transcription_queue(600), 'transcription')
+        self.assertEqual(transcription_queue(1800), 'transcription_long')
+        self.assertEqual(transcription_queue(None), 'transcription')
+
+
+class LongAudioTests(SimpleTestCase):
+    def tone_with_pauses(self, seconds, pauses):
+        rate = long_audio.SAMPLE_RATE
+        t = np.arange(int(seconds * rate)) / rate
+        audio = (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+        for start, end in pauses:
+            audio[int(start * rate):int(end * rate)] = 0
+        return audio
+
+    def test_windows_are_cut_at_silences(self):
+        audio = self.tone_with_pauses(25, [(8.0, 8.5), (17.0, 17.5)])
+        windows = long_audio.plan_windows(audio, window_seconds=10, overlap_seconds=1, search_seconds=4)
+        self.assertEqual(len(windows), 3)
+        for cut, pause in zip(windows[1:], (8.0, 17.0)):
+            self.assertTrue(pause <= cut['owned_start'] <= pause + 0.5, cut)
+        # Owned ranges tile the recording, windows add the overlap on both sides
+        self.assertEqual(windows[0]['owned_start'], 0.0)
+        self.assertEqual(windows[-1]['owned_end'], 25.0)
+        for previous, window in zip(windows, windows[1:]):
+            self.assertEqual(previous['owned_end'], window['owned_start'])
+            self.assertAlmostEqual(window['start'], window['owned_start'] - 1)
+        self.assertEqual(windows[-1]['end'], 25.0)
+
+    def test_short_audio_is_one_window(self):
+        windows = long_audio.plan_windows(self.tone_with_pauses(5, []), window_seconds=10, overlap_seconds=1, search_seconds=4)
+        self.assertEqual([(w['start'], w['end']) for w in windows], [(0.0, 5.0)])
+
+    def test_owned_segments(self):
+        window = {'start': 9.0, 'owned_start': 10.0, 'owned_end': 20.0}
+        segments = [
+            {'start': 0.0, 'end': 0.8, 'text': ' before the owned range'},
+            {'start': 1.0, 'end': 4.0, 'text': ' hello again'},
+            {'start': 10.5, 'end': 11.5, 'text': ' in the next window'},
+        ]
+        self.assertEqual(long_audio.owned_segments(segments, window), [{'start': 10.0, 'end': 13.0, 'text': ' hello again'}])
+
+    def test_window_progress(self):
+        def window(owned_start, owned_end):
+            return {'owned_start': owned_start, 'owned_end': owned_end}
+
+        self.assertEqual(long_audio.window_progress([], 40.0), (0.0, 0.0))
+        # The checkpoint stops at the first window not transcribed yet
+        self.assertEqual(long_audio.window_progress([window(10.0, 20.0), window(30.0, 40.0)], 40.0), (50.0, 0.0))
+        self.assertEqual(long_audio.window_progress([window(0.0, 10.0), window(20.0, 30.0)], 40.0), (50.0, 10.0))
+        self.assertEqual(long_audio.window_progress([window(0.0, 10.0), window(10.0, 20.0)], 40.0), (50.0, 20.0))
+
+    def test_stitching(self):
+        windows = [
+            {'owned_start': 10.0, 'owned_end': 20.0, 'language': 'en', 'language_probability': 0.8},
+            {'owned_start': 0.0, 'owned_end': 10.0, 'language': 'en', 'language_probability': 0.9},
+        ]
+        segments = [
+            {'start': 0.0, 'end': 5.0, 'text': ' hello'},
+            {'start': 8.0, 'end': 10.5, 'text': ' hello again'},
+            # Repeats the segment decoded across the boundary by the first window
+            {'start': 10.0, 'end': 13.0, 'text': ' hello again'},
+            {'start': 10.2, 'end': 14.0, 'text': ' overlapping'},
+        ]
+        result = long_audio.stitch_results(windows, segments, 20.0)
+        self.assertEqual(
+            [(s['start'], s['end'], s['text']) for s in result['segments']],
+            [(0.0, 5.0, ' hello'), (8.0, 10.5, ' hello again'), (10.5, 14.0, ' overlapping')],
+        )
+        self.assertEqual(result['text'].split(), ['hello', 'hello', 'again', 'overlapping'])
+        self.assertEqual(result['language'], 'en')
+        self.assertAlmostEqual(result['language_probability'], 0.85)
+        self.assertEqual(result['duration'], 20.0)
+
+
+class TranscriptionTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            AUDIO_CACHE_DIR=f"{media_root}/audio_cache",
+            TRANSCRIPTION_BATCH_MAX_SECONDS=0,
+            TRANSCRIPTION_LONG_AUDIO_MIN_SECONDS=0,
+            TRANSCRIPTION_CACHE_ENABLED=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for target in ('apps.transcription.tasks.publish_job', 'apps.transcription.tasks.dispatch_transcriptions'):
+            patcher = mock.patch(target)
+            setattr(self, target.rsplit('.', 1)[1], patcher.start())
+            self.addCleanup(patcher.stop)
+
+        self.published = []
+        self.publish_job.side_effect = lambda job, **changes: self.published.append(job.status)
+        self.user = User.objects.create_user('alice', password='pw')
+
+    def use_model(self, model_class):
+        """
+        Loads `model_class` instead of faster-whisper models while the test runs.
+        """
+        pool = get_model_pool()
+        pool.clear()
+        self.addCleanup(pool.clear)
+        patcher = mock.patch.object(pool, '_loader', model_class)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_file(self, seconds=3, name='talk.wav'):
+        file_obj = File(name=name, owner=self.user, size=0)
+        file_obj.file.save(name, ContentFile(wav_bytes(seconds)), save=False)
+        file_obj.save()
+        return file_obj
+
+
+class LiveProgressTests(TranscriptionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_model(FakeWhisperModel)
+        FakeWhisperModel.errors = []
+        self.job = TranscriptionJob.objects.create(file=self.create_file(), submitted_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_segments_are_readable_while_the_job_runs(self):
+        polls = []
+
+        def poll(job, **changes):
+            # Called after every stored batch, as a client polling the job would
+            if 'progress' in changes:
+                query = f"?after={polls[-1]['results'][-1]['index']}" if polls else ''
+                polls.append(self.client.get(f'/api/transcription/jobs/{job.pk}/segments/{query}').json())
+        self.publish_job.side_effect = poll
+
+        with override_settings(TRANSCRIPT_SEGMENT_BATCH_SIZE=3):
+            run_transcription.apply(args=(self.job.pk,))
+
+        self.assertEqual([[s['index'] for s in poll['results']] for poll in polls], [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual([poll['status'] for poll in polls], [TranscriptionJob.Status.PROCESSING] * 3)
+        self.assertEqual([poll['progress'] for poll in polls], [42.86, 85.71, 100.0])
+        self.assertEqual(polls[1]['results'][0], {'index': 3, 'start': 6.0, 'end': 8.0, 'text': ' word3'})
+
+
+class AudioCacheTests(TranscriptionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        # Room for two sidecars of two seconds (64000 bytes each)
+        self.cache = AudioCache(self.root, max_bytes=150000)
+
+    def test_files_are_decoded_once(self):
+        file_obj = self.create_file(seconds=2)
+        with mock.patch('apps.transcription.audio_cache.iter_pcm', wraps=iter_pcm) as decode:
+            samples = self.cache.load(file_obj)
+            path = self.cache.path_for(f"file_{file_obj.pk}")
+            os.utime(path, (1, 1))
+            self.assertEqual(len(self.cache.load(file_obj)), 32000)
+        decode.assert_called_once_with(file_obj.file.path)
+        self.assertEqual(os.path.getsize(path), 64000)
+        self.assertGreater(os.path.getmtime(path), 1)
+
+        # Identical content shares a sidecar
+        file_obj.compute_content_hash()
+        self.assertEqual(self.cache.key_for(file_obj), file_obj.content_hash)
+
+        # Read and converted in blocks, like the whole array at once
+        np.testing.assert_array_equal(self.cache.waveform(file_obj, block_seconds=1), samples.astype(np.float32) / 32768)
+        np.testing.assert_array_equal(self.cache.waveform(file_obj, 0.5, 1.25), samples[8000:20000].astype(np.float32) / 32768)
+        self.assertEqual(len(self.cache.waveform(file_obj, 1.5, 10)), 8000)
+
+    def test_least_recently_used_sidecars_are_evicted(self):
+        files = [self.create_file(seconds=2, name=f"{i}.wav") for i in range(3)]
+        for mtime, file_obj in enumerate(files[:2], start=1):
+            self.cache.load(file_obj)
+            os.utime(self.cache.path_for(self.cache.key_for(file_obj)), (mtime, mtime))
+        # Reading the first one again makes the second the least recently used
+        self.cache.load(files[0])
+        self.cache.load(files[2])
+        cached = [os.path.exists(self.cache.path_for(self.cache.key_for(file_obj))) for file_obj in files]
+        self.assertEqual(cached, [True, False, True])
+
+    def test_head(self):
+        file_obj = self.create_file(seconds=2)
+        # Decodes only the beginning when the file is not cached
+        self.assertEqual(len(self.cache.head(file_obj, seconds=0.5)), 8000)
+        self.assertFalse(os.path.exists(self.cache.path_for(self.cache.key_for(file_obj))))
+        samples = self.cache.load(file_obj)
+        np.testing.assert_array_equal(self.cache.head(file_obj, seconds=0.5), samples[:8000])
+
+
+class CheckpointResumeTests(TranscriptionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_model(FakeWhisperModel)
+        FakeWhisperModel.calls = []
+        self.job = TranscriptionJob.objects.create(file=self.create_file(), submitted_by=self.user)
+
+    def run_job(self):
+        with override_settings(TRANSCRIPT_SEGMENT_BATCH_SIZE=2):
+            run_transcription.apply(args=(self.job.pk,))
+        self.job.refresh_from_db()
+
+    def test_retry_resumes_from_the_checkpoint(self):
+        FakeWhisperModel.errors = [OSError("worker lost")]
+        self.run_job()
+
+        self.assertEqual(self.job.status, TranscriptionJob.Status.COMPLETED)
+        self.assertNotIn(TranscriptionJob.Status.FAILED, self.published)
+        # The retry started at the last checkpointed segment, primed with its text
+        self.assertEqual(FakeWhisperModel.calls[1]['clip_timestamps'], [4.0])
+        self.assertEqual(FakeWhisperModel.calls[1]['language'], 'de')
+        self.assertEqual(FakeWhisperModel.calls[1]['initial_prompt'], "word0 word1")
+        segments = self.job.get_segment_index()
+        self.assertEqual([segment['start'] for segment in segments], [0.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0])
+        self.assertEqual(self.job.transcript_text.split(), [f"word{i}" for i in range(7)])
+        # The slot was only handed on once, when the job completed
+        self.assertEqual(self.dispatch_transcriptions.delay.call_count, 1)
+
+    def test_fails_once_retries_are_exhausted(self):
+        FakeWhisperModel.errors = [OSError("disk error")] * (run_transcription.max_retries + 1)
+        FakeWhisperModel.crash_after = 0
+        self.addCleanup(setattr, FakeWhisperModel, 'crash_after', 2)
+        self.run_job()
+
+        self.assertEqual(self.job.status, TranscriptionJob.Status.FAILED)
+        self.assertEqual(len(FakeWhisperModel.calls), run_transcription.max_retries + 1)
+        self.assertEqual(self.published.count(TranscriptionJob.Status.FAILED), 1)
+        self.assertEqual(self.dispatch_transcriptions.delay.call_count, 1)
+
+    def test_other_errors_fail_without_retrying(self):
+        FakeWhisperModel.errors = [ValueError("bad audio")]
+        self.run_job()
+
+        self.assertEqual(self.job.status, TranscriptionJob.Status.FAILED)
+        self.assertEqual(len(FakeWhisperModel.calls), 1)
+        self.assertIn("bad audio", self.job.error_message)
+
+
+class ResultCacheTests(TranscriptionTestCase):
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(TRANSCRIPTION_CACHE_ENABLED=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.use_model(FakeWhisperModel)
+        FakeWhisperModel.errors = []
+        FakeWhisperModel.calls = []
+        self.source = self.run_job(self.create_file(name='first.wav'))
+
+    def run_job(self, file_obj, language=None):
+        job = TranscriptionJob.objects.create(
+            file=file_obj, submitted_by=self.user, language=language, requested_language=language
+        )
+        run_transcription.apply(args=(job.pk,))
+        job.refresh_from_db()
+        return job
+
+    def test_identical_content_reuses_the_result(self):
+        self.assertIsNone(self.source.cache_source)
+        job = self.run_job(self.create_file(name='copy.wav'))
+
+        self.assertEqual(len(FakeWhisperModel.calls), 1)
+        self.assertEqual(job.status, TranscriptionJob.Status.COMPLETED)
+        self.assertEqual(job.cache_source, self.source)
+        self.assertEqual(job.cpu_seconds_saved, self.source.cpu_seconds)
+        self.assertEqual(job.segment_file.name, self.source.segment_file.name)
+        self.assertEqual(job.transcript_text, self.source.transcript_text)
+        self.assertEqual(job.language, self.source.language)
+        # A reused result is not a source itself, the original is found again
+        self.assertEqual(self.run_job(self.create_file(name='third.wav')).cache_source, self.source)
+
+    def test_other_language_or_content_misses_the_cache(self):
+        job = self.run_job(self.create_file(name='copy.wav'), language='fr')
+        self.assertIsNone(job.cache_source)
+        self.assertEqual(FakeWhisperModel.calls[-1]['language'], 'fr')
+
+        job = self.run_job(self.create_file(seconds=4, name='other.wav'))
+        self.assertIsNone(job.cache_source)
+        self.assertEqual(len(FakeWhisperModel.calls), 3)
+
+
+class WindowWhisperModel:
+    """
+    Decodes a two-second segment every two seconds of the audio it is given.
+    """
+    calls = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def transcribe(self, audio, **kwargs):
+        type(self).calls.append(len(audio))
+        duration = len(audio) / 16000
+        segments = [
+            SimpleNamespace(start=start, end=min(start + 2.0, duration), text=f" at {start:g}")
+            for start in np.arange(0.0, duration, 2.0)
+        ]
+        return iter(segments), SimpleNamespace(language='en', language_probability=0.9, duration=duration)
+
+
+class LongRecordingTests(TranscriptionTestCase):
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(
+            TRANSCRIPTION_LONG_AUDIO_MIN_SECONDS=10,
+            TRANSCRIPTION_LONG_AUDIO_WINDOW_SECONDS=6,
+            TRANSCRIPTION_LONG_AUDIO_OVERLAP_SECONDS=1.0,
+            TRANSCRIPTION_LONG_AUDIO_SEARCH_SECONDS=2,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.use_model(WindowWhisperModel)
+        WindowWhisperModel.calls = []
+        self.job = TranscriptionJob.objects.create(file=self.create_file(15), submitted_by=self.user)
+
+    def start(self):
+        with mock.patch('apps.transcription.tasks.chord') as chord:
+            run_transcription.apply(args=(self.job.pk,))
+        self.job.refresh_from_db()
+        return chord.call_args.args[0]
+
+    def test_windows_store_their_segments_as_they_finish(self):
+        header = self.start()
+        windows = [signature.args[1] for signature in header]
+        self.assertGreater(len(windows), 2)
+
+        header[-1].apply()
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, TranscriptionJob.Status.PROCESSING)
+        stored = list(self.job.segments.values_list('start', flat=True))
+        self.assertTrue(stored)
+        self.assertTrue(all(windows[-1]['owned_start'] - 1 <= start < windows[-1]['owned_end'] for start in stored))
+        self.assertAlmostEqual(self.job.progress, (15.0 - windows[-1]['owned_start']) / 15 * 100, places=1)
+        # Nothing is stored from the start of the recording yet
+        self.assertEqual(self.job.checkpoint_offset, 0)
+
+        header[0].apply()
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.checkpoint_offset, windows[0]['owned_end'])
+        for signature in header[1:-1]:
+            signature.apply()
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.progress, self.job.checkpoint_offset), (100.0, 15.0))
+
+        finalize_long_transcription(None, self.job.pk, 15.0)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, TranscriptionJob.Status.COMPLETED)
+        starts = [segment['start'] for segment in self.job.get_segment_index()]
+        self.assertEqual(starts, sorted(starts))
+        self.assertFalse(self.job.segments.exists())
+
+    def test_a_new_attempt_keeps_the_stored_windows(self):
+        header = self.start()
+        header[1].apply()
+        stored = list(self.job.segments.values_list('pk', flat=True))
+
+        # Redelivered run_transcription, e.g. after a worker crash
+        header = self.start()
+        for signature in header:
+            signature.apply()
+        self.assertEqual(len(WindowWhisperModel.calls), len(header))
+        self.assertTrue(set(stored) <= set(self.job.segments.values_list('pk', flat=True)))
+
+
+@mock.patch('apps.transcription.tasks.group')
+class FairShareDispatchTests(TranscriptionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('bob', password='pw')
+        file_obj = self.create_file()
+        self.alice_jobs = [TranscriptionJob.objects.create(file=file_obj, submitted_by=self.user) for _ in range(5)]
+        self.bob_jobs = [TranscriptionJob.objects.create(file=file_obj, submitted_by=self.other)]
+
+    def dispatched(self):
+        return set(TranscriptionJob.objects.filter(dispatched_at__isnull=False).values_list('pk', flat=True))
+
+    def finish(self, job):
+        TranscriptionJob.objects.filter(pk=job.pk).update(status=TranscriptionJob.Status.COMPLETED)
+
+    @override_settings(TRANSCRIPTION_USER_MAX_IN_FLIGHT=2, TRANSCRIPTION_MAX_IN_FLIGHT=0)
+    def test_per_user_cap(self, group):
+        dispatch_transcriptions()
+        self.assertEqual(self.dispatched(), {job.pk for job in self.alice_jobs[:2] + self.bob_jobs})
+        self.assertEqual(len(list(group.call_args.args[0])), 3)
+
+        # Nothing more until one of alice's jobs ends, then her next job goes
+        self.assertEqual(dispatch_transcriptions(), "No free transcription slots.")
+        self.finish(self.alice_jobs[0])
+        dispatch_transcriptions()
+        self.assertIn(self.alice_jobs[2].pk, self.dispatched())
+        self.assertNotIn(self.alice_jobs[3].pk, self.dispatched())
+
+    @override_settings(TRANSCRIPTION_USER_MAX_IN_FLIGHT=0, TRANSCRIPTION_MAX_IN_FLIGHT=2)
+    def test_free_slots_are_shared_across_users(self, group):
+        dispatch_transcriptions()
+        # One slot each rather than both to the user who submitted first
+        self.assertEqual(self.dispatched(), {self.alice_jobs[0].pk, self.bob_jobs[0].pk})
+
+        self.finish(self.bob_jobs[0])
+        dispatch_transcriptions()
+        self.assertEqual(len(self.dispatched()), 3)
+        self.assertIn(self.alice_jobs[1].pk, self.dispatched())
+
+    @override_settings(TRANSCRIPTION_USER_MAX_IN_FLIGHT=2, TRANSCRIPTION_MAX_IN_FLIGHT=0,
+                       TRANSCRIPTION_DISPATCH_TIMEOUT_SECONDS=3600)
+    def test_lost_jobs_are_reclaimed(self, group):
+        dispatch_transcriptions()
+        lost, running = self.alice_jobs[:2]
+        two_hours_ago = timezone.now() - timedelta(hours=2)
+        TranscriptionJob.objects.filter(pk=lost.pk).update(status=TranscriptionJob.Status.PROCESSING, dispatched_at=two_hours_ago)
+        self.assertEqual(dispatch_transcriptions(), "Dispatched 1 transcription jobs.")
+
+        # The lost job took its slot back, as the oldest waiting job of its user
+        lost.refresh_from_db()
+        self.assertEqual(lost.status, TranscriptionJob.Status.PENDING)
+        self.assertGreater(lost.dispatched_at, two_hours_ago)
+        self.assertEqual(self.dispatched(), {lost.pk, running.pk, self.bob_jobs[0].pk})
+        self.assertEqual(dispatch_transcriptions(), "No free transcription slots.")
+
+    @override_settings(TRANSCRIPTION_USER_MAX_IN_FLIGHT=2, TRANSCRIPTION_MAX_IN_FLIGHT=0)
+    def test_send_failure_releases_the_jobs(self, group):
+        group.return_value.apply_async.side_effect = ConnectionError("broker down")
+        with self.assertRaises(ConnectionError):
+            dispatch_transcriptions()
+        self.assertEqual(self.dispatched(), set())
+
+
+class BatchFlushTests(TranscriptionTestCase):
+    def queue_clip(self):
+        TranscriptionJob.objects.create(file=self.create_file(), submitted_by=self.user, batch_pending=True)
+        schedule_batch_flush()
+
+    @override_settings(TRANSCRIPTION_BATCH_SIZE=3, TRANSCRIPTION_BATCH_MAX_WAIT_SECONDS=5)
+    @mock.patch('apps.transcription.tasks.flush_transcription_batch')
+    def test_every_queued_clip_arms_a_flush(self, flush):
+        # As if two submissions committed before either counted the waiting jobs
+        TranscriptionJob.objects.create(file=self.create_file(), submitted_by=self.user, batch_pending=True)
+        self.queue_clip()
+        self.assertEqual(flush.apply_async.call_args_list, [mock.call(countdown=5)])
+        self.queue_clip()
+        flush.delay.assert_called_once_with()
+
+
+class SubmissionLanguageTests(TestCase):
+    def validate(self, language):
+        serializer = TranscriptionSubmissionSerializer(data={'file_id': 1, 'language': language})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.validated_data['language']
+
+    def test_language_codes(self):
+        self.assertEqual(self.validate(' DE '), 'de')
+        self.assertEqual(self.validate('yue'), 'yue')
+        self.assertIsNone(self.validate(''))
+        serializer = TranscriptionSubmissionSerializer(data={'file_id': 1, 'language': 'xx'})
+        self.assertFalse(serializer.is_valid())
+
+
+@mock.patch('apps.transcription.views.run_language_detection')
+class LanguageDetectionViewTests(TranscriptionTestCase):
+    url = '/api/transcription/jobs/detect_language/'
+
+    def setUp(self):
+        super().setUp()
+        self.file = self.create_file()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_get_only_reads_the_result(self, run_language_detection):
+        self.assertEqual(self.client.get(self.url, {'file_id': self.file.pk}).status_code, 404)
+        self.assertFalse(LanguageDetection.objects.exists())
+        run_language_detection.delay.assert_not_called()
+
+        self.assertEqual(self.client.post(self.url, {'file_id': self.file.pk}, format='json').status_code, 202)
+        self.assertEqual(self.client.get(self.url, {'file_id': self.file.pk}).status_code, 202)
+        run_language_detection.delay.assert_called_once()
+
+        LanguageDetection.objects.update(status=TranscriptionJob.Status.COMPLETED, language='de', language_probability=0.9)
+        response = self.client.get(self.url, {'file_id': self.file.pk})
+        self.assertEqual((response.status_code, response.json()['language']), (200, 'de'))
+
+    def test_post_restarts_a_failed_detection_only(self, run_language_detection):
+        self.client.post(self.url, {'file_id': self.file.pk}, format='json')
+        self.client.post(self.url, {'file_id': self.file.pk}, format='json')
+        self.assertEqual(run_language_detection.delay.call_count, 1)
+
+        LanguageDetection.objects.update(status=TranscriptionJob.Status.FAILED, error_message='decode error')
+        self.assertEqual(self.client.get(self.url, {'file_id': self.file.pk}).json()['status'], TranscriptionJob.Status.FAILED)
+        self.assertEqual(self.client.post(self.url, {'file_id': self.file.pk}, format='json').status_code, 202)
+        self.assertEqual(run_language_detection.delay.call_count, 2)
+
+
+class ExportFormatTests(SimpleTestCase):
+    segments = [
+        {'index': 0, 'start': 0.0, 'end': 1.2344, 'text': ' Hello'},
+        {'index': 1, 'start': 3661.5, 'end': 3662.0, 'text': ' a --> b, "grüß"'},
+    ]
+
+    def test_timestamps(self):
+        self.assertEqual(format_timestamp(3661.5, ','), '01:01:01,500')
+        self.assertEqual(format_timestamp(59.9996, '.'), '00:01:00.000')
+        self.assertEqual(format_timestamp(-1.0, '.'), '00:00:00.000')
+        self.assertEqual(format_timestamp(100 * 3600, ','), '100:00:00,000')
+
+    def test_srt(self):
+        self.assertEqual(''.join(iter_srt(self.segments)), (
+            "1\n00:00:00,000 --> 00:00:01,234\nHello\n\n"
+            "2\n01:01:01,500 --> 01:01:02,000\na --> b, \"grüß\"\n\n"
+        ))
+
+    def test_vtt(self):
+        self.assertEqual(''.join(iter_vtt(self.segments)), (
+            "WEBVTT\n\n"
+            "00:00:00.000 --> 00:00:01.234\nHello\n\n"
+            "01:01:01.500 --> 01:01:02.000\na -> b, \"grüß\"\n\n"
+        ))
+
+    def test_json(self):
+        self.assertEqual(json.loads(''.join(iter_json(self.segments))), self.segments)
+        self.assertEqual(''.join(iter_json([])), '[]')
+
+
+class ExportViewTests(TranscriptionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.job = TranscriptionJob.objects.create(file=self.create_file(name='talk "final" é.wav'), submitted_by=self.user)
+        TranscriptSegment.objects.create(job=self.job, index=0, start=0.0, end=1.5, text=' Hello')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_export(self):
+        response = self.client.get(f'/api/transcription/jobs/{self.job.pk}/export/vtt/', HTTP_ACCEPT='text/vtt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/vtt; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=utf-8''talk%20%22final%22%20%C3%A9.vtt")
+        self.assertEqual(b''.join(response.streaming_content).decode(), "WEBVTT\n\n00:00:00.000 --> 00:00:01.500\nHello\n\n")
+
+    def test_errors_are_json_whatever_the_accept_header(self):
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('bob', password='pw'))
+        response = other.get(f'/api/transcription/jobs/{self.job.pk}/export/srt/', HTTP_ACCEPT='application/x-subrip')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('detail', json.loads(response.content))
+
+
+class BulkSubmissionTests(TranscriptionTestCase):
+    url = '/api/transcription/jobs/bulk/'
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('bob', password='pw')
+        self.folder = Folder.objects.create(name='talks', owner=self.user)
+        self.subfolder = Folder.objects.create(name='2024', parent=self.folder, owner=self.user)
+        self.files = [self.create_file(name=f'{i}.wav') for i in range(3)]
+        File.objects.filter(pk=self.files[0].pk).update(folder=self.folder)
+        File.objects.filter(pk__in=[self.files[1].pk, self.files[2].pk]).update(folder=self.subfolder)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch('apps.transcription.views.dispatch_transcriptions')
+        self.dispatch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, data):
+        return self.client.post(self.url, data, format='json')
+
+    def test_validation(self):
+        self.assertEqual(self.submit({}).status_code, 400)
+        self.assertEqual(self.submit({'folder_id': self.folder.pk, 'file_ids': [1]}).status_code, 400)
+        self.assertEqual(self.submit({'file_ids': []}).status_code, 400)
+        self.assertEqual(self.submit({'folder_id': self.folder.pk, 'language': 'xx'}).status_code, 400)
+
+    def test_folder_submission(self):
+        TranscriptionJob.objects.create(file=self.files[2], submitted_by=self.user)
+        response = self.submit({'folder_id': self.folder.pk, 'language': 'de'})
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual([job['file'] for job in data['jobs']], [self.files[0].pk, self.files[1].pk])
+        self.assertEqual({job['language'] for job in data['jobs']}, {'de'})
+        self.assertEqual(data['skipped'], [self.files[2].pk])
+        self.dispatch.delay.assert_called_once_with()
+
+        # Everything already submitted: nothing created, no dispatch
+        response = self.submit({'folder_id': self.folder.pk})
+        self.assertEqual((response.status_code, response.json()['jobs']), (200, []))
+        self.assertEqual(self.submit({'folder_id': self.folder.pk, 'recursive': False}).json()['skipped'], [self.files[0].pk])
+        self.assertEqual(self.dispatch.delay.call_count, 1)
+
+    def test_permissions(self):
+        foreign = File.objects.create(
+            name='secret.wav', owner=self.other, size=0, folder=Folder.objects.create(name='x', owner=self.other)
+        )
+        response = self.submit({'file_ids': [self.files[0].pk, foreign.pk, 999999]})
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual([job['file'] for job in data['jobs']], [self.files[0].pk])
+        self.assertEqual((data['forbidden'], data['missing']), ([foreign.pk], [999999]))
+        self.assertEqual(self.submit({'file_ids': [foreign.pk]}).status_code, 403)
+        self.assertEqual(self.submit({'folder_id': foreign.folder_id}).status_code, 403)
+
+    def test_jobs_dispatched_right_away_are_returned(self):
+        bulk_create = QuerySet.bulk_create
+
+        def create_and_dispatch(queryset, objs, *args, **kwargs):
+            created = bulk_create(queryset, objs, *args, **kwargs)
+            # A dispatcher run picking the new jobs before the response is built
+            TranscriptionJob.objects.update(dispatched_at=timezone.now())
+            return created
+
+        with mock.patch.object(QuerySet, 'bulk_create', create_and_dispatch):
+            response = self.submit({'folder_id': self.folder.pk})
+        self.assertEqual(len(response.json()['jobs']), 3)
+
+
+class FakePubSub:
+    """
+    Delivers the messages of `published` ((channel, data) pairs) on the
+    channels subscribed to, like Redis pub/sub.
+    """
+    def __init__(self, published):
+        self.published = published
+        self.channels = set()
+
+    async def subscribe(self, channel):
+        self.channels.add(channel)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        while self.published:
+            channel, data = self.published.pop(0)
+            if channel in self.channels:
+                return {'type': 'message', 'channel': channel.encode(), 'data': data.encode()}
+        return None
+
+    async def unsubscribe(self):
+        self.channels.clear()
+
+    async def aclose(self):
+        pass
+
+
+class EventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.other = User.objects.create_user('bob', password='pw')
+
+    def test_authentication_is_required(self):
+        self.assertEqual(self.client.get('/api/events/').status_code, 401)
+        self.assertEqual(self.client.get('/api/events/?token=invalid').status_code, 401)
+        self.assertEqual(self.client.get('/api/events/', HTTP_AUTHORIZATION='Bearer invalid').status_code, 401)
+
+    async def test_token_parameter_or_header(self):
+        token = str(AccessToken.for_user(self.user))
+        factory = RequestFactory()
+        self.assertEqual((await authenticate(factory.get('/api/events/', {'token': token}))).pk, self.user.pk)
+        self.assertEqual((await authenticate(factory.get('/api/events/', HTTP_AUTHORIZATION=f'Bearer {token}'))).pk, self.user.pk)
+        self.assertIsNone(await authenticate(factory.get('/api/events/')))
+
+    async def test_stream_only_carries_the_users_channel(self):
+        published = [
+            (user_channel(self.other.pk), json.dumps({'type': 'transcription.job', 'id': 1})),
+            (user_channel(self.user.pk), json.dumps({'type': 'transcription.job', 'id': 2})),
+        ]
+        client = mock.Mock(aclose=mock.AsyncMock())
+        client.pubsub.return_value = FakePubSub(published)
+        with mock.patch('apps.transcription.events.redis.asyncio.Redis.from_url', return_value=client):
+            stream = stream_events(self.user.pk)
+            received = [await anext(stream) for _ in range(3)]
+            await stream.aclose()
+        self.assertEqual(received, [
+            "retry: 5000\n\n",
+            'event: transcription.job\ndata: {"type": "transcription.job", "id": 2}\n\n',
+            ": keepalive\n\n",
+        ])
+        client.aclose.assert_awaited_once()
+
+
+@mock.patch('apps.transcription.events.get_redis')
+class PublishTests(TranscriptionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('bob', password='pw')
+        self.job = TranscriptionJob.objects.create(
+            file=self.create_file(), submitted_by=self.other, status=TranscriptionJob.Status.PROCESSING, progress=12.5
+        )
+
+    def events(self, get_redis):
+        return {channel: json.loads(data) for channel, data in (c.args for c in get_redis.return_value.publish.call_args_list)}
+
+    def test_job_events_go_to_owner_and_submitter(self, get_redis):
+        publish_job(self.job, progress=40.0, language='de')
+        event = {
+            'type': 'transcription.job', 'id': self.job.pk, 'file': self.job.file_id,
+            'status': TranscriptionJob.Status.PROCESSING, 'progress': 40.0, 'language': 'de',
+        }
+        self.assertEqual(self.events(get_redis), {user_channel(self.user.pk): event, user_channel(self.other.pk): event})
+
+    def test_analysis_events_go_to_the_file_owner(self, get_redis):
+        analysis = AnalysisRequest.objects.create(transcription_job=self.job, system_prompt='prompt')
+        publish_analysis(analysis)
+        self.assertEqual(self.events(get_redis), {
+            user_channel(self.user.pk): {
+                'type': 'analysis.request', 'id': analysis.pk, 'transcription_job': self.job.pk,
+                'status': analysis.status,
+            },
+        })
+
+    def test_redis_errors_are_not_raised(self, get_redis):
+        get_redis.return_value.publish.side_effect = redis.ConnectionError("down")
+        publish_job(self.job)
@@ -1,20 +1,36 @@
 from rest_framework import viewsets, permissions, status, mixins
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import TranscriptionJob
-from .serializers import TranscriptionJobSerializer, TranscriptionSubmissionSerializer
-from .tasks import run_transcription
-from apps.media.models import File
-from apps.media.permissions import HasFolderAccess
+from django.utils.http import content_disposition_header
+from .models import TranscriptionJob, LanguageDetection
+from .serializers import (
+    TranscriptionJobSerializer, TranscriptionSubmissionSerializer, BulkTranscriptionSubmissionSerializer,
+    TranscriptSegmentSerializer, LanguageDetectionSerializer, LanguageDetectionRequestSerializer,
+)
+from .tasks import dispatch_transcriptions, run_language_detection
+from .exports import EXPORTERS, EXPORT_CONTENT_TYPES, ExportRenderer
+from .mixins import SparseFieldsViewMixin
+from apps.media.models import File, Folder
+from apps.media.pagination import KeysetPagination
+from apps.media.permissions import HasFolderAccess, FolderAccess
+import os
 
-class TranscriptionJobViewSet(mixins.CreateModelMixin,
+class TranscriptionJobViewSet(SparseFieldsViewMixin,
+                              mixins.CreateModelMixin,
                               mixins.RetrieveModelMixin,
                               mixins.ListModelMixin,
                               viewsets.GenericViewSet):
     queryset = TranscriptionJob.objects.all()
     serializer_class = TranscriptionJobSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    list_exclude = ('transcript_text',)
+    status_fields = ('id', 'status', 'progress')
 
     def get_queryset(self):
         # Users can only see jobs for files they have access to, or just their own jobs?
@@ -23,7 +39,7 @@ class TranscriptionJobViewSet(mixins.CreateModelMixin,
         # Let's assume user wants to see jobs for files they own or have access to.
         # For simplicity and privacy, let's restrict to jobs where the user is the owner of the file.
         user = self.request.user
-        return TranscriptionJob.objects.filter(file__owner=user)
+        return self.sparse_queryset(TranscriptionJob.objects.filter(file__owner=user))
 
     def create(self, request, *args, **kwargs):
         serializer = TranscriptionSubmissionSerializer(data=request.data)
@@ -40,10 +56,189 @@ class TranscriptionJobViewSet(mixins.CreateModelMixin,
         # Create Job
         job = TranscriptionJob.objects.create(
             file=file_obj,
-            language=serializer.validated_data.get('language')
+            submitted_by=request.user,
+            language=serializer.validated_data.get('language'),
+            requested_language=serializer.validated_data.get('language')
         )
         
-        # Trigger Celery Task
-        run_transcription.delay(job.id)
+        # Queue the job behind the user's other jobs, the dispatcher sends it to the workers
+        dispatch_transcriptions.delay()
         
         return Response(TranscriptionJobSerializer(job).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Submits every file of a folder (recursively by default) or a list of
+        file ids. Access is resolved once for all folders involved, and files
+        that already have a pending, running or completed job are skipped.
+        """
+        serializer = BulkTranscriptionSubmissionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        access = FolderAccess(request.user, write=True)
+
+        if 'folder_id' in data:
+            folder = get_object_or_404(Folder, pk=data['folder_id'])
+            if not access.has_folder_access(folder.pk):
+                return Response({"error": "You do not have permission to transcribe this folder."}, status=status.HTTP_403_FORBIDDEN)
+            folder_ids = access.subtree(folder.pk) if data['recursive'] else [folder.pk]
+            files = File.objects.filter(folder_id__in=folder_ids)
+        else:
+            files = File.objects.filter(pk__in=data['file_ids'])
+
+        files = list(files.only('id', 'folder_id', 'owner_id').order_by('id'))
+        allowed = [file_obj.pk for file_obj in files if access.has_file_access(file_obj)]
+        forbidden = sorted({file_obj.pk for file_obj in files} - set(allowed))
+        missing = sorted(set(data.get('file_ids', [])) - {file_obj.pk for file_obj in files})
+        if not allowed and (forbidden or missing):
+            return Response({"error": "You do not have permission to transcribe these files."}, status=status.HTTP_403_FORBIDDEN)
+
+        language = data.get('language')
+        with transaction.atomic():
+            skipped = set(
+                TranscriptionJob.objects.filter(file_id__in=allowed)
+                .exclude(status=TranscriptionJob.Status.FAILED)
+                .values_list('file_id', flat=True)
+            )
+            file_ids = [pk for pk in allowed if pk not in skipped]
+            TranscriptionJob.objects.bulk_create(
+                [
+                    TranscriptionJob(file_id=pk, submitted_by=request.user, language=language, requested_language=language)
+                    for pk in file_ids
+                ],
+                batch_size=500,
+            )
+            # bulk_create does not return primary keys on MySQL. Read the new
+            # jobs back before committing, while no dispatcher can change them:
+            # these files had no job that was not FAILED.
+            job_ids = list(
+                TranscriptionJob.objects.filter(file_id__in=file_ids, submitted_by=request.user)
+                .exclude(status=TranscriptionJob.Status.FAILED)
+                .values_list('pk', flat=True)
+            )
+        jobs = list(TranscriptionJob.objects.filter(pk__in=job_ids).select_related('file').order_by('id'))
+
+        # One dispatcher run sends the jobs to the workers as a single group
+        if file_ids:
+            dispatch_transcriptions.delay()
+
+        return Response({
+            "jobs": TranscriptionJobSerializer(jobs, many=True).data,
+            "skipped": sorted(skipped),
+            "forbidden": forbidden,
+            "missing": missing,
+        }, status=status.HTTP_201_CREATED if file_ids else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], pagination_class=PageNumberPagination)
+    def segments(self, request, pk=None):
+        """
+        Returns the segments stored so far, also while the job is still running.
+        Pass `?after=<index>` to only fetch segments added since the last poll,
+        or `?start=<seconds>&end=<seconds>` for the segments overlapping a time range.
+        """
+        job = self.get_object()
+        try:
+            after = self._number_param('after', cast=int)
+            start = self._number_param('start')
+            end = self._number_param('end')
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        index = job.get_segment_index()
+        if index is not None:
+            # Completed job: binary search in the memory-mapped segment file
+            segments = index
+            if after is not None:
+                segments = segments.after(after)
+            if start is not None or end is not None:
+                segments = segments.window(start or 0.0, end if end is not None else float('inf'))
+        else:
+            segments = job.segments.all()
+            if after is not None:
+                segments = segments.filter(index__gt=after)
+            if end is not None:
+                segments = segments.filter(start__lt=end)
+            if start is not None:
+                segments = segments.filter(end__gt=start)
+
+        page = self.paginate_queryset(segments)
+        if page is not None:
+            serializer = TranscriptSegmentSerializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            response = Response({'results': TranscriptSegmentSerializer(segments, many=True).data})
+        response.data['status'] = job.status
+        response.data['progress'] = job.progress
+        return response
+
+    @action(detail=True, methods=['get'], url_path=r'export/(?P<export_format>srt|vtt|json)',
+            renderer_classes=[JSONRenderer, ExportRenderer])
+    def export(self, request, pk=None, export_format=None):
+        """
+        Streams the transcript as SRT, WebVTT or a JSON list of segments,
+        one segment at a time.
+        """
+        job = self.get_object()
+        index = job.get_segment_index()
+        if index is not None:
+            segments = iter(index)
+        else:
+            segments = (
+                {'index': segment.index, 'start': segment.start, 'end': segment.end, 'text': segment.text}
+                for segment in job.segments.all().iterator(chunk_size=1000)
+            )
+
+        response = StreamingHttpResponse(
+            EXPORTERS[export_format](segments),
+            content_type=EXPORT_CONTENT_TYPES[export_format],
+        )
+        filename = os.path.splitext(os.path.basename(job.file.name))[0] or f"job_{job.pk}"
+        response['Content-Disposition'] = content_disposition_header(True, f"{filename}.{export_format}")
+        return response
+
+    def _number_param(self, name, cast=float):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        try:
+            return cast(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a number.")
+
+    @action(detail=False, methods=['get', 'post'], url_path='detect_language')
+    def detect_language(self, request):
+        """
+        Detects the language of a file from its first 30 seconds.
+        POST with a file_id starts the detection, unless it already ran, and
+        returns 202 (200 with the result if it is known). GET with the same
+        file_id only reads it: 202 while it runs, 200 once it is done or
+        failed, 404 if it was never started.
+        """
+        data = request.data if request.method == 'POST' else request.query_params
+        serializer = LanguageDetectionRequestSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        file_obj = get_object_or_404(File, pk=serializer.validated_data['file_id'])
+        permission = HasFolderAccess()
+        if not permission.has_object_permission(request, self, file_obj):
+            return Response({"error": "You do not have permission to access this file."}, status=status.HTTP_403_FORBIDDEN)
+
+        running = (TranscriptionJob.Status.PENDING, TranscriptionJob.Status.PROCESSING)
+        if request.method == 'GET':
+            detection = LanguageDetection.objects.filter(file=file_obj).first()
+            if detection is None:
+                return Response({"error": "Language detection was not started for this file."}, status=status.HTTP_404_NOT_FOUND)
+            code = status.HTTP_202_ACCEPTED if detection.status in running else status.HTTP_200_OK
+            return Response(LanguageDetectionSerializer(detection).data, status=code)
+
+        detection, created = LanguageDetection.objects.get_or_create(file=file_obj)
+        if detection.status == TranscriptionJob.Status.COMPLETED:
+            return Response(LanguageDetectionSerializer(detection).data)
+
+        if created or detection.status == TranscriptionJob.Status.FAILED:
+            detection.status = TranscriptionJob.Status.PENDING
+            detection.error_message = None
+            detection.save()
+            run_language_detection.delay(detection.id)
+        return Response(LanguageDetectionSerializer(detection).data, status=status.HTTP_202_ACCEPTED)
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import celeryd_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -15,6 +16,25 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+
+@celeryd_init.connect
+def set_queue_concurrency(conf=None, options=None, **kwargs):
+    """
+    Sizes the pool of a worker started for specific queues (-Q) from
+    WORKER_QUEUE_CONCURRENCY, unless -c or CELERY_WORKER_CONCURRENCY is set.
+    """
+    from django.conf import settings
+
+    queues = (options or {}).get('queues')
+    if not queues or options.get('concurrency') or conf.worker_concurrency:
+        return
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    sizes = getattr(settings, 'WORKER_QUEUE_CONCURRENCY', {})
+    concurrency = sum(sizes.get(queue.strip(), 0) for queue in queues)
+    if concurrency:
+        conf.worker_concurrency = concurrency
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
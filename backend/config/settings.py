@@ -141,6 +141,19 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Staging files of chunked uploads. Keep it on the file system of MEDIA_ROOT so
+# completing an upload moves the file instead of copying it.
+CHUNKED_UPLOAD_DIR = os.environ.get('CHUNKED_UPLOAD_DIR', os.path.join(MEDIA_ROOT, 'chunked_uploads'))
+# How files/<id>/stream/ sends media: '' (from Django, os.sendfile under gunicorn),
+# 'x-accel-redirect' (nginx, internal location MEDIA_SENDFILE_PREFIX aliased to MEDIA_ROOT)
+# or 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_SENDFILE_PREFIX = os.environ.get('MEDIA_SENDFILE_PREFIX', '/protected-media/')
+# Same as Django's defaults, but they also hash uploads while receiving them
+FILE_UPLOAD_HANDLERS = [
+    'apps.media.uploads.HashingMemoryFileUploadHandler',
+    'apps.media.uploads.HashingTemporaryFileUploadHandler',
+]
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -163,7 +176,9 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/day',
-        'user': '1000/day'
+        'user': '1000/day',
+        # files/<id>/stream/, see apps.media.throttling
+        'media_stream': '3000/hour',
     }
 }
 
@@ -189,6 +204,101 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    # Unacknowledged (acks_late) tasks are redelivered after this many seconds
+    'visibility_timeout': int(os.environ.get('CELERY_VISIBILITY_TIMEOUT', '43200')),
+    # Task priorities 0 (first) to 9, see TRANSCRIPTION_PRIORITY_BOUNDS
+    'priority_steps': list(range(10)),
+}
+# Each workload has its own queue so quick tasks never wait behind long transcriptions.
+# A worker started without -Q consumes all of them.
+CELERY_TASK_QUEUES = {
+    queue: {} for queue in ('celery', 'media', 'analysis', 'transcription', 'transcription_long')
+}
+CELERY_TASK_ROUTES = {
+    'apps.media.tasks.*': {'queue': 'media'},
+    'apps.analysis.tasks.*': {'queue': 'analysis'},
+    'apps.transcription.tasks.transcribe_window': {'queue': 'transcription_long'},
+    'apps.transcription.tasks.dispatch_transcriptions': {'queue': 'celery'},
+    'apps.transcription.tasks.*': {'queue': 'transcription'},
+}
+# Reserve one task at a time so waiting jobs are picked in priority order
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Pool size of a worker started for specific queues (-Q) without -c, summed over its queues
+WORKER_QUEUE_CONCURRENCY = {
+    'celery': int(os.environ.get('CELERY_CONCURRENCY', '1')),
+    'media': int(os.environ.get('MEDIA_CONCURRENCY', '4')),
+    'analysis': int(os.environ.get('ANALYSIS_CONCURRENCY', '4')),
+    'transcription': int(os.environ.get('TRANSCRIPTION_CONCURRENCY', '2')),
+    'transcription_long': int(os.environ.get('TRANSCRIPTION_LONG_CONCURRENCY', '1')),
+}
+
+# Job status events (Server-Sent Events at /api/events/, Redis pub/sub)
+EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL', CELERY_BROKER_URL)
+EVENTS_KEEPALIVE_SECONDS = int(os.environ.get('EVENTS_KEEPALIVE_SECONDS', '15'))
+
+# Cache of each user's folder permissions in Redis. 0 disables it.
+PERMISSION_CACHE_REDIS_URL = os.environ.get('PERMISSION_CACHE_REDIS_URL', CELERY_BROKER_URL)
+PERMISSION_CACHE_TTL = int(os.environ.get('PERMISSION_CACHE_TTL', '3600'))
+
+# Whisper Configuration
+WHISPER_MODEL_SIZE = os.environ.get('WHISPER_MODEL_SIZE', 'base')
+WHISPER_DEVICE = os.environ.get('WHISPER_DEVICE', 'cpu')
+WHISPER_COMPUTE_TYPE = os.environ.get('WHISPER_COMPUTE_TYPE', 'int8')
+# Models loaded in every worker process at start (comma separated, e.g. "base,small")
+WHISPER_PRELOAD_MODELS = [
+    model.strip()
+    for model in os.environ.get('WHISPER_PRELOAD_MODELS', '').split(',')
+    if model.strip()
+]
+# Estimated memory budget for loaded models per worker process (MB). 0 disables the cap.
+WHISPER_MODEL_POOL_MAX_MB = int(os.environ.get('WHISPER_MODEL_POOL_MAX_MB', '2048'))
+# Number of decoded segments written to the database per batch while a job runs
+TRANSCRIPT_SEGMENT_BATCH_SIZE = int(os.environ.get('TRANSCRIPT_SEGMENT_BATCH_SIZE', '50'))
+# Reuse completed results for identical content (same hash, model and language)
+TRANSCRIPTION_CACHE_ENABLED = os.environ.get('TRANSCRIPTION_CACHE_ENABLED', 'True') == 'True'
+# Recordings at least this long (seconds) are split at silences and transcribed in parallel. 0 disables it.
+TRANSCRIPTION_LONG_AUDIO_MIN_SECONDS = int(os.environ.get('TRANSCRIPTION_LONG_AUDIO_MIN_SECONDS', '1800'))
+TRANSCRIPTION_LONG_AUDIO_WINDOW_SECONDS = int(os.environ.get('TRANSCRIPTION_LONG_AUDIO_WINDOW_SECONDS', '600'))
+TRANSCRIPTION_LONG_AUDIO_OVERLAP_SECONDS = float(os.environ.get('TRANSCRIPTION_LONG_AUDIO_OVERLAP_SECONDS', '1.0'))
+TRANSCRIPTION_LONG_AUDIO_SEARCH_SECONDS = int(os.environ.get('TRANSCRIPTION_LONG_AUDIO_SEARCH_SECONDS', '30'))
+# Clips up to this long (seconds) are transcribed in batches. 0 disables batching.
+TRANSCRIPTION_BATCH_MAX_SECONDS = int(os.environ.get('TRANSCRIPTION_BATCH_MAX_SECONDS', '60'))
+# Maximum number of jobs per batch, and how long the first job waits for others (seconds)
+TRANSCRIPTION_BATCH_SIZE = int(os.environ.get('TRANSCRIPTION_BATCH_SIZE', '8'))
+TRANSCRIPTION_BATCH_MAX_WAIT_SECONDS = float(os.environ.get('TRANSCRIPTION_BATCH_MAX_WAIT_SECONDS', '5'))
+# Number of 30 second chunks decoded together by the batched pipeline
+TRANSCRIPTION_BATCH_INFERENCE_SIZE = int(os.environ.get('TRANSCRIPTION_BATCH_INFERENCE_SIZE', '8'))
+# Fair share: jobs queued or running per user, and overall (0 = no limit). Further jobs wait
+# in the database and are dispatched round-robin across users as slots free up.
+TRANSCRIPTION_USER_MAX_IN_FLIGHT = int(os.environ.get('TRANSCRIPTION_USER_MAX_IN_FLIGHT', '4'))
+TRANSCRIPTION_MAX_IN_FLIGHT = int(os.environ.get('TRANSCRIPTION_MAX_IN_FLIGHT', '0'))
+# Jobs dispatched longer ago than this (seconds) and still pending or running are assumed lost
+# (failed send, killed worker) and dispatched again. Must exceed the queueing time plus the
+# longest transcription, like CELERY_VISIBILITY_TIMEOUT. 0 disables it.
+TRANSCRIPTION_DISPATCH_TIMEOUT_SECONDS = int(
+    os.environ.get('TRANSCRIPTION_DISPATCH_TIMEOUT_SECONDS', CELERY_BROKER_TRANSPORT_OPTIONS['visibility_timeout'])
+)
+# celery beat also runs the dispatcher periodically, so waiting jobs never depend on a submission
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-transcriptions': {
+        'task': 'apps.transcription.tasks.dispatch_transcriptions',
+        'schedule': float(os.environ.get('TRANSCRIPTION_DISPATCH_INTERVAL_SECONDS', '60')),
+    },
+}
+# Shortest job first: upper duration bounds (seconds) of the transcription priorities 0, 1, 2...
+# Longer media gets the next priority, unknown durations the middle one.
+TRANSCRIPTION_PRIORITY_BOUNDS = [
+    int(bound)
+    for bound in os.environ.get('TRANSCRIPTION_PRIORITY_BOUNDS', '60,300,900,1800,3600,7200').split(',')
+    if bound.strip()
+]
+# Media at least this long (seconds) is transcribed on the transcription_long queue
+TRANSCRIPTION_LONG_QUEUE_MIN_SECONDS = int(os.environ.get('TRANSCRIPTION_LONG_QUEUE_MIN_SECONDS', '900'))
+# Decoded 16 kHz mono PCM of each file, must be shared by all workers
+AUDIO_CACHE_DIR = os.environ.get('AUDIO_CACHE_DIR', os.path.join(MEDIA_ROOT, 'audio_cache'))
+# Disk budget of the decoded audio cache (MB). 0 disables eviction.
+AUDIO_CACHE_MAX_MB = int(os.environ.get('AUDIO_CACHE_MAX_MB', '10240'))
 
 # LLM Configuration
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
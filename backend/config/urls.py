@@ -16,6 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from apps.transcription.events import event_stream
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -23,4 +24,5 @@ urlpatterns = [
     path('api/media/', include('apps.media.urls')),
     path('api/transcription/', include('apps.transcription.urls')),
     path('api/analysis/', include('apps.analysis.urls')),
+    path('api/events/', event_stream, name='event-stream'),
 ]
@@ -4,6 +4,7 @@ import transcriptionService from '../../transcription/services/transcriptionServ
 
 const AnalysisPanel = ({ fileId }) => {
     const [analyses, setAnalyses] = useState([]);
+    const [results, setResults] = useState({});
     const [jobs, setJobs] = useState([]);
     const [selectedType, setSelectedType] = useState('SUMMARY');
     const [prompt, setPrompt] = useState('');
@@ -69,6 +70,25 @@ const AnalysisPanel = ({ fileId }) => {
         };
     }, [fileId, loading]); // Add loading dependency to restart polling after new request
 
+    // The list leaves out the results, read each completed one once from its detail
+    useEffect(() => {
+        const missing = analyses.filter(a => a.status === 'COMPLETED' && !(a.id in results));
+        if (missing.length === 0) return;
+        let isMounted = true;
+        Promise.all(missing.map(a => analysisService.getAnalysis(a.id)))
+            .then(details => {
+                if (!isMounted) return;
+                setResults(previous => ({
+                    ...previous,
+                    ...Object.fromEntries(details.map(d => [d.id, d.result_text]))
+                }));
+            })
+            .catch(err => console.error("Failed to fetch analysis results", err));
+        return () => {
+            isMounted = false;
+        };
+    }, [analyses]);
+
     const completedJob = jobs.find(j => j.status === 'COMPLETED');
 
     const handleRequest = async (e) => {
@@ -150,7 +170,7 @@ const AnalysisPanel = ({ fileId }) => {
                         </div>
                         {analysis.status === 'COMPLETED' && (
                             <div className="bg-gray-50 p-3 rounded text-sm text-gray-800 whitespace-pre-wrap">
-                                {analysis.result_text}
+                                {analysis.id in results ? results[analysis.id] : 'Loading...'}
                             </div>
                         )}
                         {analysis.status === 'FAILED' && (
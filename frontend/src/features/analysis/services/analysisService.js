@@ -21,7 +21,10 @@ const getAnalyses = async (jobId) => {
         // It doesn't seem to support filtering by job ID directly in the URL params by default
         // unless we added it.
         // Let's client-side filter for now.
-        const response = await axios.get('/analysis/requests/');
+        // Only the columns the panel renders, results are read from the detail
+        const response = await axios.get('/analysis/requests/', {
+            params: { fields: 'id,transcription_job,type,status,error_message' }
+        });
         return response.data.filter(req => req.transcription_job === parseInt(jobId));
     } catch (error) {
         console.error("Error fetching analyses:", error);
@@ -29,9 +32,20 @@ const getAnalyses = async (jobId) => {
     }
 };
 
+const getAnalysis = async (requestId) => {
+    try {
+        const response = await axios.get(`/analysis/requests/${requestId}/`);
+        return response.data;
+    } catch (error) {
+        console.error("Error fetching analysis:", error);
+        throw error;
+    }
+};
+
 const analysisService = {
     requestAnalysis,
-    getAnalyses
+    getAnalyses,
+    getAnalysis
 };
 
 export default analysisService;
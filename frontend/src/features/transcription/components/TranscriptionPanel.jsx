@@ -5,6 +5,7 @@ const TranscriptionPanel = ({ fileId }) => {
     const [jobs, setJobs] = useState([]);
     const [loading, setLoading] = useState(false);
     const [language, setLanguage] = useState('en');
+    const [transcript, setTranscript] = useState(null);
 
     const fetchJobs = async () => {
         try {
@@ -75,6 +76,21 @@ const TranscriptionPanel = ({ fileId }) => {
     };
 
     const latestJob = jobs.length > 0 ? jobs[jobs.length - 1] : null;
+    const completedJobId = latestJob && latestJob.status === 'COMPLETED' ? latestJob.id : null;
+
+    // The list leaves out the transcript, read it from the job once it is completed
+    useEffect(() => {
+        if (!completedJobId) return;
+        let isMounted = true;
+        transcriptionService.getJobStatus(completedJobId)
+            .then(job => {
+                if (isMounted) setTranscript({ jobId: job.id, text: job.transcript_text });
+            })
+            .catch(err => console.error("Failed to fetch transcript", err));
+        return () => {
+            isMounted = false;
+        };
+    }, [completedJobId]);
 
     return (
         <div className="bg-white shadow rounded-lg p-6 mb-6">
@@ -119,7 +135,7 @@ const TranscriptionPanel = ({ fileId }) => {
                         <div className="mt-4">
                             <h4 className="text-sm font-medium text-gray-700 mb-2">Transcript:</h4>
                             <div className="bg-gray-50 p-4 rounded-md text-sm text-gray-800 whitespace-pre-wrap max-h-96 overflow-y-auto">
-                                {latestJob.transcript_text}
+                                {transcript && transcript.jobId === latestJob.id ? transcript.text : 'Loading...'}
                             </div>
                         </div>
                     )}
@@ -27,7 +27,10 @@ const getJobsByFile = async (fileId) => {
     try {
         // Currently the backend doesn't have a direct filter for jobs by file in the list endpoint
         // but we can filter on the client side or add a filter in the backend.
-        const response = await axios.get('/transcription/jobs/');
+        // Only the columns the panels render, the transcript is read from the job detail
+        const response = await axios.get('/transcription/jobs/', {
+            params: { fields: 'id,file,status,created_at,error_message' }
+        });
         // Client-side filter for now as we didn't implement filter backend
         return response.data.filter(job => job.file === parseInt(fileId));
     } catch (error) {